@@ -1,28 +1,38 @@
 """
 Chinese Family Tree Processing System.
 """
-from utils import (
-    TokenTracker,
-    TokenUsage,
-    load_image,
-    get_image_info,
-    validate_image,
-    encode_image_for_vision_models
-)
+import importlib
 
-from models import (
-    StageModel,
-    ModelManager,
-    ModelFactory,
-    BaseModel,
-    TranscriptionModel,
-    ReviewModel,
-    FinalStageModel
-)
+# Public names and the packages that define them, imported on first access
+# so that importing the package does not load every model and provider SDK
+_EXPORTS = {
+    'TokenTracker': 'utils',
+    'TokenUsage': 'utils',
+    'ImageAsset': 'utils',
+    'load_image': 'utils',
+    'get_image_info': 'utils',
+    'validate_image': 'utils',
+    'encode_image_for_vision_models': 'utils',
+    'StageModel': 'models',
+    'ModelManager': 'models',
+    'ModelFactory': 'models',
+    'BaseModel': 'models',
+    'TranscriptionModel': 'models',
+    'ReviewModel': 'models',
+    'FinalStageModel': 'models'
+}
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name]), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
     'TokenTracker',
     'TokenUsage',
+    'ImageAsset',
     'load_image',
     'get_image_info',
     'validate_image',
@@ -20,7 +20,27 @@ from .config import (
     get_provider_config,
     get_stage_model_config,
     get_model_init_params,
-    get_env_var_name
+    get_env_var_name,
+    get_provider_concurrency_limit,
+    get_max_parallel_calls,
+    get_max_image_dimension,
+    get_image_encoding,
+    get_tiling_settings,
+    get_stream_timeouts,
+    get_retry_settings,
+    get_hedge_settings,
+    get_circuit_breaker_settings,
+    get_consensus_threshold,
+    get_response_cache_settings,
+    get_rate_limits,
+    get_rate_limit_output_estimate
+)
+
+from .pipeline_config import (
+    PipelineConfig,
+    RESULT_TYPES,
+    format_result_key,
+    get_pipeline_config
 )
 
 __all__ = [
@@ -42,5 +62,24 @@ __all__ = [
     'get_provider_config',
     'get_stage_model_config',
     'get_model_init_params',
-    'get_env_var_name'
+    'get_env_var_name',
+    'get_provider_concurrency_limit',
+    'get_max_parallel_calls',
+    'get_max_image_dimension',
+    'get_image_encoding',
+    'get_tiling_settings',
+    'get_stream_timeouts',
+    'get_retry_settings',
+    'get_hedge_settings',
+    'get_circuit_breaker_settings',
+    'get_consensus_threshold',
+    'get_response_cache_settings',
+    'get_rate_limits',
+    'get_rate_limit_output_estimate',
+    
+    # Resolved pipeline configuration
+    'PipelineConfig',
+    'RESULT_TYPES',
+    'format_result_key',
+    'get_pipeline_config'
 ]
@@ -2,7 +2,8 @@
 General configuration settings for the Chinese Family Tree Processing System.
 """
 import os
-from typing import Dict, Any, Optional
+import re
+from typing import Dict, Any, Mapping, Optional, Tuple
 
 # Provider-specific configurations with generic internal key names
 PROVIDER_CONFIGS = {
@@ -14,14 +15,16 @@ PROVIDER_CONFIGS = {
             'chatgpt-4o-latest',     # Vision + Language
             'o1-mini',               # Vision + Language
             'o3-mini'                # Vision + Language
-        ]
+        ],
+        'max_image_dimension': 2048
     },
     'anthropic': {
         'api_key_var': '_api_key_2',
         'models': [
             'claude-3-5-sonnet-20241022',  # Vision + Language
             'claude-3-opus-20240229'       # Vision + Language
-        ]
+        ],
+        'max_image_dimension': 1568
     },
     'google': {
         'api_key_var': '_api_key_3',
@@ -32,7 +35,8 @@ PROVIDER_CONFIGS = {
             'gemini-pro',             # Language only
             'gemini-pro-vision',      # Vision + Language
             'gemini-2.0-flash-thinking-exp'  # Vision + Language
-        ]
+        ],
+        'max_image_dimension': 3072
     },
     'groq': {
         'api_key_var': '_api_key_4',
@@ -42,7 +46,8 @@ PROVIDER_CONFIGS = {
             'mixtral-8x7b-32768',               # Language only
             'llama2-70b-4096',                  # Language only
             'llama-3.3-70b-versatile'           # Language only
-        ]
+        ],
+        'max_image_dimension': 2048
     },
     'openrouter': {
         'api_key_var': '_api_key_5',
@@ -54,16 +59,21 @@ PROVIDER_CONFIGS = {
             '01-ai/yi-vision',                           # Vision + Language
             'mistralai/pixtral-large-2411',              # Vision + Language
             'qwen/qwen-2-vl-72b-instruct'               # Vision + Language
-        ]
+        ],
+        'max_image_dimension': 2048
     },
     'together': {
         'api_key_var': '_api_key_6',
         'models': [
             'meta-llama/Llama-3.3-70B-Instruct-Turbo',  # Language only
-        ]
+        ],
+        'max_image_dimension': 2048
     }
 }
 
+# Formats images can be re-encoded to before upload (Pillow format names)
+IMAGE_FORMATS = ('JPEG', 'WEBP', 'PNG')
+
 # Map provider to their API key environment variable names
 _PROVIDER_API_KEYS = {
     'openai': 'OPENAI_API_KEY',
@@ -74,12 +84,13 @@ _PROVIDER_API_KEYS = {
     'together': 'TOGETHER_API_KEY'
 }
 
-def validate_api_key(provider: str) -> None:
+def validate_api_key(provider: str, env: Optional[Mapping[str, str]] = None) -> None:
     """
     Validate that the API key exists for a provider.
     
     Args:
         provider: Provider name
+        env: Optional mapping of settings to read instead of os.environ
         
     Raises:
         RuntimeError: If API key is missing
@@ -88,7 +99,7 @@ def validate_api_key(provider: str) -> None:
     if not key_var:
         raise ValueError(f"Unknown provider: {provider}")
         
-    api_key = os.getenv(key_var)
+    api_key = (os.environ if env is None else env).get(key_var)
     if not api_key:
         raise RuntimeError(
             f"Missing API key for {provider}. "
@@ -170,13 +181,14 @@ def get_provider_config(provider: str) -> Dict[str, Any]:
         raise ValueError(f"Invalid provider: {provider}")
     return PROVIDER_CONFIGS[provider]
 
-def get_stage_model_config(stage: int, model_num: int) -> Dict[str, Any]:
+def get_stage_model_config(stage: int, model_num: int, env: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
     """
     Get model configuration for a specific stage and model number.
     
     Args:
         stage: Stage number (1-8)
         model_num: Model number (1-3)
+        env: Optional mapping of settings to read instead of os.environ
         
     Returns:
         Dict containing model configuration
@@ -190,25 +202,26 @@ def get_stage_model_config(stage: int, model_num: int) -> Dict[str, Any]:
         raise ValueError(f"Invalid stage number: {stage}")
     if not 1 <= model_num <= 3:
         raise ValueError(f"Invalid model number: {model_num}")
+    getenv = (os.environ if env is None else env).get
     
     # Get provider and model from environment variables
-    env_provider = os.getenv(f'STAGE{stage}_MODEL{model_num}_PROVIDER')
-    env_model = os.getenv(f'STAGE{stage}_MODEL{model_num}_NAME')
+    env_provider = getenv(f'STAGE{stage}_MODEL{model_num}_PROVIDER')
+    env_model = getenv(f'STAGE{stage}_MODEL{model_num}_NAME')
     
     # If no specific configuration, use defaults from environment
     if not env_provider or not env_model:
         if stage <= 4:  # Stages 1-4 use all three models by default
             if model_num == 2:
-                env_provider = os.getenv('DEFAULT_MODEL2_PROVIDER')
-                env_model = os.getenv('DEFAULT_MODEL2_NAME')
+                env_provider = getenv('DEFAULT_MODEL2_PROVIDER')
+                env_model = getenv('DEFAULT_MODEL2_NAME')
             elif model_num == 3:
-                env_provider = os.getenv('DEFAULT_MODEL3_PROVIDER')
-                env_model = os.getenv('DEFAULT_MODEL3_NAME')
+                env_provider = getenv('DEFAULT_MODEL3_PROVIDER')
+                env_model = getenv('DEFAULT_MODEL3_NAME')
         
         # If still no configuration, use the default model
         if not env_provider or not env_model:
-            env_provider = os.getenv('DEFAULT_MODEL_PROVIDER')
-            env_model = os.getenv('DEFAULT_MODEL_NAME')
+            env_provider = getenv('DEFAULT_MODEL_PROVIDER')
+            env_model = getenv('DEFAULT_MODEL_NAME')
     
     # Validate provider
     if not env_provider or env_provider not in PROVIDER_CONFIGS:
@@ -225,7 +238,7 @@ def get_stage_model_config(stage: int, model_num: int) -> Dict[str, Any]:
         )
     
     # Validate API key exists
-    validate_api_key(env_provider)
+    validate_api_key(env_provider, env)
     
     # Validate model capabilities
     validate_model_capability(env_provider, env_model, stage)
@@ -235,10 +248,11 @@ def get_stage_model_config(stage: int, model_num: int) -> Dict[str, Any]:
         'name': env_model
     }
 
-def get_fallback_model_config() -> Dict[str, str]:
-    """Get the fallback model configuration from environment variables."""
-    provider = os.getenv('DEFAULT_FALLBACK_PROVIDER')
-    model = os.getenv('DEFAULT_FALLBACK_MODEL')
+def get_fallback_model_config(env: Optional[Mapping[str, str]] = None) -> Dict[str, str]:
+    """Get the fallback model configuration from environment variables (or env, if given)."""
+    getenv = (os.environ if env is None else env).get
+    provider = getenv('DEFAULT_FALLBACK_PROVIDER')
+    model = getenv('DEFAULT_FALLBACK_MODEL')
     
     if not provider or not model:
         raise RuntimeError(
@@ -256,13 +270,14 @@ def get_fallback_model_config() -> Dict[str, str]:
         'name': model
     }
 
-def get_model_init_params(stage: int, model_num: int) -> Dict[str, Any]:
+def get_model_init_params(stage: int, model_num: int, env: Optional[Mapping[str, str]] = None) -> Dict[str, Any]:
     """
     Get initialization parameters for a specific stage and model number.
     
     Args:
         stage: Stage number (1-8)
         model_num: Model number (1-3)
+        env: Optional mapping of settings to read instead of os.environ
         
     Returns:
         Dict containing model initialization parameters
@@ -271,7 +286,8 @@ def get_model_init_params(stage: int, model_num: int) -> Dict[str, Any]:
         ValueError: If configuration is invalid
         RuntimeError: If required environment variables are missing
     """
-    config = get_stage_model_config(stage, model_num)
+    config = get_stage_model_config(stage, model_num, env)
+    getenv = (os.environ if env is None else env).get
     provider = config['provider']
     name = config['name']
     
@@ -280,9 +296,9 @@ def get_model_init_params(stage: int, model_num: int) -> Dict[str, Any]:
     
     # Get and validate parameters
     try:
-        temperature = float(os.getenv(f'STAGE{stage}_MODEL{model_num}_TEMPERATURE', '0.7'))
-        top_p = float(os.getenv(f'STAGE{stage}_MODEL{model_num}_TOP_P', '0.95'))
-        max_tokens_str = os.getenv(f'STAGE{stage}_MODEL{model_num}_MAX_TOKENS', '0')
+        temperature = float(getenv(f'STAGE{stage}_MODEL{model_num}_TEMPERATURE', '0.7'))
+        top_p = float(getenv(f'STAGE{stage}_MODEL{model_num}_TOP_P', '0.95'))
+        max_tokens_str = getenv(f'STAGE{stage}_MODEL{model_num}_MAX_TOKENS', '0')
         max_tokens = int(max_tokens_str) if max_tokens_str != '0' else None
         
         validate_model_params(temperature, top_p, max_tokens)
@@ -302,6 +318,399 @@ def get_model_init_params(stage: int, model_num: int) -> Dict[str, Any]:
         'max_tokens': max_tokens
     }
 
+def get_provider_concurrency_limit(provider: str, env: Optional[Mapping[str, str]] = None) -> int:
+    """
+    Get the maximum number of in-flight calls allowed for a provider.
+
+    Reads {PROVIDER}_MAX_CONCURRENCY (e.g. GOOGLE_MAX_CONCURRENCY), then
+    PROVIDER_MAX_CONCURRENCY, and defaults to 6.
+
+    Args:
+        provider: Provider name
+        env: Optional mapping of settings to read instead of os.environ
+
+    Returns:
+        Positive concurrency limit
+
+    Raises:
+        ValueError: If the configured limit is not a positive integer
+    """
+    getenv = (os.environ if env is None else env).get
+    value = getenv(f'{provider.upper()}_MAX_CONCURRENCY') or getenv('PROVIDER_MAX_CONCURRENCY', '6')
+    try:
+        limit = int(value)
+    except ValueError as e:
+        raise ValueError(f"Invalid concurrency limit for {provider}: {value}") from e
+    if limit <= 0:
+        raise ValueError(f"Concurrency limit for {provider} must be positive, got {limit}")
+    return limit
+
+def _model_setting_name(provider: str, model_name: str, setting: str) -> str:
+    """Build a per-model setting name, e.g. OPENAI_GPT_4O_RPM for ('openai', 'gpt-4o', 'RPM')."""
+    model_part = re.sub(r'[^A-Z0-9]+', '_', model_name.upper()).strip('_')
+    return f"{provider.upper()}_{model_part}_{setting}"
+
+def get_rate_limits(provider: str, model_name: Optional[str] = None, env: Optional[Mapping[str, str]] = None) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Get the requests-per-minute and tokens-per-minute quota of a model.
+
+    Reads {PROVIDER}_{MODEL}_RPM / _TPM, with the model name upper-cased and
+    runs of other characters replaced by '_' (e.g. OPENAI_GPT_4O_RPM), then
+    {PROVIDER}_RPM / {PROVIDER}_TPM. Unset or 0 means no limit.
+
+    Args:
+        provider: Provider name
+        model_name: Optional model name; if omitted only the provider quota is read
+        env: Optional mapping of settings to read instead of os.environ
+
+    Returns:
+        Tuple of (requests per minute, tokens per minute), each None if unlimited
+
+    Raises:
+        ValueError: If a quota is not a non-negative integer
+    """
+    getenv = (os.environ if env is None else env).get
+    limits = []
+    for setting in ('RPM', 'TPM'):
+        value = getenv(_model_setting_name(provider, model_name, setting)) if model_name else None
+        value = value or getenv(f'{provider.upper()}_{setting}', '0')
+        try:
+            limit = int(value)
+        except ValueError as e:
+            raise ValueError(f"Invalid {setting} quota for {provider} {model_name or ''}: {value}") from e
+        if limit < 0:
+            raise ValueError(f"{setting} quota for {provider} {model_name or ''} must not be negative, got {limit}")
+        limits.append(limit or None)
+    return limits[0], limits[1]
+
+def get_rate_limit_output_estimate(env: Optional[Mapping[str, str]] = None) -> int:
+    """
+    Get the output tokens reserved against a TPM quota for each call.
+
+    Reads RATE_LIMIT_OUTPUT_TOKENS (default 1000). The reservation is
+    corrected to the reported usage once the call completes.
+
+    Raises:
+        ValueError: If the setting is not a positive integer
+    """
+    value = (os.environ if env is None else env).get('RATE_LIMIT_OUTPUT_TOKENS', '1000')
+    try:
+        estimate = int(value)
+    except ValueError as e:
+        raise ValueError(f"Invalid RATE_LIMIT_OUTPUT_TOKENS: {value}") from e
+    if estimate <= 0:
+        raise ValueError(f"RATE_LIMIT_OUTPUT_TOKENS must be positive, got {estimate}")
+    return estimate
+
+def get_max_parallel_calls(env: Optional[Mapping[str, str]] = None) -> int:
+    """
+    Get the size of the worker pool used for parallel model calls.
+
+    Reads MAX_PARALLEL_CALLS and defaults to 6, enough for Stages 1 and 2
+    to run all six transcriptions at once.
+
+    Args:
+        env: Optional mapping of settings to read instead of os.environ
+
+    Returns:
+        Positive number of workers
+
+    Raises:
+        ValueError: If the configured value is not a positive integer
+    """
+    value = (os.environ if env is None else env).get('MAX_PARALLEL_CALLS', '6')
+    try:
+        workers = int(value)
+    except ValueError as e:
+        raise ValueError(f"Invalid MAX_PARALLEL_CALLS: {value}") from e
+    if workers <= 0:
+        raise ValueError(f"MAX_PARALLEL_CALLS must be positive, got {workers}")
+    return workers
+
+def get_max_image_dimension(provider: str, env: Optional[Mapping[str, str]] = None) -> int:
+    """
+    Get the longest image side worth uploading to a provider.
+
+    Reads {PROVIDER}_MAX_IMAGE_DIMENSION (e.g. ANTHROPIC_MAX_IMAGE_DIMENSION),
+    then IMAGE_MAX_DIMENSION, and defaults to the size past which the provider
+    downscales images itself.
+
+    Args:
+        provider: Provider name
+        env: Optional mapping of settings to read instead of os.environ
+
+    Returns:
+        Maximum image side in pixels
+
+    Raises:
+        ValueError: If the configured value is not a positive integer
+    """
+    getenv = (os.environ if env is None else env).get
+    value = getenv(f'{provider.upper()}_MAX_IMAGE_DIMENSION') or getenv('IMAGE_MAX_DIMENSION')
+    if not value:
+        return get_provider_config(provider)['max_image_dimension']
+    try:
+        dimension = int(value)
+    except ValueError as e:
+        raise ValueError(f"Invalid max image dimension for {provider}: {value}") from e
+    if dimension <= 0:
+        raise ValueError(f"Max image dimension for {provider} must be positive, got {dimension}")
+    return dimension
+
+def get_image_encoding(env: Optional[Mapping[str, str]] = None) -> Tuple[str, int]:
+    """
+    Get the format and quality images are re-encoded with before upload.
+
+    Reads IMAGE_FORMAT (JPEG, WEBP or PNG, default JPEG) and IMAGE_QUALITY
+    (1-100, default 85; ignored for PNG).
+
+    Args:
+        env: Optional mapping of settings to read instead of os.environ
+
+    Returns:
+        Tuple of (Pillow format name, quality)
+
+    Raises:
+        ValueError: If the format or quality is invalid
+    """
+    getenv = (os.environ if env is None else env).get
+    image_format = getenv('IMAGE_FORMAT', 'JPEG').upper()
+    if image_format == 'JPG':
+        image_format = 'JPEG'
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Invalid IMAGE_FORMAT: {image_format}. Must be one of {', '.join(IMAGE_FORMATS)}")
+    value = getenv('IMAGE_QUALITY', '85')
+    try:
+        quality = int(value)
+    except ValueError as e:
+        raise ValueError(f"Invalid IMAGE_QUALITY: {value}") from e
+    if not 1 <= quality <= 100:
+        raise ValueError(f"IMAGE_QUALITY must be between 1 and 100, got {quality}")
+    return image_format, quality
+
+def get_tiling_settings(env: Optional[Mapping[str, str]] = None) -> Tuple[int, float, float]:
+    """
+    Get how wide scans are split into tiles for transcription.
+
+    Reads IMAGE_TILE_MAX (most tiles per image, default 6), IMAGE_TILE_OVERLAP
+    (fraction of a tile's width shared with each neighbour, default 0.1) and
+    IMAGE_TILE_MIN_ASPECT (width/height ratio from which an image is tiled,
+    default 1.5).
+
+    Args:
+        env: Optional mapping of settings to read instead of os.environ
+
+    Returns:
+        Tuple of (max tiles, overlap, min aspect ratio)
+
+    Raises:
+        ValueError: If a setting is invalid
+    """
+    getenv = (os.environ if env is None else env).get
+    try:
+        max_tiles = int(getenv('IMAGE_TILE_MAX', '6'))
+        overlap = float(getenv('IMAGE_TILE_OVERLAP', '0.1'))
+        min_aspect = float(getenv('IMAGE_TILE_MIN_ASPECT', '1.5'))
+    except ValueError as e:
+        raise ValueError(f"Invalid image tiling setting: {str(e)}") from e
+    if max_tiles < 2:
+        raise ValueError(f"IMAGE_TILE_MAX must be at least 2, got {max_tiles}")
+    if not 0.0 <= overlap < 0.5:
+        raise ValueError(f"IMAGE_TILE_OVERLAP must be between 0.0 and 0.5, got {overlap}")
+    if min_aspect < 1.0:
+        raise ValueError(f"IMAGE_TILE_MIN_ASPECT must be at least 1.0, got {min_aspect}")
+    return max_tiles, overlap, min_aspect
+
+def get_stream_timeouts(env: Optional[Mapping[str, str]] = None) -> Tuple[float, float]:
+    """
+    Get how long a streaming response may go without producing tokens.
+
+    Reads STREAM_FIRST_TOKEN_TIMEOUT (seconds until the first token, default
+    180, allowing for reasoning models) and STREAM_STALL_TIMEOUT (seconds
+    between later chunks, default 60). A stalled stream is retried like any
+    other transient error (see get_retry_settings).
+
+    Args:
+        env: Optional mapping of settings to read instead of os.environ
+
+    Returns:
+        Tuple of (first token timeout, stall timeout)
+
+    Raises:
+        ValueError: If a setting is invalid
+    """
+    getenv = (os.environ if env is None else env).get
+    try:
+        first_token_timeout = float(getenv('STREAM_FIRST_TOKEN_TIMEOUT', '180'))
+        stall_timeout = float(getenv('STREAM_STALL_TIMEOUT', '60'))
+    except ValueError as e:
+        raise ValueError(f"Invalid streaming setting: {str(e)}") from e
+    if first_token_timeout <= 0 or stall_timeout <= 0:
+        raise ValueError("STREAM_FIRST_TOKEN_TIMEOUT and STREAM_STALL_TIMEOUT must be positive")
+    return first_token_timeout, stall_timeout
+
+def get_retry_settings(env: Optional[Mapping[str, str]] = None) -> Tuple[int, float, float, float]:
+    """
+    Get how failed provider calls are retried before falling back.
+
+    Reads RETRY_MAX_ATTEMPTS (times a call is sent, including the first,
+    default 4), RETRY_BASE_DELAY (backoff of the first retry in seconds,
+    default 1, doubling per retry), RETRY_MAX_DELAY (largest backoff, default
+    30) and RETRY_DEADLINE (seconds after which no retry starts, default 300).
+
+    Args:
+        env: Optional mapping of settings to read instead of os.environ
+
+    Returns:
+        Tuple of (max attempts, base delay, max delay, deadline)
+
+    Raises:
+        ValueError: If a setting is invalid
+    """
+    getenv = (os.environ if env is None else env).get
+    try:
+        max_attempts = int(getenv('RETRY_MAX_ATTEMPTS', '4'))
+        base_delay = float(getenv('RETRY_BASE_DELAY', '1'))
+        max_delay = float(getenv('RETRY_MAX_DELAY', '30'))
+        deadline = float(getenv('RETRY_DEADLINE', '300'))
+    except ValueError as e:
+        raise ValueError(f"Invalid retry setting: {str(e)}") from e
+    if max_attempts < 1:
+        raise ValueError(f"RETRY_MAX_ATTEMPTS must be at least 1, got {max_attempts}")
+    if base_delay < 0 or max_delay < base_delay or deadline < 0:
+        raise ValueError("RETRY_BASE_DELAY, RETRY_MAX_DELAY and RETRY_DEADLINE must satisfy 0 <= base <= max and deadline >= 0")
+    return max_attempts, base_delay, max_delay, deadline
+
+def get_hedge_settings(env: Optional[Mapping[str, str]] = None) -> Tuple[float, int, Tuple[int, ...], str]:
+    """
+    Get when slow provider calls are hedged with a duplicate request.
+
+    Reads HEDGE_PERCENTILE (percentile of a model's recent latencies after
+    which a call is hedged, default 95), HEDGE_MIN_SAMPLES (calls a model must
+    have made in a stage before its calls are hedged, default 10), HEDGE_STAGES
+    (comma-separated stages whose calls may be hedged, default 1,2,3,4) and
+    HEDGE_TARGET ('same' to send the duplicate to the same model, 'fallback'
+    to send it to the fallback model; default same).
+
+    Args:
+        env: Optional mapping of settings to read instead of os.environ
+
+    Returns:
+        Tuple of (percentile, min samples, stages, target)
+
+    Raises:
+        ValueError: If a setting is invalid
+    """
+    getenv = (os.environ if env is None else env).get
+    try:
+        percentile = float(getenv('HEDGE_PERCENTILE', '95'))
+        min_samples = int(getenv('HEDGE_MIN_SAMPLES', '10'))
+        stages = tuple(int(stage) for stage in getenv('HEDGE_STAGES', '1,2,3,4').split(',') if stage.strip())
+    except ValueError as e:
+        raise ValueError(f"Invalid hedging setting: {str(e)}") from e
+    target = getenv('HEDGE_TARGET', 'same').lower()
+    if not 0 < percentile <= 100:
+        raise ValueError(f"HEDGE_PERCENTILE must be between 0 and 100, got {percentile}")
+    if min_samples < 1:
+        raise ValueError(f"HEDGE_MIN_SAMPLES must be at least 1, got {min_samples}")
+    if any(stage not in range(1, 9) for stage in stages):
+        raise ValueError(f"HEDGE_STAGES must list stages 1-8, got {getenv('HEDGE_STAGES')}")
+    if target not in ('same', 'fallback'):
+        raise ValueError(f"HEDGE_TARGET must be 'same' or 'fallback', got {target}")
+    return percentile, min_samples, stages, target
+
+def get_circuit_breaker_settings(env: Optional[Mapping[str, str]] = None) -> Tuple[int, int, float, Optional[float], float, int]:
+    """
+    Get when a model's circuit breaker opens and how it recovers.
+
+    Reads CIRCUIT_BREAKER_WINDOW (recent requests considered, default 20),
+    CIRCUIT_BREAKER_MIN_CALLS (requests needed before the breaker may open,
+    default 5), CIRCUIT_BREAKER_ERROR_RATE (fraction of failed requests that
+    opens it, default 0.5), CIRCUIT_BREAKER_SLOW_CALL_SECONDS (latency, or
+    time to first token when streaming, above which a request counts as
+    failed; default 0, off), CIRCUIT_BREAKER_COOLDOWN (seconds open before
+    probing, default 30) and CIRCUIT_BREAKER_HALF_OPEN_PROBES (probe requests
+    at once, default 1).
+
+    Args:
+        env: Optional mapping of settings to read instead of os.environ
+
+    Returns:
+        Tuple of (window, min calls, error rate, slow call seconds or None,
+        cooldown, half-open probes)
+
+    Raises:
+        ValueError: If a setting is invalid
+    """
+    getenv = (os.environ if env is None else env).get
+    try:
+        window = int(getenv('CIRCUIT_BREAKER_WINDOW', '20'))
+        min_calls = int(getenv('CIRCUIT_BREAKER_MIN_CALLS', '5'))
+        error_rate = float(getenv('CIRCUIT_BREAKER_ERROR_RATE', '0.5'))
+        slow_call_seconds = float(getenv('CIRCUIT_BREAKER_SLOW_CALL_SECONDS', '0'))
+        cooldown = float(getenv('CIRCUIT_BREAKER_COOLDOWN', '30'))
+        half_open_probes = int(getenv('CIRCUIT_BREAKER_HALF_OPEN_PROBES', '1'))
+    except ValueError as e:
+        raise ValueError(f"Invalid circuit breaker setting: {str(e)}") from e
+    if window < 1 or not 1 <= min_calls <= window:
+        raise ValueError("CIRCUIT_BREAKER_MIN_CALLS must be between 1 and CIRCUIT_BREAKER_WINDOW")
+    if not 0 < error_rate <= 1:
+        raise ValueError(f"CIRCUIT_BREAKER_ERROR_RATE must be between 0 and 1, got {error_rate}")
+    if slow_call_seconds < 0 or cooldown < 0:
+        raise ValueError("CIRCUIT_BREAKER_SLOW_CALL_SECONDS and CIRCUIT_BREAKER_COOLDOWN must not be negative")
+    if half_open_probes < 1:
+        raise ValueError(f"CIRCUIT_BREAKER_HALF_OPEN_PROBES must be at least 1, got {half_open_probes}")
+    return window, min_calls, error_rate, slow_call_seconds or None, cooldown, half_open_probes
+
+def get_consensus_threshold(env: Optional[Mapping[str, str]] = None) -> float:
+    """
+    Get the agreement from which the review stages are skipped.
+
+    Reads CONSENSUS_THRESHOLD (default 0.8): the share of the Stage 1-2
+    transcriptions that must agree on every aligned character. With local
+    consensus enabled, a consensus this strong at its weakest position goes
+    straight to Stage 5. It must be above one half, so a tied position is
+    never settled without a review.
+
+    Raises:
+        ValueError: If the setting is not a number above 0.5 and at most 1
+    """
+    value = (os.environ if env is None else env).get('CONSENSUS_THRESHOLD', '0.8')
+    try:
+        threshold = float(value)
+    except ValueError as e:
+        raise ValueError(f"Invalid CONSENSUS_THRESHOLD: {value}") from e
+    if not 0.5 < threshold <= 1.0:
+        raise ValueError(f"CONSENSUS_THRESHOLD must be above 0.5 and at most 1, got {threshold}")
+    return threshold
+
+def get_response_cache_settings(env: Optional[Mapping[str, str]] = None) -> Tuple[str, int]:
+    """
+    Get where provider responses are cached and how much may be stored.
+
+    Reads RESPONSE_CACHE_DIR (default <project root>/.cache/responses) and
+    RESPONSE_CACHE_MAX_MB (default 512).
+
+    Returns:
+        Tuple of (cache directory, size cap in bytes)
+
+    Raises:
+        ValueError: If the size cap is not a positive number
+    """
+    getenv = (os.environ if env is None else env).get
+    cache_dir = getenv('RESPONSE_CACHE_DIR') or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+        '.cache', 'responses'
+    )
+    value = getenv('RESPONSE_CACHE_MAX_MB', '512')
+    try:
+        max_mb = float(value)
+    except ValueError as e:
+        raise ValueError(f"Invalid RESPONSE_CACHE_MAX_MB: {value}") from e
+    if not max_mb > 0:
+        raise ValueError(f"RESPONSE_CACHE_MAX_MB must be positive, got {value}")
+    return cache_dir, int(max_mb * 1024 * 1024)
+
 def get_env_var_name(provider: str) -> str:
     """
     Get the environment variable name for a provider's API key.
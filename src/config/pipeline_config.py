@@ -0,0 +1,353 @@
+"""
+Resolved, immutable pipeline configuration.
+
+The environment (or a config file) is read and validated once into a frozen
+PipelineConfig that is passed explicitly to ModelManager and StageModel, so
+per-call lookups are plain dict accesses and several jobs in one process can
+run with different configurations.
+"""
+import os
+import threading
+from dataclasses import dataclass, field, replace
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from .config import (
+    PROVIDER_CONFIGS,
+    get_model_init_params,
+    get_fallback_model_config,
+    get_env_var_name,
+    get_provider_concurrency_limit,
+    get_max_parallel_calls,
+    get_max_image_dimension,
+    get_image_encoding,
+    get_tiling_settings,
+    get_stream_timeouts,
+    get_retry_settings,
+    get_hedge_settings,
+    get_circuit_breaker_settings,
+    get_consensus_threshold,
+    get_response_cache_settings,
+    get_rate_limits,
+    get_rate_limit_output_estimate
+)
+
+# Number of models run by each stage
+STAGE_MODEL_COUNTS = {1: 3, 2: 3, 3: 3, 4: 3, 5: 1, 6: 1, 7: 1, 8: 1}
+
+# Label appended to each stage's result keys
+RESULT_TYPES = {
+    1: "Transcription",
+    2: "Transcription",
+    3: "Review",
+    4: "Review",
+    5: "Final Transcription",
+    6: "Punctuated Transcription",
+    7: "Translation",
+    8: "Commentary"
+}
+
+def format_result_key(stage: int, model_num: int, provider: str, model_name: str) -> str:
+    """Build the key a stage's result is stored under, e.g. 'Stage 1 Model 2 - Openai gpt-4-turbo Transcription'."""
+    return f"Stage {stage} Model {model_num} - {provider.title()} {model_name} {RESULT_TYPES[stage]}"
+
+def _is_true(env: Mapping[str, str], name: str, default: str = 'true') -> bool:
+    """Read a boolean setting."""
+    return env.get(name, default).lower() == 'true'
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    """
+    Every setting a pipeline run needs, resolved and validated up front.
+
+    Attributes:
+        models: Model init params keyed by (stage, model_num)
+        result_keys: Result key of each (stage, model_num) for its configured model
+        fallback: Fallback provider/model, or None if not configured
+        fallback_error: Why the fallback is unavailable, if it is None
+        api_keys: API key of each provider that has one set
+        max_parallel_calls: Worker pool size for model calls
+        provider_concurrency: In-flight call cap of each provider
+        rate_limits: (requests, tokens) per minute quota of each configured
+            (provider, model); None entries are unlimited
+        provider_rate_limits: (requests, tokens) per minute quota of each provider,
+            used for models without an entry in rate_limits
+        rate_limit_output_tokens: Output tokens reserved against a TPM quota per call
+        token_tracking: Whether token usage is tracked
+        realtime_display: Whether usage is printed as each call completes
+        save_report: Whether the usage report is saved
+        show_stage_inputs: Whether stage inputs are shown in reports
+        response_cache_enabled: Whether provider responses are cached
+        response_cache_dir: Directory holding the response cache
+        response_cache_max_bytes: Most bytes of responses kept in the cache
+        prompt_caching: Whether requests put fixed prompt text first and mark it for provider caching
+        image_normalization: Whether images are downscaled and re-encoded before upload
+        image_format: Format images are re-encoded to
+        image_quality: Encoder quality for JPEG and WEBP
+        max_image_dimensions: Longest image side sent to each provider
+        image_tiling: Whether wide scans are transcribed as overlapping tiles
+        tile_max_count: Most tiles an image is split into
+        tile_overlap: Fraction of a tile's width shared with each neighbour
+        tile_min_aspect: Width/height ratio from which an image is tiled
+        streaming: Whether provider responses are streamed
+        stream_first_token_timeout: Seconds a stream may wait for its first token
+        stream_stall_timeout: Seconds a stream may go without a chunk once started
+        retry_max_attempts: Times a call is sent to its model, including the first
+        retry_base_delay: Backoff of the first retry in seconds, doubling per retry
+        retry_max_delay: Largest backoff between retries in seconds
+        retry_deadline: Seconds after a call's first attempt beyond which no retry starts
+        hedging: Whether slow calls are hedged with a duplicate request
+        hedge_percentile: Percentile of a model's recent latencies after which a call is hedged
+        hedge_min_samples: Calls a model must have made in a stage before its calls are hedged
+        hedge_stages: Stages whose calls may be hedged
+        hedge_target: 'same' to hedge with the same model, 'fallback' to use the fallback model
+        circuit_breaker: Whether failing models are skipped in favour of the fallback
+        circuit_window: Recent requests a model's circuit breaker considers
+        circuit_min_calls: Requests in the window before a breaker may open
+        circuit_error_rate: Fraction of failed requests that opens a breaker
+        circuit_slow_call_seconds: Latency above which a request counts as failed, or None
+        circuit_cooldown: Seconds an open breaker waits before probing the model
+        circuit_half_open_probes: Probe requests allowed at once while a breaker is half-open
+        circuit_state_file: Optional file sharing open breakers with other processes
+        structured_reviews: Whether Stages 3-5 answer in JSON and pass on only what the next stage needs
+        consensus: Whether a local consensus of the Stage 1-2 transcriptions replaces or narrows the reviews
+        consensus_threshold: Share of the transcriptions that must agree on every
+            position for the consensus to go straight to Stage 5
+    """
+    models: Mapping[Tuple[int, int], Mapping[str, Any]]
+    result_keys: Mapping[Tuple[int, int], str]
+    fallback: Optional[Mapping[str, str]] = None
+    fallback_error: Optional[str] = None
+    api_keys: Mapping[str, str] = field(default_factory=dict, repr=False)
+    max_parallel_calls: int = 6
+    provider_concurrency: Mapping[str, int] = field(default_factory=dict)
+    rate_limits: Mapping[Tuple[str, str], Tuple[Optional[int], Optional[int]]] = field(default_factory=dict)
+    provider_rate_limits: Mapping[str, Tuple[Optional[int], Optional[int]]] = field(default_factory=dict)
+    rate_limit_output_tokens: int = 1000
+    token_tracking: bool = True
+    realtime_display: bool = True
+    save_report: bool = True
+    show_stage_inputs: bool = True
+    response_cache_enabled: bool = True
+    response_cache_dir: Optional[str] = None
+    response_cache_max_bytes: int = 512 * 1024 * 1024
+    prompt_caching: bool = True
+    image_normalization: bool = True
+    image_format: str = 'JPEG'
+    image_quality: int = 85
+    max_image_dimensions: Mapping[str, int] = field(default_factory=dict)
+    image_tiling: bool = False
+    tile_max_count: int = 6
+    tile_overlap: float = 0.1
+    tile_min_aspect: float = 1.5
+    streaming: bool = True
+    stream_first_token_timeout: float = 180.0
+    stream_stall_timeout: float = 60.0
+    retry_max_attempts: int = 4
+    retry_base_delay: float = 1.0
+    retry_max_delay: float = 30.0
+    retry_deadline: float = 300.0
+    hedging: bool = False
+    hedge_percentile: float = 95.0
+    hedge_min_samples: int = 10
+    hedge_stages: Tuple[int, ...] = (1, 2, 3, 4)
+    hedge_target: str = 'same'
+    circuit_breaker: bool = True
+    circuit_window: int = 20
+    circuit_min_calls: int = 5
+    circuit_error_rate: float = 0.5
+    circuit_slow_call_seconds: Optional[float] = None
+    circuit_cooldown: float = 30.0
+    circuit_half_open_probes: int = 1
+    circuit_state_file: Optional[str] = None
+    structured_reviews: bool = False
+    consensus: bool = False
+    consensus_threshold: float = 0.8
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None, env_file: Optional[str] = None) -> 'PipelineConfig':
+        """
+        Resolve a configuration from environment variables.
+
+        Args:
+            env: Optional mapping of settings to read instead of os.environ
+            env_file: Optional .env-format file whose values override env
+
+        Returns:
+            Validated PipelineConfig
+
+        Raises:
+            ValueError: If configuration is invalid
+            RuntimeError: If required settings are missing
+            FileNotFoundError: If env_file does not exist
+        """
+        settings = dict(os.environ if env is None else env)
+        if env_file:
+            if not os.path.exists(env_file):
+                raise FileNotFoundError(f"Config file not found: {env_file}")
+            from dotenv import dotenv_values
+            settings.update({k: v for k, v in dotenv_values(env_file).items() if v is not None})
+
+        models = {}
+        result_keys = {}
+        for stage, count in STAGE_MODEL_COUNTS.items():
+            for model_num in range(1, count + 1):
+                params = get_model_init_params(stage, model_num, settings)
+                models[(stage, model_num)] = MappingProxyType(params)
+                result_keys[(stage, model_num)] = format_result_key(stage, model_num, params['provider'], params['name'])
+
+        try:
+            fallback = MappingProxyType(get_fallback_model_config(settings))
+            fallback_error = None
+        except (ValueError, RuntimeError) as e:
+            fallback = None
+            fallback_error = str(e)
+
+        response_cache_dir, response_cache_max_bytes = get_response_cache_settings(settings)
+        image_format, image_quality = get_image_encoding(settings)
+        tile_max_count, tile_overlap, tile_min_aspect = get_tiling_settings(settings)
+        first_token_timeout, stall_timeout = get_stream_timeouts(settings)
+        retry_max_attempts, retry_base_delay, retry_max_delay, retry_deadline = get_retry_settings(settings)
+        hedge_percentile, hedge_min_samples, hedge_stages, hedge_target = get_hedge_settings(settings)
+        (circuit_window, circuit_min_calls, circuit_error_rate, circuit_slow_call_seconds,
+         circuit_cooldown, circuit_half_open_probes) = get_circuit_breaker_settings(settings)
+        configured_models = {(params['provider'], params['name']) for params in models.values()}
+        if fallback is not None:
+            configured_models.add((fallback['provider'], fallback['name']))
+
+        return cls(
+            models=MappingProxyType(models),
+            result_keys=MappingProxyType(result_keys),
+            fallback=fallback,
+            fallback_error=fallback_error,
+            api_keys=MappingProxyType({
+                provider: settings[get_env_var_name(provider)]
+                for provider in PROVIDER_CONFIGS
+                if settings.get(get_env_var_name(provider))
+            }),
+            max_parallel_calls=get_max_parallel_calls(settings),
+            provider_concurrency=MappingProxyType({
+                provider: get_provider_concurrency_limit(provider, settings)
+                for provider in PROVIDER_CONFIGS
+            }),
+            rate_limits=MappingProxyType({
+                (provider, name): get_rate_limits(provider, name, settings)
+                for provider, name in sorted(configured_models)
+            }),
+            provider_rate_limits=MappingProxyType({
+                provider: get_rate_limits(provider, env=settings)
+                for provider in PROVIDER_CONFIGS
+            }),
+            rate_limit_output_tokens=get_rate_limit_output_estimate(settings),
+            token_tracking=_is_true(settings, 'TOKEN_TRACKING_ENABLED'),
+            realtime_display=_is_true(settings, 'DISPLAY_REALTIME_USAGE'),
+            save_report=_is_true(settings, 'SAVE_USAGE_REPORT'),
+            show_stage_inputs=_is_true(settings, 'SHOW_STAGE_INPUTS'),
+            response_cache_enabled=_is_true(settings, 'RESPONSE_CACHE_ENABLED'),
+            response_cache_dir=response_cache_dir,
+            response_cache_max_bytes=response_cache_max_bytes,
+            prompt_caching=_is_true(settings, 'PROMPT_CACHING_ENABLED'),
+            image_normalization=_is_true(settings, 'IMAGE_NORMALIZATION_ENABLED'),
+            image_format=image_format,
+            image_quality=image_quality,
+            max_image_dimensions=MappingProxyType({
+                provider: get_max_image_dimension(provider, settings)
+                for provider in PROVIDER_CONFIGS
+            }),
+            image_tiling=_is_true(settings, 'IMAGE_TILING_ENABLED', 'false'),
+            tile_max_count=tile_max_count,
+            tile_overlap=tile_overlap,
+            tile_min_aspect=tile_min_aspect,
+            streaming=_is_true(settings, 'STREAMING_ENABLED'),
+            stream_first_token_timeout=first_token_timeout,
+            stream_stall_timeout=stall_timeout,
+            retry_max_attempts=retry_max_attempts,
+            retry_base_delay=retry_base_delay,
+            retry_max_delay=retry_max_delay,
+            retry_deadline=retry_deadline,
+            hedging=_is_true(settings, 'HEDGING_ENABLED', 'false'),
+            hedge_percentile=hedge_percentile,
+            hedge_min_samples=hedge_min_samples,
+            hedge_stages=hedge_stages,
+            hedge_target=hedge_target,
+            circuit_breaker=_is_true(settings, 'CIRCUIT_BREAKER_ENABLED'),
+            circuit_window=circuit_window,
+            circuit_min_calls=circuit_min_calls,
+            circuit_error_rate=circuit_error_rate,
+            circuit_slow_call_seconds=circuit_slow_call_seconds,
+            circuit_cooldown=circuit_cooldown,
+            circuit_half_open_probes=circuit_half_open_probes,
+            circuit_state_file=settings.get('CIRCUIT_BREAKER_STATE_FILE') or None,
+            structured_reviews=_is_true(settings, 'STRUCTURED_REVIEWS_ENABLED', 'false'),
+            consensus=_is_true(settings, 'CONSENSUS_ENABLED', 'false'),
+            consensus_threshold=get_consensus_threshold(settings)
+        )
+
+    def with_overrides(self, **changes: Any) -> 'PipelineConfig':
+        """
+        Copy the configuration with some settings replaced.
+
+        None values are ignored, so optional CLI flags can be passed straight through.
+        """
+        return replace(self, **{name: value for name, value in changes.items() if value is not None})
+
+    def get_model_params(self, stage: int, model_num: int) -> Dict[str, Any]:
+        """
+        Get the init params of a stage's model.
+
+        Raises:
+            ValueError: If the stage or model number is invalid
+        """
+        try:
+            return dict(self.models[(stage, model_num)])
+        except KeyError:
+            raise ValueError(f"Invalid stage/model: Stage {stage} Model {model_num}") from None
+
+    def get_result_key(self, stage: int, model_num: int) -> str:
+        """
+        Get the result key of a stage's configured model.
+
+        Raises:
+            ValueError: If the stage or model number is invalid
+        """
+        try:
+            return self.result_keys[(stage, model_num)]
+        except KeyError:
+            raise ValueError(f"Invalid stage/model: Stage {stage} Model {model_num}") from None
+
+    def get_fallback(self) -> Dict[str, str]:
+        """
+        Get the fallback model configuration.
+
+        Raises:
+            RuntimeError: If no valid fallback model is configured
+        """
+        if self.fallback is None:
+            raise RuntimeError(self.fallback_error or "Missing fallback model configuration")
+        return dict(self.fallback)
+
+    def get_rate_limit(self, provider: str, model_name: str) -> Tuple[Optional[int], Optional[int]]:
+        """Get the (requests, tokens) per minute quota of a model; None entries are unlimited."""
+        limits = self.rate_limits.get((provider, model_name))
+        if limits is None:
+            limits = self.provider_rate_limits.get(provider, (None, None))
+        return limits
+
+    def get_api_key(self, provider: str) -> Optional[str]:
+        """Get a provider's API key, or None if it is not set."""
+        return self.api_keys.get(provider)
+
+_default_config: Optional[PipelineConfig] = None
+_default_lock = threading.Lock()
+
+def get_pipeline_config() -> PipelineConfig:
+    """
+    Get the process default configuration, resolved from os.environ on first use.
+
+    Used by components that are not handed a configuration explicitly.
+    """
+    global _default_config
+    with _default_lock:
+        if _default_config is None:
+            _default_config = PipelineConfig.from_env()
+        return _default_config
@@ -1,6 +1,11 @@
 """
 Centralized configuration for token costs and tracking settings.
 All costs are in USD per 1K tokens.
+
+Models with prompt caching also list 'cache_read' (prompt tokens served from
+the provider's cache) and, where the provider charges for it, 'cache_write'
+(prompt tokens written to the cache). Models without them pay the input rate
+for both.
 """
 import os
 from typing import Dict
@@ -28,11 +33,13 @@ TOKEN_COSTS = {
     },
     'o1-mini': {
         'input': 0.01,
-        'output': 0.03
+        'output': 0.03,
+        'cache_read': 0.005
     },
     'o3-mini': {
         'input': 0.01,
-        'output': 0.03
+        'output': 0.03,
+        'cache_read': 0.005
     },
     'gpt-3.5-turbo': {
         'input': 0.001,
@@ -50,17 +57,21 @@ TOKEN_COSTS = {
     },
     'claude-3-5-sonnet-20241022': {
         'input': 0.003,    # $3 per million input tokens
-        'output': 0.015    # $15 per million output tokens
+        'output': 0.015,   # $15 per million output tokens
+        'cache_read': 0.0003,    # $0.30 per million cached input tokens
+        'cache_write': 0.00375   # $3.75 per million tokens written to the cache
     },
     
     # Google Models
     'gemini-2.0-flash-exp': {
         'input': 0.001,    # $1 per million input tokens
-        'output': 0.002    # $2 per million output tokens
+        'output': 0.002,   # $2 per million output tokens
+        'cache_read': 0.00025    # $0.25 per million cached input tokens
     },
     'gemini-1.5-pro': {
         'input': 0.00125,  # $1.25 per million input tokens
-        'output': 0.005    # $5.00 per million output tokens
+        'output': 0.005,   # $5.00 per million output tokens
+        'cache_read': 0.0003125  # $0.3125 per million cached input tokens
     },
     'gemini-pro-vision': {
         'input': 0.001,    # $1 per million input tokens
@@ -82,13 +93,15 @@ def get_token_cost_rates(model_name: str) -> dict:
     """
     return TOKEN_COSTS.get(model_name.lower(), TOKEN_COSTS['default'])
 
-def calculate_cost(model_name: str, input_tokens: int, output_tokens: int) -> float:
+def calculate_cost(model_name: str, input_tokens: int, output_tokens: int, cache_read_tokens: int = 0, cache_write_tokens: int = 0) -> float:
     """
     Calculate the total cost for a given number of input and output tokens.
     Args:
         model_name: Name of the model used
-        input_tokens: Number of input tokens
+        input_tokens: Number of input tokens, including cached ones
         output_tokens: Number of output tokens
+        cache_read_tokens: Input tokens served from the provider's prompt cache
+        cache_write_tokens: Input tokens written to the provider's prompt cache
     Returns:
         Total cost in USD
     """
@@ -96,7 +109,12 @@ def calculate_cost(model_name: str, input_tokens: int, output_tokens: int) -> fl
         return 0.0
         
     rates = get_token_cost_rates(model_name)
-    input_cost = (input_tokens * rates['input']) / 1000
+    uncached_tokens = max(0, input_tokens - cache_read_tokens - cache_write_tokens)
+    input_cost = (
+        uncached_tokens * rates['input']
+        + cache_read_tokens * rates.get('cache_read', rates['input'])
+        + cache_write_tokens * rates.get('cache_write', rates['input'])
+    ) / 1000
     output_cost = (output_tokens * rates['output']) / 1000
     return input_cost + output_cost
 
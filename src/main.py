@@ -5,81 +5,206 @@ Main entry point for the Chinese Family Tree Processing System.
 import os
 import sys
 import time
+import glob
 import argparse
 from datetime import datetime
+from typing import Dict, List, Optional, TYPE_CHECKING
 from pathlib import Path
-from dotenv import load_dotenv
 
 # Add the src directory to the Python path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
 
-# Load environment variables from .env file
+# Location of the .env file, loaded once arguments have been parsed
 project_root = Path(current_dir).parent
 env_path = project_root / '.env'
 env_example_path = project_root / '.env.example'
 
-if not env_path.exists():
-    print("\n=== Environment Setup Required ===")
-    print("1. Create a .env file in the project root:")
-    print(f"   cp {env_example_path} {env_path}")
-    print("\n2. Configure your environment:")
-    print("   - Copy .env.example to .env")
-    print("   - Follow the provider setup instructions in .env.example")
-    print("   - Add your API keys to the .env file")
-    print("\nSee .env.example for complete configuration details.")
-    sys.exit(1)
+# Image extensions accepted in batch inputs (kept in sync with utils.image_utils)
+from utils.image_utils import SUPPORTED_FORMATS
 
-load_dotenv(env_path)
+if TYPE_CHECKING:
+    from config.pipeline_config import PipelineConfig
+    from utils.concurrency import ProviderLimiter
+    from concurrent.futures import ThreadPoolExecutor
 
-from models import ModelManager
-from utils import TokenTracker, load_image
+# Heavy modules (models, tokenizer, provider SDKs) are imported inside the
+# functions that need them, so --help and argument errors return immediately.
 
-def process_image(image_path: str, token_tracking: bool = None, realtime_display: bool = None, save_report: bool = None) -> float:
+_environment_loaded = False
+
+def load_environment():
+    """Load the project .env file, exiting with setup instructions if it is missing."""
+    global _environment_loaded
+    if _environment_loaded:
+        return
+    if not env_path.exists():
+        print("\n=== Environment Setup Required ===")
+        print("1. Create a .env file in the project root:")
+        print(f"   cp {env_example_path} {env_path}")
+        print("\n2. Configure your environment:")
+        print("   - Copy .env.example to .env")
+        print("   - Follow the provider setup instructions in .env.example")
+        print("   - Add your API keys to the .env file")
+        print("\nSee .env.example for complete configuration details.")
+        sys.exit(1)
+    
+    from dotenv import load_dotenv
+    load_dotenv(env_path)
+    _environment_loaded = True
+
+def create_run_dir(image_path: str) -> str:
+    """
+    Create a unique output directory for one image run.
+    
+    Names combine a microsecond timestamp with the image name, and a numeric
+    suffix is added if the directory still exists, so concurrent runs never
+    share a directory.
+    
+    Args:
+        image_path: Path to the image being processed
+        
+    Returns:
+        str: Path of the newly created directory
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    stem = Path(image_path).stem
+    base = os.path.join(current_dir, "output", f"run_{timestamp}_{stem}")
+    output_dir = base
+    suffix = 1
+    while True:
+        try:
+            os.makedirs(output_dir)
+            return output_dir
+        except FileExistsError:
+            output_dir = f"{base}_{suffix}"
+            suffix += 1
+
+def sanitize_error(error_str: str) -> str:
+    """Remove home paths and API keys from an error message."""
+    sanitized_error = error_str.replace(os.path.expanduser("~"), "HOME")
+    for key in os.environ:
+        if ("API" in key or "KEY" in key) and os.environ[key]:
+            sanitized_error = sanitized_error.replace(os.environ[key], "[REDACTED]")
+    return sanitized_error
+
+def resolve_config(config: Optional['PipelineConfig'] = None, token_tracking: bool = None,
+                   realtime_display: bool = None, save_report: bool = None) -> 'PipelineConfig':
+    """Get the run configuration with any provided token tracking overrides applied."""
+    if config is None:
+        load_environment()
+        from config.pipeline_config import get_pipeline_config
+        config = get_pipeline_config()
+    return config.with_overrides(
+        token_tracking=token_tracking,
+        realtime_display=realtime_display,
+        save_report=save_report
+    )
+
+def collect_image_paths(inputs: List[str], manifest: Optional[str] = None) -> List[str]:
+    """
+    Expand image files, directories, glob patterns and a manifest into image paths.
+    
+    Args:
+        inputs: Image files, directories or glob patterns
+        manifest: Optional file listing one image path per line ('#' starts a comment)
+        
+    Returns:
+        List of unique image paths in input order
+        
+    Raises:
+        ValueError: If an input matches no images
+    """
+    entries = list(inputs)
+    if manifest:
+        manifest_dir = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    entries.append(line if os.path.isabs(line) else os.path.join(manifest_dir, line))
+    
+    def is_image(path: str) -> bool:
+        return os.path.isfile(path) and os.path.splitext(path)[1].lower()[1:] in SUPPORTED_FORMATS
+    
+    paths = []
+    for entry in entries:
+        if os.path.isdir(entry):
+            matches = sorted(
+                os.path.join(entry, name) for name in os.listdir(entry)
+                if is_image(os.path.join(entry, name))
+            )
+        elif glob.has_magic(entry):
+            matches = sorted(path for path in glob.glob(entry, recursive=True) if is_image(path))
+        elif os.path.isfile(entry):
+            matches = [entry]
+        else:
+            matches = []
+        if not matches:
+            raise ValueError(f"No images found for input: {entry}")
+        paths.extend(matches)
+    
+    # Drop duplicates while keeping order
+    return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+def process_image(image_path: str, token_tracking: bool = None, realtime_display: bool = None, save_report: bool = None,
+                  resume_dir: Optional[str] = None, config: Optional['PipelineConfig'] = None) -> float:
     """
     Process a single family tree image through all stages.
     
     Args:
         image_path: Path to the image file
-        token_tracking: Override TOKEN_TRACKING_ENABLED env var
-        realtime_display: Override DISPLAY_REALTIME_USAGE env var
-        save_report: Override SAVE_USAGE_REPORT env var
+        token_tracking: Override the configured TOKEN_TRACKING_ENABLED setting
+        realtime_display: Override the configured DISPLAY_REALTIME_USAGE setting
+        save_report: Override the configured SAVE_USAGE_REPORT setting
+        resume_dir: Optional run directory of an interrupted run; stages recorded
+            in its checkpoint are reused and only the missing ones are processed
+        config: Optional pipeline configuration (defaults to the environment)
         
     Returns:
         float: Total processing time in seconds
     """
-    # Set environment variables if provided
-    if token_tracking is not None:
-        os.environ['TOKEN_TRACKING_ENABLED'] = str(token_tracking).lower()
-    if realtime_display is not None:
-        os.environ['DISPLAY_REALTIME_USAGE'] = str(realtime_display).lower()
-    if save_report is not None:
-        os.environ['SAVE_USAGE_REPORT'] = str(save_report).lower()
+    from models import ModelManager
+    from utils import TokenTracker, ImageAsset
+    from utils.checkpoint import CHECKPOINT_FILENAME
+    
+    # Apply any flag overrides to a copy of the configuration
+    config = resolve_config(config, token_tracking, realtime_display, save_report)
     
     # Initialize components
-    token_tracker = TokenTracker()
+    token_tracker = TokenTracker(config)
     
     # Start timing
     start_time = time.time()
+    output_dir = resume_dir
     
     try:
         # Load and encode image
         print("\n=== Loading Image ===")
-        image_base64 = load_image(image_path)
-        print("- Image loaded and encoded successfully")
+        image = ImageAsset.open(image_path)
+        print(f"- Image loaded and encoded successfully ({image.describe()})")
         
         # Initialize model manager
-        manager = ModelManager()
+        manager = ModelManager(config)
         
-        # Create output directory
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output_dir = os.path.join(current_dir, "output", f"run_{timestamp}")
-        manager.initialize_run(output_dir)
+        if resume_dir:
+            # Reuse the interrupted run's directory and checkpointed stages
+            try:
+                manager.resume_run(resume_dir, image_digest=image.digest)
+            except ValueError:
+                # The checkpoint belongs to another image or configuration: do not suggest resuming it
+                output_dir = None
+                raise
+            print(f"- Resuming run in {resume_dir} ({len(manager.checkpoint.tasks)} tasks already complete)")
+        else:
+            # Create output directory
+            output_dir = create_run_dir(image_path)
+            manager.initialize_run(output_dir, image_path=os.path.abspath(image_path), image_digest=image.digest)
         
         # Process image through all stages
         result = manager.process_image(
-            image_base64=image_base64,
+            image=image,
             token_tracker=token_tracker
         )
         
@@ -111,11 +236,10 @@ def process_image(image_path: str, token_tracking: bool = None, realtime_display
             print("\nError details: Authentication failed. Please check your configuration.")
         else:
             # For non-authentication errors, show the error message without sensitive details
-            sanitized_error = error_str.replace(os.path.expanduser("~"), "HOME")
-            for key in os.environ:
-                if "API" in key or "KEY" in key:
-                    sanitized_error = sanitized_error.replace(os.environ[key], "[REDACTED]")
-            print(f"\nError: {sanitized_error}")
+            print(f"\nError: {sanitize_error(error_str)}")
+        
+        if output_dir and os.path.exists(os.path.join(output_dir, CHECKPOINT_FILENAME)):
+            print(f"\nCompleted stages were checkpointed. Resume with: --resume {output_dir}")
         
         # Print token usage summary before exiting
         print("\n=== Token Usage Summary ===")
@@ -123,6 +247,106 @@ def process_image(image_path: str, token_tracking: bool = None, realtime_display
         # Re-raise the exception to preserve the stack trace
         raise
 
+async def _process_batch_async(image_paths: List[str], workers: int, limiter: 'ProviderLimiter',
+                               config: 'PipelineConfig', executor: 'ThreadPoolExecutor') -> List[Dict[str, object]]:
+    """Run up to `workers` images at once on one event loop with shared provider limits and worker pool."""
+    import asyncio
+    from models import ModelManager
+    from utils import TokenTracker, ImageAsset
+    
+    # Blocking work of every image (asyncio.to_thread: image decoding, request
+    # building, cache and checkpoint I/O, reports) runs on the batch's pool
+    asyncio.get_running_loop().set_default_executor(executor)
+    slots = asyncio.Semaphore(workers)
+    
+    async def _process_one(image_path: str) -> Dict[str, object]:
+        async with slots:
+            start_time = time.time()
+            token_tracker = TokenTracker(config)
+            output_dir = None
+            try:
+                image = await asyncio.to_thread(ImageAsset.open, image_path)
+                output_dir = create_run_dir(image_path)
+                manager = ModelManager(config, limiter=limiter)
+                manager.initialize_run(output_dir, image_path=image_path, image_digest=image.digest)
+                await manager.process_image_async(image=image, token_tracker=token_tracker)
+                error = None
+            except Exception as e:
+                error = sanitize_error(str(e))
+            status = {
+                'image_path': image_path,
+                'output_dir': output_dir,
+                'processing_time': time.time() - start_time,
+                'cost': token_tracker.grand_total.cost,
+                'error': error
+            }
+            label = "FAILED" if error else "done"
+            print(f"[{label}] {image_path} ({status['processing_time']:.1f}s)" + (f": {error}" if error else ""))
+            return status
+    
+    return await asyncio.gather(*(_process_one(path) for path in image_paths))
+
+def process_batch(image_paths: List[str], workers: int = 4, provider_limits: Optional[Dict[str, int]] = None,
+                  token_tracking: bool = None, realtime_display: bool = None, save_report: bool = None,
+                  config: Optional['PipelineConfig'] = None) -> List[Dict[str, object]]:
+    """
+    Process many family tree images through a shared worker pool.
+    
+    Images run concurrently on one event loop, sharing per-provider in-flight
+    limits. Because every image's stage graph starts tasks as soon as their
+    inputs exist, images at different stages interleave and keep provider
+    capacity busy. Their blocking work shares one pool of MAX_PARALLEL_CALLS
+    threads. A failed image is reported and does not stop the batch.
+    
+    Args:
+        image_paths: Paths of the images to process
+        workers: Maximum number of images in flight at once
+        provider_limits: Optional per-provider in-flight call limits
+        token_tracking: Override the configured TOKEN_TRACKING_ENABLED setting
+        realtime_display: Override the configured DISPLAY_REALTIME_USAGE setting
+        save_report: Override the configured SAVE_USAGE_REPORT setting
+        config: Optional pipeline configuration (defaults to the environment)
+        
+    Returns:
+        List of per-image status dicts (image_path, output_dir, processing_time, cost, error)
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from utils.concurrency import ProviderLimiter
+    
+    config = resolve_config(config, token_tracking, realtime_display, save_report)
+    limiter = ProviderLimiter({**config.provider_concurrency, **(provider_limits or {})})
+    
+    print(f"\n=== Batch Processing {len(image_paths)} Images ({workers} workers) ===")
+    start_time = time.time()
+    # One worker pool, sized by MAX_PARALLEL_CALLS, for the whole batch
+    executor = ThreadPoolExecutor(max_workers=config.max_parallel_calls, thread_name_prefix="batch-worker")
+    try:
+        results = asyncio.run(_process_batch_async(image_paths, workers, limiter, config, executor))
+    finally:
+        executor.shutdown(wait=True)
+    
+    failed = [r for r in results if r['error']]
+    print("\n=== Batch Summary ===")
+    print(f"Images processed: {len(results) - len(failed)}/{len(results)}")
+    print(f"Total cost: ${sum(r['cost'] for r in results):.4f}")
+    print(f"Total time: {time.time() - start_time:.2f} seconds")
+    for r in failed:
+        print(f"- Failed: {r['image_path']}: {r['error']}")
+        if r['output_dir']:
+            print(f"  Resume with: --resume {r['output_dir']}")
+    return results
+
+def parse_provider_limits(values: List[str]) -> Dict[str, int]:
+    """Parse repeated PROVIDER=N arguments into a dict of limits."""
+    limits = {}
+    for value in values or []:
+        provider, sep, limit = value.partition('=')
+        if not sep or not limit.isdigit() or int(limit) <= 0:
+            raise argparse.ArgumentTypeError(f"Invalid provider limit '{value}'. Expected PROVIDER=N")
+        limits[provider.strip().lower()] = int(limit)
+    return limits
+
 def main():
     parser = argparse.ArgumentParser(
         description='Process Chinese family tree images.',
@@ -141,14 +365,110 @@ Token Tracking Options:
   --display          Show realtime token usage
   --report           Save token usage report
 
+Batch Mode:
+  Pass several images, directories or glob patterns (quote globs), or a
+  manifest file with --manifest, to process many pages in one process:
+
+  main.py scans/ --workers 8 --provider-limit google=12
+  main.py "scans/**/*.jpg" --manifest more_pages.txt
+
+Resuming Runs:
+  Each run directory holds checkpoint.json with the raw output of every
+  completed stage. If a run fails, continue it from the first missing stage:
+
+  main.py --resume output/run_20250101_120000_000000_page1
+
+Response Cache:
+  Provider responses are cached on disk, keyed by provider, model, parameters,
+  prompt and image, so re-runs replay identical calls instantly.
+
+  --no-cache          Bypass the cache for this run
+  --clear-cache       Delete all cached responses (may be used without images)
+
+Tiled Transcription:
+  Wide scrolls lose detail when scaled down to one upload. With --tile (or
+  IMAGE_TILING_ENABLED=true), Stages 1-2 split such scans into overlapping
+  vertical strips cut between text columns, transcribe the strips at once and
+  stitch the text back together.
+
+Streaming:
+  Responses are streamed, and each model's text so far is written to
+  Stage{N}_Model{M}_<timestamp>.partial.md in the run directory until the
+  model completes. Stalled streams are retried like other transient errors.
+
+Hedged Requests:
+  With --hedge (or HEDGING_ENABLED=true), a Stage 1-4 call still running
+  after the 95th percentile of its model's recent latencies is sent again;
+  the first response is used and the other request cancelled. Hedge costs
+  are reported separately in the usage report.
+
+Structured Reviews:
+  With --structured-reviews (or STRUCTURED_REVIEWS_ENABLED=true), Stages 3-5
+  answer with JSON: transcription, character swaps, uncertainties and
+  reasoning. Later stages receive everything but the reasoning, which is
+  saved to Stage{N}_Model{M}_<timestamp>.review.json.
+
+Local Consensus:
+  With --consensus (or CONSENSUS_ENABLED=true), the six Stage 1-2
+  transcriptions are aligned character by character. If at least
+  CONSENSUS_THRESHOLD (default 0.8) of them agree at every position, Stages
+  3-4 are skipped and Stage 5 works from the consensus; otherwise Stage 3
+  reviews only the disputed spans. See consensus_<timestamp>.json in the run directory.
+
+Configuration:
+  Settings are read once at startup from the environment (and the project
+  .env file). --config FILE layers another .env-format file on top, e.g. to
+  run a batch with a different set of stage models.
+
 Environment Variables (if flags not specified):
   TOKEN_TRACKING_ENABLED    Set to 'false' to disable all token tracking
   DISPLAY_REALTIME_USAGE   Set to 'false' to hide realtime usage
   SAVE_USAGE_REPORT        Set to 'false' to skip saving report
+  RESPONSE_CACHE_ENABLED   Set to 'false' to disable the response cache
+  RESPONSE_CACHE_DIR       Cache directory (default: .cache/responses)
+  RESPONSE_CACHE_MAX_MB    Cache size cap; least recently used entries are evicted
+  PROMPT_CACHING_ENABLED   Set to 'false' to send prompts without provider cache breakpoints
+  IMAGE_TILING_ENABLED     Set to 'true' to tile wide scans
+  IMAGE_TILE_MAX           Most tiles per image (default: 6)
+  STREAMING_ENABLED        Set to 'false' to wait for whole responses
+  STREAM_STALL_TIMEOUT     Seconds without a chunk before a stream is retried (default: 60)
+  {PROVIDER}_RPM / _TPM    Requests / tokens per minute quota of a provider's models
+  RETRY_MAX_ATTEMPTS       Attempts per call on transient or rate limit errors (default: 4)
+  HEDGING_ENABLED          Set to 'true' to hedge slow calls in Stages 1-4
+  HEDGE_PERCENTILE         Latency percentile after which a call is hedged (default: 95)
+  CIRCUIT_BREAKER_ENABLED  Set to 'false' to keep calling models that are failing
+  CIRCUIT_BREAKER_STATE_FILE  File sharing open circuit breakers between processes
+  STRUCTURED_REVIEWS_ENABLED  Set to 'true' for JSON reviews in Stages 3-5
+  CONSENSUS_ENABLED        Set to 'true' to build a local consensus of Stages 1-2
+  CONSENSUS_THRESHOLD      Share agreeing at every position to skip Stages 3-4 (default: 0.8)
 """
     )
     
-    parser.add_argument('image_path', help='Path to the image file to process')
+    parser.add_argument('inputs', nargs='*', metavar='image_path',
+                        help='Image file(s), directories or glob patterns to process')
+    parser.add_argument('--manifest', help='File listing image paths to process, one per line')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='Maximum number of images processed at once in batch mode (default: 4)')
+    parser.add_argument('--provider-limit', action='append', metavar='PROVIDER=N', default=[],
+                        help='Maximum in-flight calls for a provider (repeatable)')
+    parser.add_argument('--resume', metavar='RUN_DIR',
+                        help='Resume an interrupted run from its checkpoint')
+    parser.add_argument('--config', metavar='FILE',
+                        help='.env-format file whose settings override the environment for this run')
+    
+    # Response cache flags
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Bypass the response cache for this run')
+    parser.add_argument('--clear-cache', action='store_true',
+                        help='Delete all cached responses before processing')
+    parser.add_argument('--tile', action='store_true',
+                        help='Transcribe wide scans as overlapping tiles')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Send a duplicate of calls that run longer than usual')
+    parser.add_argument('--structured-reviews', action='store_true',
+                        help='Have Stages 3-5 answer in JSON and pass on only what the next stage needs')
+    parser.add_argument('--consensus', action='store_true',
+                        help='Skip or narrow the Stage 3-4 reviews using a local consensus of Stages 1-2')
     
     # Token tracking flags
     tracking_group = parser.add_mutually_exclusive_group()
@@ -171,21 +491,109 @@ Environment Variables (if flags not specified):
     
     args = parser.parse_args()
     
-    if not os.path.exists(args.image_path):
-        print(f"Error: Image file not found: {args.image_path}")
+    has_work = bool(args.inputs or args.manifest or args.resume)
+    if args.resume and (args.inputs or args.manifest):
+        parser.error("--resume cannot be combined with image paths or --manifest")
+    if not has_work and not args.clear_cache:
+        parser.error("at least one image path or --manifest is required")
+    if args.workers <= 0:
+        parser.error("--workers must be positive")
+    try:
+        provider_limits = parse_provider_limits(args.provider_limit)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    
+    # Arguments are valid: only now load the environment and pipeline modules
+    load_environment()
+    
+    if args.clear_cache:
+        from config.config import get_response_cache_settings
+        from utils.response_cache import get_response_cache
+        settings = dict(os.environ)
+        if args.config:
+            from dotenv import dotenv_values
+            settings.update({k: v for k, v in dotenv_values(args.config).items() if v is not None})
+        try:
+            cache_dir, _ = get_response_cache_settings(settings)
+        except ValueError as e:
+            print(f"Configuration error: {sanitize_error(str(e))}")
+            sys.exit(1)
+        get_response_cache(cache_dir).clear()
+        print("- Response cache cleared")
+        if not has_work:
+            return
+    
+    # Resolve and validate the configuration once for the whole run
+    from config.pipeline_config import PipelineConfig
+    try:
+        config = PipelineConfig.from_env(env_file=args.config)
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"Configuration error: {sanitize_error(str(e))}")
         sys.exit(1)
+    if args.no_cache:
+        config = config.with_overrides(response_cache_enabled=False)
+    if args.tile:
+        config = config.with_overrides(image_tiling=True)
+    if args.hedge:
+        config = config.with_overrides(hedging=True)
+    if args.structured_reviews:
+        config = config.with_overrides(structured_reviews=True)
+    if args.consensus:
+        config = config.with_overrides(consensus=True)
     
     # Convert flags to boolean values for process_image
     token_tracking = True if args.tracking else False if args.no_tracking else None
     realtime_display = True if args.display else False if args.no_display else None
     save_report = True if args.report else False if args.no_report else None
     
-    process_image(
-        args.image_path,
+    if args.resume:
+        from utils.checkpoint import RunCheckpoint
+        try:
+            image_path = RunCheckpoint.read(args.resume)['metadata'].get('image_path')
+        except (ValueError, OSError) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        if not image_path:
+            print(f"Error: Checkpoint in {args.resume} does not record its image path")
+            sys.exit(1)
+        process_image(
+            image_path,
+            token_tracking=token_tracking,
+            realtime_display=realtime_display,
+            save_report=save_report,
+            resume_dir=args.resume,
+            config=config
+        )
+        return
+    
+    # Single image: keep the original one-shot behavior
+    if len(args.inputs) == 1 and not args.manifest and os.path.isfile(args.inputs[0]) and not provider_limits:
+        process_image(
+            args.inputs[0],
+            token_tracking=token_tracking,
+            realtime_display=realtime_display,
+            save_report=save_report,
+            config=config
+        )
+        return
+    
+    try:
+        image_paths = collect_image_paths(args.inputs, args.manifest)
+    except (ValueError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    
+    results = process_batch(
+        image_paths,
+        workers=args.workers,
+        provider_limits=provider_limits,
         token_tracking=token_tracking,
         realtime_display=realtime_display,
-        save_report=save_report
+        save_report=save_report,
+        config=config
     )
+    if any(r['error'] for r in results):
+        sys.exit(1)
 
 if __name__ == '__main__':
     main()
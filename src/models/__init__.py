@@ -3,16 +3,30 @@ LLM model implementations and management.
 """
 import sys
 import os
+import importlib
 
 # Add the src directory to the Python path
 current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
 
-from .stage_model import StageModel
-from .model_manager import ModelManager
-from .model_factory import ModelFactory
-from .model_interfaces import BaseModel, TranscriptionModel, ReviewModel, FinalStageModel
+# Public names and the submodules that define them, imported on first access
+_EXPORTS = {
+    'StageModel': '.stage_model',
+    'ModelManager': '.model_manager',
+    'ModelFactory': '.model_factory',
+    'BaseModel': '.model_interfaces',
+    'TranscriptionModel': '.model_interfaces',
+    'ReviewModel': '.model_interfaces',
+    'FinalStageModel': '.model_interfaces'
+}
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
     'StageModel',
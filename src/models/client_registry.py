@@ -0,0 +1,150 @@
+"""
+Process-wide registry of provider SDK clients.
+
+SDK clients own HTTP connection pools and are safe to share between threads,
+so each one is built at most once per process and handed to every StageModel
+that needs it instead of being rebuilt for every model instance.
+"""
+import os
+import asyncio
+import threading
+from typing import Any, Dict, Optional, Tuple
+import sys
+
+# Add the src directory to the Python path
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from config.config import get_env_var_name
+
+# Providers whose client is bound to a single model rather than passed it per request
+MODEL_BOUND_PROVIDERS = {'google'}
+
+class ClientRegistry:
+    """Shared sync and async SDK clients keyed by provider (and model where needed)."""
+
+    def __init__(self):
+        """Initialize an empty registry."""
+        self._clients: Dict[Tuple, Any] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, provider: str, model_name: str, use_async: bool, api_key: Optional[str]) -> Tuple:
+        """Build the registry key for a client."""
+        model_key = model_name if provider in MODEL_BOUND_PROVIDERS else None
+        loop_key = None
+        if use_async:
+            # Async clients hold connections tied to the event loop that opened them
+            try:
+                loop_key = id(asyncio.get_running_loop())
+            except RuntimeError:
+                loop_key = None
+        return (provider, model_key, api_key, use_async, loop_key)
+
+    def get(self, provider: str, model_name: str, use_async: bool = False, api_key: Optional[str] = None) -> Any:
+        """
+        Get the shared client for a provider and model, creating it on first use.
+
+        Args:
+            provider: Provider name
+            model_name: Model name (only model-bound providers get a client per model)
+            use_async: Return the provider's async client
+            api_key: Optional API key (defaults to the provider's environment variable)
+
+        Returns:
+            The provider SDK client
+
+        Raises:
+            ValueError: If the provider is not supported
+        """
+        api_key = api_key or os.getenv(get_env_var_name(provider))
+        key = self._key(provider, model_name, use_async, api_key)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                if use_async:
+                    client = self._create_async_client(provider, model_name, api_key)
+                else:
+                    client = self._create_client(provider, model_name, api_key)
+                self._clients[key] = client
+            return client
+
+    def clear(self):
+        """Drop every cached client (e.g. after API keys change)."""
+        with self._lock:
+            self._clients.clear()
+
+    def _create_client(self, provider: str, model_name: str, api_key: Optional[str]) -> Any:
+        """Create the sync client for a provider."""
+        if provider == 'google':
+            import google.generativeai as genai
+            # google.generativeai holds its API key globally, so the last key configured wins
+            genai.configure(api_key=api_key)
+            return genai.GenerativeModel(model_name)
+
+        elif provider == 'openai':
+            from openai import OpenAI
+            return OpenAI(api_key=api_key)
+
+        elif provider == 'groq':
+            from groq import Groq
+            return Groq(api_key=api_key)
+
+        elif provider == 'anthropic':
+            from anthropic import Anthropic
+            return Anthropic(api_key=api_key)
+
+        elif provider == 'openrouter':
+            from openai import OpenAI
+            return OpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=api_key
+            )
+
+        elif provider == 'together':
+            from together import Together
+            return Together(api_key=api_key)
+
+        raise ValueError(f"Unsupported provider: {provider}")
+
+    def _create_async_client(self, provider: str, model_name: str, api_key: Optional[str]) -> Any:
+        """Create the async client for a provider."""
+        if provider == 'google':
+            # GenerativeModel exposes generate_content_async on the sync client type
+            return self._create_client(provider, model_name, api_key)
+
+        elif provider == 'openai':
+            from openai import AsyncOpenAI
+            return AsyncOpenAI(api_key=api_key)
+
+        elif provider == 'groq':
+            from groq import AsyncGroq
+            return AsyncGroq(api_key=api_key)
+
+        elif provider == 'anthropic':
+            from anthropic import AsyncAnthropic
+            return AsyncAnthropic(api_key=api_key)
+
+        elif provider == 'openrouter':
+            from openai import AsyncOpenAI
+            return AsyncOpenAI(
+                base_url="https://openrouter.ai/api/v1",
+                api_key=api_key
+            )
+
+        elif provider == 'together':
+            from together import AsyncTogether
+            return AsyncTogether(api_key=api_key)
+
+        raise ValueError(f"Unsupported provider: {provider}")
+
+_registry: Optional[ClientRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_client_registry() -> ClientRegistry:
+    """Get the process-wide client registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ClientRegistry()
+        return _registry
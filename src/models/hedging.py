@@ -0,0 +1,119 @@
+"""
+Hedged requests for provider calls with a long latency tail.
+
+A few calls to a model take many times its usual latency, and every model in
+a stage waits on the slowest. A hedged call sends its request and, if no
+response has arrived once a percentile of the model's recent latencies has
+passed, sends a duplicate, to the same model or to the fallback model. The
+first response is used and the other request is cancelled.
+
+Latencies are recorded per model and stage for the life of the process, so a
+model is only hedged once enough of its calls have been timed.
+"""
+import math
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+# Latencies kept per model and stage
+HISTORY_SIZE = 200
+
+PRIMARY = 'primary'
+HEDGE = 'hedge'
+
+class HedgeCancelledError(RuntimeError):
+    """Raised in a request of a hedged call once the other request has won."""
+
+class LatencyHistory:
+    """
+    Recent request latencies of each model and stage.
+    """
+
+    def __init__(self, size: int = HISTORY_SIZE):
+        """
+        Initialize the history.
+
+        Args:
+            size: Latencies kept per model and stage
+        """
+        self.size = size
+        self._latencies: Dict[Tuple[str, str, int], Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, provider: str, model_name: str, stage: int, seconds: float):
+        """Record the latency of a successful request."""
+        key = (provider, model_name, stage)
+        with self._lock:
+            if key not in self._latencies:
+                self._latencies[key] = deque(maxlen=self.size)
+            self._latencies[key].append(seconds)
+
+    def percentile(self, provider: str, model_name: str, stage: int, percentile: float, min_samples: int) -> Optional[float]:
+        """
+        Get a percentile of a model's recent latencies in a stage.
+
+        Args:
+            provider: Provider name
+            model_name: Model name
+            stage: Stage number
+            percentile: Percentile to get (0-100, nearest rank)
+            min_samples: Latencies needed before a percentile is given
+
+        Returns:
+            Latency in seconds, or None if too few requests have been timed
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get((provider, model_name, stage), ()))
+        if not latencies or len(latencies) < min_samples:
+            return None
+        rank = max(1, math.ceil(percentile / 100 * len(latencies)))
+        return latencies[min(rank, len(latencies)) - 1]
+
+class HedgeAttempt:
+    """
+    One of the two requests racing in a hedged call.
+
+    The request checks cancelled between its steps and aborts its stream once
+    it is set. The stream's accumulator is kept so the text a cancelled
+    request had received can be counted towards the hedge's cost.
+    """
+
+    def __init__(self, role: str):
+        """
+        Initialize the attempt.
+
+        Args:
+            role: PRIMARY for the original request, HEDGE for the duplicate
+        """
+        self.role = role
+        self.cancelled = threading.Event()
+        self.accumulator = None
+
+    def cancel(self):
+        """Ask the request to stop."""
+        self.cancelled.set()
+
+    def check(self):
+        """
+        Stop the request if it was cancelled.
+
+        Raises:
+            HedgeCancelledError: If the other request of the call has won
+        """
+        if self.cancelled.is_set():
+            raise HedgeCancelledError(f"Hedged {self.role} request cancelled")
+
+    def received_text(self) -> Optional[str]:
+        """Get the text streamed so far, or None if the request was not streamed."""
+        return self.accumulator.content if self.accumulator is not None else None
+
+_latency_history: Optional[LatencyHistory] = None
+_latency_history_lock = threading.Lock()
+
+def get_latency_history() -> LatencyHistory:
+    """Get the process-wide latency history."""
+    global _latency_history
+    with _latency_history_lock:
+        if _latency_history is None:
+            _latency_history = LatencyHistory()
+        return _latency_history
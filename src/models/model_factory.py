@@ -1,19 +1,20 @@
 """
 Factory for creating stage-specific model instances.
 """
-from typing import Union, TYPE_CHECKING
+from typing import Optional, Union, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from models.model_interfaces import TranscriptionModel, ReviewModel, FinalStageModel
+    from utils.tracing import Tracer
 
 from models.stage_model import StageModel
-from config.config import get_model_init_params
+from config.pipeline_config import PipelineConfig, get_pipeline_config
 
 class ModelFactory:
     """Factory class for creating model instances for each stage."""
     
     @staticmethod
-    def create_model(stage: int, model_num: int) -> Union['TranscriptionModel', 'ReviewModel', 'FinalStageModel']:
+    def create_model(stage: int, model_num: int, config: Optional[PipelineConfig] = None, stream_prefix: Optional[str] = None, tracer: Optional['Tracer'] = None, queue_key: Optional[str] = None) -> Union['TranscriptionModel', 'ReviewModel', 'FinalStageModel']:
         """
         Create a model instance for a specific stage and model number.
         
@@ -24,6 +25,10 @@ class ModelFactory:
         Args:
             stage: Stage number (1-8)
             model_num: Model number within the stage (1-3 for stages 1-4, 1 for stages 5-8)
+            config: Optional pipeline configuration (defaults to the process configuration)
+            stream_prefix: Optional path prefix of the model's progressive output files
+            tracer: Optional tracer recording the latency of the model's calls
+            queue_key: Run the model's calls belong to, for fair rate limit queueing
             
         Returns:
             Model instance appropriate for the stage
@@ -32,13 +37,18 @@ class ModelFactory:
             ValueError: If stage or model number is invalid
         """
         # Get model configuration for this stage/number
-        config = get_model_init_params(stage, model_num)
+        config = config or get_pipeline_config()
+        params = config.get_model_params(stage, model_num)
         
         # Create independent model instance
-        # Each instance has its own client and makes its own API calls
+        # Instances share their provider's SDK client through the client registry
         return StageModel(
-            provider=config['provider'],
-            model_name=config['name'],
+            provider=params['provider'],
+            model_name=params['name'],
             stage=stage,
-            model_num=model_num
+            model_num=model_num,
+            config=config,
+            stream_prefix=stream_prefix,
+            tracer=tracer,
+            queue_key=queue_key
         )
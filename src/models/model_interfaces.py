@@ -2,7 +2,7 @@
 Base interfaces for LLM model implementations.
 """
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Union
 import sys
 import os
 
@@ -12,6 +12,7 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 from utils.token_counter import TokenTracker
+from utils.image_utils import ImageAsset
 
 class BaseModel(ABC):
     """Base class for all LLM models."""
@@ -54,12 +55,12 @@ class TranscriptionModel(BaseModel):
     """Base class for models that can transcribe Chinese text from images."""
     
     @abstractmethod
-    def generate_transcription(self, image_base64: str, token_tracker: TokenTracker = None) -> str:
+    def generate_transcription(self, image: Union[str, ImageAsset], token_tracker: TokenTracker = None) -> str:
         """
-        Generate transcription from base64 encoded image.
+        Generate transcription from an image.
         
         Args:
-            image_base64: Base64 encoded image string
+            image: ImageAsset, or base64 encoded image string
             token_tracker: Optional token tracker for monitoring usage
             
         Returns:
@@ -1,7 +1,11 @@
+import asyncio
 import os
 import sys
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Union
 
 # Add the src directory to the Python path
 current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -10,28 +14,151 @@ if current_dir not in sys.path:
 
 from models.model_interfaces import TranscriptionModel, ReviewModel, FinalStageModel
 from models.model_factory import ModelFactory
-from utils.token_counter import count_tokens, TokenTracker
-from config.config import get_model_init_params
-from config.token_costs import should_show_stage_inputs
+from models.stage_graph import StageGraph
+from models.structured_reviews import REVIEW_STAGES, compact_review, parse_review
+from utils.token_counter import count_tokens_batch, TokenTracker, UsageRecorder, replay_usage
+from utils.concurrency import ProviderLimiter, CallCancelledError, run_in_parallel
+from utils.checkpoint import RunCheckpoint
+from utils.tracing import Tracer
+from utils.image_utils import ImageAsset, as_image_asset, get_image_normalizer
+from utils.image_tiling import get_image_tiler
+from utils.consensus import CONSENSUS_KEY, ConsensusResult, build_consensus, format_consensus
+from config.pipeline_config import PipelineConfig, get_pipeline_config
 
 class ModelManager:
     """
     Manages the lifecycle and execution of models across all stages.
     """
     
-    def __init__(self):
-        """Initialize the model manager."""
+    def __init__(self, config: Optional[PipelineConfig] = None, limiter: Optional[ProviderLimiter] = None, executor: Optional[ThreadPoolExecutor] = None):
+        """
+        Initialize the model manager.
+        
+        Args:
+            config: Optional pipeline configuration (defaults to the process configuration)
+            limiter: Optional per-provider concurrency limiter to share across managers
+            executor: Optional worker pool for model calls to share across managers;
+                without one, a pool is created when a synchronous run needs it
+        """
         self.output_dir = None
         self.timestamp = None
         self.start_time = None
-        self.token_tracker = TokenTracker()
+        self.checkpoint = None
+        self._resumed_usage = []
+        self.tracer = Tracer()
+        self.config = config or get_pipeline_config()
+        self.token_tracker = TokenTracker(self.config)
+        self._limiter = limiter or ProviderLimiter(self.config.provider_concurrency)
+        # A pool passed in belongs to the caller; one created here is shut down after each image
+        self._executor = executor
+        self._owns_executor = executor is None
+        
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Get the worker pool for model calls, creating it on first use."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.config.max_parallel_calls,
+                thread_name_prefix="model-call"
+            )
+        return self._executor
         
-    def initialize_run(self, output_dir: str):
-        """Initialize a new processing run."""
+    def close(self):
+        """Shut down the worker pool if this manager created it."""
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            
+    def initialize_run(self, output_dir: str, image_path: Optional[str] = None, image_digest: Optional[str] = None):
+        """
+        Initialize a new processing run.
+        
+        Args:
+            output_dir: Directory for the run's reports and checkpoint
+            image_path: Optional source image path, recorded so the run can be resumed
+            image_digest: Optional SHA-256 digest of the image, checked on resume
+        """
         self.output_dir = output_dir
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         self.start_time = datetime.now()
+        self.tracer = Tracer(image=os.path.basename(image_path) if image_path else None)
         os.makedirs(output_dir, exist_ok=True)
+        self.checkpoint = RunCheckpoint(output_dir)
+        self._resumed_usage = []
+        self.checkpoint.set_metadata(
+            image_path=image_path,
+            image_digest=image_digest,
+            result_keys=self._result_key_metadata()
+        )
+        
+    def resume_run(self, output_dir: str, image_digest: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Reopen an interrupted run so only its missing stages are processed.
+        
+        The token usage of the checkpointed model tasks is added to the
+        run's token tracker when processing starts.
+        
+        Args:
+            output_dir: Directory of the earlier run
+            image_digest: Optional SHA-256 digest of the image being processed
+            
+        Returns:
+            Dict of run metadata recorded by initialize_run
+            
+        Raises:
+            FileNotFoundError: If the directory has no checkpoint
+            ValueError: If the image or the configured models differ from the
+                checkpointed run's
+        """
+        checkpoint = RunCheckpoint(output_dir, resume=True)
+        recorded_digest = checkpoint.metadata.get('image_digest')
+        if image_digest and recorded_digest and image_digest != recorded_digest:
+            raise ValueError(f"The image has changed since the run in {output_dir} was checkpointed; start a new run")
+        recorded_keys = checkpoint.metadata.get('result_keys')
+        if recorded_keys is not None:
+            changed = sorted(
+                name for name, key in self._result_key_metadata().items()
+                if recorded_keys.get(name) != key
+            )
+            if changed:
+                raise ValueError(
+                    f"The configured models have changed since the run in {output_dir} was "
+                    f"checkpointed ({', '.join(changed)}); start a new run"
+                )
+        
+        self.output_dir = output_dir
+        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.start_time = datetime.now()
+        self.checkpoint = checkpoint
+        self._resumed_usage = [
+            record
+            for name, records in checkpoint.usage.items()
+            if checkpoint.tasks.get(name) is not None
+            for record in records
+        ]
+        image_path = checkpoint.metadata.get('image_path')
+        self.tracer = Tracer(image=os.path.basename(image_path) if image_path else None)
+        return dict(checkpoint.metadata)
+        
+    def _result_key_metadata(self) -> Dict[str, str]:
+        """Get the configured result key of every model task, by task name."""
+        return {
+            f"stage{stage_num}.model{model_num}": key
+            for (stage_num, model_num), key in sorted(self.config.result_keys.items())
+        }
+        
+    def _save_task_usage(self, stage_num: int, model_num: int, recorder: UsageRecorder):
+        """Checkpoint the token usage of a model task."""
+        if self.checkpoint:
+            self.checkpoint.save_usage(f"stage{stage_num}.model{model_num}", recorder.records)
+        
+    def _checkpoint_args(self) -> Dict[str, Any]:
+        """Graph run arguments that skip checkpointed tasks and checkpoint new ones."""
+        if not self.checkpoint:
+            return {}
+        return {
+            'completed': dict(self.checkpoint.tasks),
+            'on_complete': self.checkpoint.save_task
+        }
         
     def _get_processing_time(self) -> float:
         """Get processing time in seconds."""
@@ -44,33 +171,39 @@ class ModelManager:
         if not self.output_dir or not self.timestamp:
             raise RuntimeError("Output directory not initialized")
             
+        # The stage runs from its first model call until its report is written
+        stage_spans = self.tracer.spans(stage=stage_num)
+        stage_start = stage_spans[0].start if stage_spans else None
+        with self.tracer.span('report', stage=stage_num):
+            self._write_stage_output(stage_num, content, base_path, timestamp, next_stage_data, input_data)
+        if stage_start is not None:
+            self.tracer.add_span('stage', stage_start, time.perf_counter(), stage=stage_num)
+            
+    def _write_stage_output(self, stage_num: int, content: str, base_path: str, timestamp: str, next_stage_data: Dict[str, str] = None, input_data: Dict[str, str] = None):
+        """Write the markdown report of a stage (see _save_stage_output)."""
         filename = f"Stage{stage_num}_{timestamp}.md"
         filepath = os.path.join(base_path, filename)
         
-        # Calculate total token count and cost for this stage
-        input_tokens = 0
-        output_tokens = 0
-        total_cost = 0.0
+        # Count every string in the report in one batch
+        input_data = input_data or {}
+        next_stage_data = next_stage_data or {}
+        with self.tracer.span('token_count', stage=stage_num):
+            counts = count_tokens_batch([content] + list(input_data.values()) + list(next_stage_data.values()))
+        content_tokens = counts[0]
+        input_counts = dict(zip(input_data, counts[1:1 + len(input_data)]))
+        output_counts = dict(zip(next_stage_data, counts[1 + len(input_data):]))
         
-        # Count input tokens
-        if input_data:
-            for data in input_data.values():
-                input_tokens += count_tokens(data)
-                
-        # Count output tokens (from generated content and next stage data)
-        output_tokens += count_tokens(content)
-        if next_stage_data:
-            for data in next_stage_data.values():
-                output_tokens += count_tokens(data)
+        # Calculate total token count and cost for this stage
+        input_tokens = sum(input_counts.values())
+        output_tokens = content_tokens + sum(output_counts.values())
                 
-        # Calculate total cost using the model's rates
-        model = ModelFactory.create_model(stage_num, 1)  # Use first model's rates for the stage
+        # Calculate total cost using the configured rates of the stage's first model
         from config.token_costs import calculate_cost
-        total_cost = calculate_cost(model.model_name, input_tokens, output_tokens)
+        total_cost = calculate_cost(self.config.get_model_params(stage_num, 1)['name'], input_tokens, output_tokens)
         total_tokens = input_tokens + output_tokens
         
-        # Format processing time as minutes and seconds
-        processing_time = self._get_processing_time()
+        # Format this stage's processing time as minutes and seconds
+        processing_time = self.tracer.stage_elapsed(stage_num)
         minutes = int(processing_time // 60)
         seconds = processing_time % 60
         time_str = f"{minutes}m {seconds:.2f}s"
@@ -94,9 +227,9 @@ class ModelManager:
         if stage_num == 1:
             part1 += "No input from previous stage\n\n"
         elif input_data:
-            if should_show_stage_inputs():
+            if self.config.show_stage_inputs:
                 for key, data in input_data.items():
-                    token_count = count_tokens(data)
+                    token_count = input_counts[key]
                     part1 += f"### {key}\n"
                     part1 += f"Token count: {token_count:,} tokens\n"
                     part1 += f"```\n{data}\n```\n\n"
@@ -108,7 +241,7 @@ class ModelManager:
         if next_stage_data:
             total_tokens = 0
             for key, data in next_stage_data.items():
-                token_count = count_tokens(data)
+                token_count = output_counts[key]
                 total_tokens += token_count
                 # Get character count for this transcription from token tracker
                 stage_models = self.token_tracker.get_stage_models(f"Stage {stage_num}")
@@ -131,206 +264,412 @@ class ModelManager:
             f.write(header + part1 + part2)
         print(f"- Stage {stage_num} output saved to: {filepath}")
         
-    def run_stage1(self, image_base64: str) -> Dict[str, str]:
-        """Run Stage 1 - Initial Transcription."""
-        stage_num = 1
-        results = {}
+    def _stream_prefix(self, stage_num: int, model_num: int) -> Optional[str]:
+        """
+        Get the path prefix a model streams its partial output to.
         
-        # Create models
-        models = []
-        for model_num in range(1, 4):
-            model = ModelFactory.create_model(stage_num, model_num)
-            models.append(model)
+        While a model is streaming, its text so far can be followed in
+        Stage{N}_Model{M}_{timestamp}.partial.md in the run directory. The file
+        is removed once the model completes and kept if it fails.
+        """
+        if not self.output_dir or not self.config.streaming:
+            return None
+        return os.path.join(self.output_dir, f"Stage{stage_num}_Model{model_num}_{self.timestamp}")
+        
+    def _create_model(self, stage_num: int, model_num: int):
+        """Create the model of a stage, bound to this run's output directory, tracer and rate limit queue."""
+        return ModelFactory.create_model(
+            stage_num, model_num, self.config,
+            stream_prefix=self._stream_prefix(stage_num, model_num),
+            tracer=self.tracer,
+            queue_key=self.output_dir
+        )
+        
+    def _model_span_tags(self, stage_num: int, model_num: int) -> Dict[str, Any]:
+        """Tags of the trace span covering one model of a stage."""
+        return {
+            'stage': stage_num,
+            'model': model_num,
+            'provider': self.config.get_model_params(stage_num, model_num)['provider']
+        }
+        
+    def _compact_review(self, stage_num: int, model_num: int, output: str) -> str:
+        """
+        Archive a structured review and get the part of it the next stage needs.
+        
+        The full review, reasoning included, is saved to
+        Stage{N}_Model{M}_{timestamp}.review.json in the run directory. A
+        response that holds no structured review is passed on whole.
+        
+        Args:
+            stage_num: Stage number (3-5)
+            model_num: Model number (1-3)
+            output: The model's response
             
-        # Run transcriptions in parallel
-        for i, model in enumerate(models, 1):
-            try:
-                result = model.generate_transcription(image_base64, self.token_tracker)
-                key = f"Stage {stage_num} Model {i} - {model.provider.title()} {model.model_name} Transcription"
-                results[key] = result
-            except Exception as e:
-                raise RuntimeError(f"Failed to complete Stage {stage_num} Model {i}: {str(e)}")
-                
-        # Save stage output
-        self._save_stage_output(stage_num, str(results), self.output_dir, self.timestamp, results)
+        Returns:
+            Text passed to the next stage
+        """
+        if not self.config.structured_reviews or stage_num not in REVIEW_STAGES:
+            return output
+        review = parse_review(output)
+        if review is None:
+            print(f"Warning: Stage {stage_num} Model {model_num} returned no structured review; passing on its full response")
+            return output
+        if self.output_dir:
+            path = os.path.join(self.output_dir, f"Stage{stage_num}_Model{model_num}_{self.timestamp}.review.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(review, f, ensure_ascii=False, indent=2)
+        return compact_review(review, stage_num)
+        
+    def _run_stage_model(self, stage_num: int, model_num: int, args: tuple) -> Dict[str, str]:
+        """
+        Run a single model of a stage.
+        
+        Args:
+            stage_num: Stage number (1-8)
+            model_num: Model number (1-3)
+            args: Inputs passed to the model's stage method
+            
+        Returns:
+            Single-entry dict mapping the result key to the model's output
+            
+        Raises:
+            RuntimeError: If the model fails
+        """
+        try:
+            with self.tracer.span('model', **self._model_span_tags(stage_num, model_num)):
+                model = self._create_model(stage_num, model_num)
+                recorder = UsageRecorder(self.token_tracker)
+                output = model.run_stage(*args, token_tracker=recorder)
+        except CallCancelledError:
+            raise
+        except Exception as e:
+            raise RuntimeError(f"Failed to complete Stage {stage_num} Model {model_num}: {str(e)}")
+        self._save_task_usage(stage_num, model_num, recorder)
+        
+        # Results keep the configured model's key even if the fallback served them,
+        # so later stages find them; the fallback is recorded in the usage report
+        return {self.config.get_result_key(stage_num, model_num): self._compact_review(stage_num, model_num, output)}
+        
+    async def _run_stage_model_async(self, stage_num: int, model_num: int, args: tuple) -> Dict[str, str]:
+        """Async variant of _run_stage_model using the provider's async client."""
+        try:
+            with self.tracer.span('model', **self._model_span_tags(stage_num, model_num)):
+                model = self._create_model(stage_num, model_num)
+                recorder = UsageRecorder(self.token_tracker)
+                output = await model.run_stage_async(*args, token_tracker=recorder)
+        except Exception as e:
+            raise RuntimeError(f"Failed to complete Stage {stage_num} Model {model_num}: {str(e)}")
+        # Checkpoint and review files are written from a worker thread to keep the event loop free
+        await asyncio.to_thread(self._save_task_usage, stage_num, model_num, recorder)
+        
+        output = await asyncio.to_thread(self._compact_review, stage_num, model_num, output)
+        return {self.config.get_result_key(stage_num, model_num): output}
+        
+    def _run_models_in_parallel(self, stage_num: int, args: tuple) -> Dict[str, str]:
+        """
+        Run all three models of a stage concurrently.
+        
+        Args:
+            stage_num: Stage number (1-4)
+            args: Inputs passed to each model's stage method
+            
+        Returns:
+            Dict of results keyed in model number order
+            
+        Raises:
+            RuntimeError: If any model fails; remaining calls are cancelled
+        """
+        def _make_task(model_num):
+            return lambda: self._run_stage_model(stage_num, model_num, args)
+        
+        tasks = [
+            (model_num, self.config.get_model_params(stage_num, model_num)['provider'], _make_task(model_num))
+            for model_num in range(1, 4)
+        ]
+        outputs = run_in_parallel(tasks, self._get_executor(), self._limiter)
+        
+        results = {}
+        for model_num in range(1, 4):
+            results.update(outputs[model_num])
         return results
         
-    def run_stage2(self, image_base64: str) -> Dict[str, str]:
-        """Run Stage 2 - Secondary Transcription."""
-        stage_num = 2
+    def _save_parallel_stage(self, stage_num: int, model_outputs: List[Dict[str, str]], input_data: Dict[str, str] = None) -> Dict[str, str]:
+        """Merge per-model outputs of a parallel stage in model order and save the stage report."""
         results = {}
+        for output in model_outputs:
+            results.update(output)
+        self._save_stage_output(stage_num, str(results), self.output_dir, self.timestamp, results, input_data)
+        return results
         
-        # Create models
-        models = []
-        for model_num in range(1, 4):
-            model = ModelFactory.create_model(stage_num, model_num)
-            models.append(model)
-            
+    def _save_final_stage(self, stage_num: int, results: Dict[str, str], input_data: Dict[str, str]) -> str:
+        """Save the report of a single-model stage and return its output."""
+        self._save_stage_output(stage_num, str(results), self.output_dir, self.timestamp, results, input_data)
+        return next(iter(results.values()))
+        
+    def run_stage1(self, image: Union[str, ImageAsset]) -> Dict[str, str]:
+        """Run Stage 1 - Initial Transcription."""
         # Run transcriptions in parallel
-        for i, model in enumerate(models, 1):
-            try:
-                result = model.generate_transcription(image_base64, self.token_tracker)
-                key = f"Stage {stage_num} Model {i} - {model.provider.title()} {model.model_name} Transcription"
-                results[key] = result
-            except Exception as e:
-                raise RuntimeError(f"Failed to complete Stage {stage_num} Model {i}: {str(e)}")
-                
-        # Save stage output
-        self._save_stage_output(stage_num, str(results), self.output_dir, self.timestamp, results)
-        return results
+        results = self._run_models_in_parallel(1, (as_image_asset(image),))
+        return self._save_parallel_stage(1, [results])
+        
+    def run_stage2(self, image: Union[str, ImageAsset]) -> Dict[str, str]:
+        """Run Stage 2 - Secondary Transcription."""
+        # Run transcriptions in parallel
+        results = self._run_models_in_parallel(2, (as_image_asset(image),))
+        return self._save_parallel_stage(2, [results])
         
     def run_stage3(self, stage1_results: Dict[str, str], stage2_results: Dict[str, str]) -> Dict[str, str]:
         """Run Stage 3 - Initial Review."""
-        stage_num = 3
-        results = {}
-        
-        # Create models
-        models = []
-        for model_num in range(1, 4):
-            model = ModelFactory.create_model(stage_num, model_num)
-            models.append(model)
-            
-        # Run analyses in parallel
-        for i, model in enumerate(models, 1):
-            try:
-                # Create context with corresponding Stage 1 and 2 results
-                context = {}
-                for stage in [1, 2]:
-                    stage_config = get_model_init_params(stage, i)
-                    key = f"Stage {stage} Model {i} - {stage_config['provider'].title()} {stage_config['name']} Transcription"
-                    results_dict = stage1_results if stage == 1 else stage2_results
-                    if key in results_dict:
-                        context[key] = results_dict[key]
-                
-                result = model.analyze_context(context, self.token_tracker)
-                key = f"Stage {stage_num} Model {i} - {model.provider.title()} {model.model_name} Review"
-                results[key] = result
-            except Exception as e:
-                raise RuntimeError(f"Failed to complete Stage {stage_num} Model {i}: {str(e)}")
-                
-        # Save stage output
+        # Each model picks its corresponding Stage 1 and 2 results from the context
         input_data = {**stage1_results, **stage2_results}
-        self._save_stage_output(stage_num, str(results), self.output_dir, self.timestamp, results, input_data)
-        return results
+        results = self._run_models_in_parallel(3, (input_data,))
+        return self._save_parallel_stage(3, [results], input_data)
         
     def run_stage4(self, stage3_results: Dict[str, str]) -> Dict[str, str]:
         """Run Stage 4 - Comprehensive Review."""
-        stage_num = 4
-        results = {}
-        
-        # Create models
-        models = []
-        for model_num in range(1, 4):
-            model = ModelFactory.create_model(stage_num, model_num)
-            models.append(model)
-            
         # Run comprehensive reviews in parallel
-        for i, model in enumerate(models, 1):
-            try:
-                # Get Stage 3 reviews using actual Stage 3 model configs
-                stage3_reviews = {}
-                for model_num in range(1, 4):
-                    stage3_config = get_model_init_params(3, model_num)
-                    key = f"Stage 3 Model {model_num} - {stage3_config['provider'].title()} {stage3_config['name']} Review"
-                    if key in stage3_results:
-                        stage3_reviews[key] = stage3_results[key]
-                
-                result = model.comprehensive_review(stage3_reviews, self.token_tracker)
-                key = f"Stage {stage_num} Model {i} - {model.provider.title()} {model.model_name} Review"
-                results[key] = result
-            except Exception as e:
-                raise RuntimeError(f"Failed to complete Stage {stage_num} Model {i}: {str(e)}")
-                
-        # Save stage output
-        self._save_stage_output(stage_num, str(results), self.output_dir, self.timestamp, results, stage3_results)
-        return results
+        results = self._run_models_in_parallel(4, (stage3_results,))
+        return self._save_parallel_stage(4, [results], stage3_results)
         
     def run_stage5(self, stage4_results: Dict[str, str]) -> str:
         """Run Stage 5 - Final Transcription."""
-        stage_num = 5
-        
-        # Create model
-        model = ModelFactory.create_model(stage_num, 1)
-        
-        try:
-            # Get Stage 4 reviews using actual Stage 4 model configs
-            stage4_reviews = {}
-            for model_num in range(1, 4):
-                stage4_config = get_model_init_params(4, model_num)
-                key = f"Stage 4 Model {model_num} - {stage4_config['provider'].title()} {stage4_config['name']} Review"
-                if key in stage4_results:
-                    stage4_reviews[key] = stage4_results[key]
-
-            result = model.generate_final_transcription(stage4_reviews, self.token_tracker)
-            key = f"Stage {stage_num} Model 1 - {model.provider.title()} {model.model_name} Final Transcription"
-            results = {key: result}
-        except Exception as e:
-            raise RuntimeError(f"Failed to complete Stage {stage_num}: {str(e)}")
-            
-        # Save stage output
-        self._save_stage_output(stage_num, str(results), self.output_dir, self.timestamp, results, stage4_results)
-        return result
+        results = self._run_stage_model(5, 1, (stage4_results,))
+        return self._save_final_stage(5, results, stage4_results)
         
     def run_stage6(self, final_transcription: str) -> str:
         """Run Stage 6 - Add Punctuation."""
-        stage_num = 6
+        results = self._run_stage_model(6, 1, (final_transcription,))
+        return self._save_final_stage(6, results, {"Final Transcription": final_transcription})
         
-        # Create model
-        model = ModelFactory.create_model(stage_num, 1)
+    def run_stage7(self, punctuated_text: str) -> str:
+        """Run Stage 7 - Translation."""
+        results = self._run_stage_model(7, 1, (punctuated_text,))
+        return self._save_final_stage(7, results, {"Punctuated Text": punctuated_text})
         
-        try:
-            # Get Stage 5 final transcription using actual Stage 5 model config
-            stage5_config = get_model_init_params(5, 1)
-            stage5_key = f"Stage 5 Model 1 - {stage5_config['provider'].title()} {stage5_config['name']} Final Transcription"
-            if stage5_key in final_transcription:
-                final_text = final_transcription[stage5_key]
-            else:
-                final_text = final_transcription  # Fallback if string was passed directly
-
-            result = model.add_punctuation(final_text, self.token_tracker)
-            key = f"Stage {stage_num} Model 1 - {model.provider.title()} {model.model_name} Punctuated Transcription"
-            results = {key: result}
-        except Exception as e:
-            raise RuntimeError(f"Failed to complete Stage {stage_num}: {str(e)}")
+    def run_stage8(self, chinese_text: str, english_text: str) -> str:
+        """Run Stage 8 - Historical Commentary."""
+        results = self._run_stage_model(8, 1, (chinese_text, english_text))
+        input_data = {
+            "Chinese Text": chinese_text,
+            "English Translation": english_text
+        }
+        return self._save_final_stage(8, results, input_data)
+        
+    def _release_image(self, image: ImageAsset):
+        """
+        Drop an image and everything derived from it once Stages 1-2 are done.
+        
+        Args:
+            image: The image being processed
+        """
+        normalizer = get_image_normalizer(self.config.image_format, self.config.image_quality)
+        tiler = get_image_tiler(self.config.tile_max_count, self.config.tile_overlap, self.config.tile_min_aspect)
+        for asset in [image] + tiler.discard(image.digest):
+            normalizer.discard(asset.digest)
+            asset.release()
             
-        # Save stage output
-        input_data = {"Final Transcription": final_transcription}
-        self._save_stage_output(stage_num, str(results), self.output_dir, self.timestamp, results, input_data)
-        return result
+    def _build_consensus(self, transcriptions: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Build the local consensus of the Stage 1-2 transcriptions.
         
-    def run_stage7(self, punctuated_text: str) -> str:
-        """Run Stage 7 - Translation."""
-        stage_num = 7
+        The consensus, its per-character confidence and the disputed spans are
+        saved to consensus_{timestamp}.json in the run directory.
         
-        # Create model
-        model = ModelFactory.create_model(stage_num, 1)
+        Args:
+            transcriptions: Every Stage 1-2 transcription, by result key
+            
+        Returns:
+            ConsensusResult data (see ConsensusResult.to_dict), with
+            'skip_reviews' set if every aligned position is agreed on by at
+            least the configured share of the transcriptions
+        """
+        with self.tracer.span('consensus'):
+            result = build_consensus(transcriptions)
+        # The mean agreement hides tied positions, so the weakest position decides
+        data = dict(result.to_dict(), skip_reviews=result.min_support >= self.config.consensus_threshold)
+        if data['skip_reviews']:
+            action = "skipping Stages 3-4"
+        else:
+            action = f"reviewing {len(result.disputed)} disputed spans"
+        print(f"- Local consensus: {result.agreement:.1%} mean agreement, "
+              f"{result.min_support:.0%} at the least agreed position; {action}")
+        if self.output_dir:
+            filepath = os.path.join(self.output_dir, f"consensus_{self.timestamp}.json")
+            with open(filepath, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        return data
+        
+    def _consensus_input(self, consensus: Dict[str, Any]) -> Dict[str, str]:
+        """Get the Stage 3 or Stage 5 input of a local consensus (see _build_consensus)."""
+        return {CONSENSUS_KEY: format_consensus(ConsensusResult.from_dict(consensus))}
+        
+    def _build_stage_graph(self, image: ImageAsset, use_async: bool = False) -> StageGraph:
+        """
+        Declare the pipeline as a graph of stage tasks.
+        
+        Task outputs:
+        - stageN.modelM: {result_key: output} for one model of a stage
+        - stage1-stage4: merged results dict (saved to the stage report)
+        - stage5-stage8: the stage's final text (saved to the stage report)
+        - consensus: local consensus data, with local consensus enabled
+        
+        Stages 1 and 2 only need the image, so they run together. Stage 3 Model N
+        only needs Stage 1 Model N and Stage 2 Model N, so each review starts as
+        soon as its own pair of transcriptions exists. Stages 4-8 follow the
+        sequential dependencies of the original pipeline. Once every
+        transcription is done the image is released, so a run holds the
+        encoded image only while it is needed.
+        
+        With local consensus enabled, Stage 3 waits for the consensus of all
+        six transcriptions and reviews only its disputed spans. If the
+        consensus is strong enough, the Stage 3-4 tasks output None without
+        calling their models and Stage 5 works from the consensus.
         
-        try:
-            # Get Stage 6 punctuated text using actual Stage 6 model config
-            stage6_config = get_model_init_params(6, 1)
-            stage6_key = f"Stage 6 Model 1 - {stage6_config['provider'].title()} {stage6_config['name']} Punctuated Transcription"
-            if stage6_key in punctuated_text:
-                text_to_translate = punctuated_text[stage6_key]
+        Args:
+            image: The image to process
+            use_async: Build model tasks as coroutines for StageGraph.run_async
+            
+        Returns:
+            StageGraph ready to run
+        """
+        graph = StageGraph()
+        model_nums = range(1, 4)
+        
+        def add_model_task(stage_num, model_num, get_args, deps=(), skip=None):
+            if use_async:
+                async def _task(inputs):
+                    if skip is not None and skip(inputs):
+                        return None
+                    return await self._run_stage_model_async(stage_num, model_num, get_args(inputs))
             else:
-                text_to_translate = punctuated_text  # Fallback if string was passed directly
-
-            result = model.translate_to_english(text_to_translate, self.token_tracker)
-            key = f"Stage {stage_num} Model 1 - {model.provider.title()} {model.model_name} Translation"
-            results = {key: result}
-        except Exception as e:
-            raise RuntimeError(f"Failed to complete Stage {stage_num}: {str(e)}")
+                def _task(inputs):
+                    if skip is not None and skip(inputs):
+                        return None
+                    return self._run_stage_model(stage_num, model_num, get_args(inputs))
+            provider = self.config.get_model_params(stage_num, model_num)['provider']
+            graph.add(f"stage{stage_num}.model{model_num}", _task, deps=deps, provider=provider)
+        
+        def add_parallel_report(stage_num, input_stages=(), get_input_data=None):
+            def _task(inputs):
+                model_outputs = [inputs[f"stage{stage_num}.model{n}"] for n in model_nums]
+                if any(output is None for output in model_outputs):
+                    # The stage was skipped
+                    return None
+                if get_input_data is not None:
+                    input_data = get_input_data(inputs)
+                else:
+                    input_data = {}
+                    for name in input_stages:
+                        input_data.update(inputs[name])
+                return self._save_parallel_stage(stage_num, model_outputs, input_data or None)
+            deps = tuple(f"stage{stage_num}.model{n}" for n in model_nums) + tuple(input_stages)
+            graph.add(f"stage{stage_num}", _task, deps=deps)
+        
+        def add_final_report(stage_num, get_input_data, input_stages):
+            def _task(inputs):
+                return self._save_final_stage(stage_num, inputs[f"stage{stage_num}.model1"], get_input_data(inputs))
+            graph.add(f"stage{stage_num}", _task, deps=(f"stage{stage_num}.model1",) + tuple(input_stages))
+        
+        # Stages 1-2: Transcription (image only)
+        for stage_num in (1, 2):
+            for n in model_nums:
+                add_model_task(stage_num, n, lambda inputs: (image,))
+            add_parallel_report(stage_num)
+        transcription_tasks = tuple(f"stage{stage_num}.model{n}" for stage_num in (1, 2) for n in model_nums)
+        graph.add("release_image", lambda inputs: self._release_image(image), deps=transcription_tasks)
+        
+        # Stage 3: Initial Review (per model number, or of the consensus's disputed spans)
+        if self.config.consensus:
+            graph.add("consensus", lambda inputs: self._build_consensus({
+                key: text for name in transcription_tasks for key, text in inputs[name].items()
+            }), deps=transcription_tasks)
+            skip_reviews = lambda inputs: inputs["consensus"]["skip_reviews"]
+            get_consensus_input = lambda inputs: self._consensus_input(inputs["consensus"])
+            for n in model_nums:
+                add_model_task(3, n, lambda inputs: (get_consensus_input(inputs),), ("consensus",), skip=skip_reviews)
+            add_parallel_report(3, ("consensus",), get_consensus_input)
+        else:
+            for n in model_nums:
+                deps = (f"stage1.model{n}", f"stage2.model{n}")
+                add_model_task(3, n, lambda inputs, deps=deps: ({**inputs[deps[0]], **inputs[deps[1]]},), deps)
+            add_parallel_report(3, ("stage1", "stage2"))
+        
+        # Stage 4: Comprehensive Review (all Stage 3 reviews)
+        for n in model_nums:
+            add_model_task(4, n, lambda inputs: (inputs["stage3"],), ("stage3",), skip=lambda inputs: inputs["stage3"] is None)
+        add_parallel_report(4, ("stage3",))
+        
+        # Stages 5-8: Final processing (sequential)
+        def get_stage5_input(inputs):
+            # Without Stage 4 reviews, Stage 5 works from the consensus
+            if inputs["stage4"] is None:
+                return self._consensus_input(inputs["consensus"])
+            return inputs["stage4"]
+        stage5_deps = ("stage4", "consensus") if self.config.consensus else ("stage4",)
+        add_model_task(5, 1, lambda inputs: (get_stage5_input(inputs),), stage5_deps)
+        add_final_report(5, get_stage5_input, stage5_deps)
+        
+        add_model_task(6, 1, lambda inputs: (inputs["stage5"],), ("stage5",))
+        add_final_report(6, lambda inputs: {"Final Transcription": inputs["stage5"]}, ("stage5",))
+        
+        add_model_task(7, 1, lambda inputs: (inputs["stage6"],), ("stage6",))
+        add_final_report(7, lambda inputs: {"Punctuated Text": inputs["stage6"]}, ("stage6",))
+        
+        add_model_task(8, 1, lambda inputs: (inputs["stage6"], inputs["stage7"]), ("stage6", "stage7"))
+        add_final_report(8, lambda inputs: {
+            "Chinese Text": inputs["stage6"],
+            "English Translation": inputs["stage7"]
+        }, ("stage6", "stage7"))
+        
+        return graph
+        
+    def _prepare_run(self, token_tracker: Optional[TokenTracker] = None):
+        """Adopt the caller's token tracker and make sure an output directory exists."""
+        # Use provided token tracker if available
+        if token_tracker:
+            self.token_tracker = token_tracker
             
-        # Save stage output
-        input_data = {"Punctuated Text": punctuated_text}
-        self._save_stage_output(stage_num, str(results), self.output_dir, self.timestamp, results, input_data)
-        return result
+        # Count what the interrupted run already paid for
+        if self._resumed_usage:
+            replay_usage(self.token_tracker, self._resumed_usage)
+            self._resumed_usage = []
+            
+        # Create output directory if not initialized
+        if not self.output_dir:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+            self.initialize_run(f"output/run_{timestamp}")
+            
+    def _finish_run(self, outputs: Dict[str, Any]) -> Dict[str, str]:
+        """Write the run's final reports and collect its outputs."""
+        final_transcription = outputs['stage5']
+        punctuated_text = outputs['stage6']
+        translation = outputs['stage7']
+        commentary = outputs['stage8']
+        
+        # Generate final summary report
+        self._save_summary_report()
+        
+        # Generate final presentation report
+        self._save_presentation_report(
+            punctuated_text=punctuated_text,
+            translation=translation,
+            commentary=commentary
+        )
+        
+        return {
+            'final_transcription': final_transcription,
+            'punctuated_text': punctuated_text,
+            'translation': translation,
+            'commentary': commentary
+        }
         
-    def process_image(self, image_base64: str, token_tracker: Optional[TokenTracker] = None) -> Dict[str, str]:
+    def process_image(self, image: Union[str, ImageAsset], token_tracker: Optional[TokenTracker] = None) -> Dict[str, str]:
         """
         Process an image through all stages of the pipeline.
         
         Args:
-            image_base64: Base64 encoded image string
+            image: ImageAsset, or base64 encoded image string
             token_tracker: Optional token tracker for monitoring usage
             
         Returns:
@@ -340,57 +679,59 @@ class ModelManager:
             - translation: English translation
             - commentary: Historical commentary
         """
-        # Use provided token tracker if available
-        if token_tracker:
-            self.token_tracker = token_tracker
-            
-        # Create output directory if not initialized
-        if not self.output_dir:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            self.initialize_run(f"output/run_{timestamp}")
+        self._prepare_run(token_tracker)
         try:
-            # Stage 1: Initial Transcription
-            stage1_results = self.run_stage1(image_base64)
-            
-            # Stage 2: Secondary Transcription
-            stage2_results = self.run_stage2(image_base64)
-            
-            # Stage 3: Initial Review
-            stage3_results = self.run_stage3(stage1_results, stage2_results)
-            
-            # Stage 4: Comprehensive Review
-            stage4_results = self.run_stage4(stage3_results)
-            
-            # Stage 5: Final Transcription
-            final_transcription = self.run_stage5(stage4_results)
-            
-            # Stage 6: Add Punctuation
-            punctuated_text = self.run_stage6(final_transcription)
-            
-            # Stage 7: Translation
-            translation = self.run_stage7(punctuated_text)
-            
-            # Stage 8: Historical Commentary
-            commentary = self.run_stage8(punctuated_text, translation)
+            # Run all stages as a dependency graph so independent work overlaps
+            outputs = self._build_stage_graph(as_image_asset(image)).run(
+                self._get_executor(), self._limiter, **self._checkpoint_args()
+            )
+            return self._finish_run(outputs)
+        except Exception as e:
+            raise RuntimeError(f"Error processing image: {str(e)}")
+        finally:
+            self._save_trace()
+            self.close()
             
-            # Generate final summary report
-            self._save_summary_report()
+    async def process_image_async(self, image: Union[str, ImageAsset], token_tracker: Optional[TokenTracker] = None) -> Dict[str, str]:
+        """
+        Process an image through all stages on the running event loop.
+        
+        Provider calls use the SDKs' async clients, so many images can share one
+        event loop without a thread per in-flight request.
+        
+        Args:
+            image: ImageAsset, or base64 encoded image string
+            token_tracker: Optional token tracker for monitoring usage
             
-            # Generate final presentation report
-            self._save_presentation_report(
-                punctuated_text=punctuated_text,
-                translation=translation,
-                commentary=commentary
+        Returns:
+            Dict containing all final outputs (see process_image)
+        """
+        self._prepare_run(token_tracker)
+        try:
+            outputs = await self._build_stage_graph(as_image_asset(image), use_async=True).run_async(
+                self._limiter, **self._checkpoint_args()
             )
-            
-            return {
-                'final_transcription': final_transcription,
-                'punctuated_text': punctuated_text,
-                'translation': translation,
-                'commentary': commentary
-            }
+            return self._finish_run(outputs)
         except Exception as e:
             raise RuntimeError(f"Error processing image: {str(e)}")
+        finally:
+            self._save_trace()
+            
+    def _save_trace(self):
+        """
+        Save the run's latency spans as Chrome trace-event JSON.
+        
+        The file opens in chrome://tracing or https://ui.perfetto.dev. It is
+        written for failed runs too, to show where the time went.
+        """
+        if not self.output_dir or not self.timestamp:
+            return
+        filepath = os.path.join(self.output_dir, f"trace_{self.timestamp}.json")
+        try:
+            self.tracer.export_chrome_trace(filepath)
+            print(f"- Latency trace saved to: {filepath}")
+        except OSError as e:
+            print(f"Warning: Could not save latency trace: {str(e)}")
             
     def _save_presentation_report(self, punctuated_text: str, translation: str, commentary: str):
         """Generate and save a final presentation report in markdown format."""
@@ -431,7 +772,6 @@ class ModelManager:
         total_cost = 0.0
         
         for stage_num in range(1, 9):
-            model = ModelFactory.create_model(stage_num, 1)  # Use first model's rates
             stage_metrics = self.token_tracker.get_stage_metrics(f"Stage {stage_num}")
             if stage_metrics:
                 total_input_tokens += stage_metrics['input_tokens']
@@ -540,7 +880,7 @@ class ModelManager:
             # Add processing time summary
             f.write("## Time Summary\n\n")
             # Format processing times
-            avg_time = total_processing_time / len(stages)
+            avg_time = total_processing_time / max(len(stages), 1)
             avg_minutes = int(avg_time // 60)
             avg_seconds = avg_time % 60
             avg_time_str = f"{avg_minutes}m {avg_seconds:.2f}s"
@@ -548,45 +888,39 @@ class ModelManager:
             f.write(f"- Total Processing Time: {time_str}\n")
             f.write(f"- Average Time per Stage: {avg_time_str}\n\n")
             
+            # Add per-stage latency from the run's trace
+            latency = self.tracer.stage_latency()
+            if latency:
+                f.write("## Stage Latency\n\n")
+                f.write("Wall time runs from a stage's first model call to its report being written; ")
+                f.write("stages overlap where their inputs allow. See the trace file for the full timeline.\n\n")
+                f.write("| Stage | Wall Time | Calls | Slowest Call | Mean Time to First Token | Report Write |\n")
+                f.write("|-------|-----------|-------|--------------|--------------------------|--------------|\n")
+                for stage_num, stage_latency in latency.items():
+                    ttft = stage_latency['mean_ttft']
+                    ttft_str = f"{ttft:.2f}s" if ttft is not None else "-"
+                    f.write(
+                        f"| Stage {stage_num} | {stage_latency['wall']:.2f}s | {stage_latency['calls']} | "
+                        f"{stage_latency['slowest_call']:.2f}s | {ttft_str} | {stage_latency['report']:.2f}s |\n"
+                    )
+                f.write("\n")
+            
             # Add token usage summary
             f.write("## Token Usage Summary\n\n")
             f.write(f"- Total Input Tokens: {total_input_tokens:,}\n")
             f.write(f"- Total Output Tokens: {total_output_tokens:,}\n")
-            f.write(f"- Total Tokens: {total_input_tokens + total_output_tokens:,}\n\n")
+            f.write(f"- Total Tokens: {total_input_tokens + total_output_tokens:,}\n")
+            grand_total = self.token_tracker.grand_total
+            if grand_total.cache_read_tokens or grand_total.cache_write_tokens:
+                f.write(f"- Input Tokens Read from Provider Prompt Caches: {grand_total.cache_read_tokens:,}\n")
+                f.write(f"- Input Tokens Written to Provider Prompt Caches: {grand_total.cache_write_tokens:,}\n")
+            f.write("\n")
             
             # Add cost summary
             f.write("## Cost Summary\n\n")
             f.write(f"- Total Cost: ${total_cost:.4f}\n")
-            f.write(f"- Average Cost per Stage: ${(total_cost / len(stages)):.4f}\n")
-            f.write(f"- Cost per 1K Tokens: ${(total_cost * 1000 / (total_input_tokens + total_output_tokens)):.4f}\n")
-            
-    def run_stage8(self, chinese_text: str, english_text: str) -> str:
-        """Run Stage 8 - Historical Commentary."""
-        stage_num = 8
-        
-        # Create model
-        model = ModelFactory.create_model(stage_num, 1)
-        
-        try:
-            # Get Stage 6 and 7 texts using actual model configs
-            stage6_config = get_model_init_params(6, 1)
-            stage7_config = get_model_init_params(7, 1)
-            stage6_key = f"Stage 6 Model 1 - {stage6_config['provider'].title()} {stage6_config['name']} Punctuated Transcription"
-            stage7_key = f"Stage 7 Model 1 - {stage7_config['provider'].title()} {stage7_config['name']} Translation"
-
-            chinese = chinese_text[stage6_key] if stage6_key in chinese_text else chinese_text
-            english = english_text[stage7_key] if stage7_key in english_text else english_text
-
-            result = model.generate_commentary(chinese, english, self.token_tracker)
-            key = f"Stage {stage_num} Model 1 - {model.provider.title()} {model.model_name} Commentary"
-            results = {key: result}
-        except Exception as e:
-            raise RuntimeError(f"Failed to complete Stage {stage_num}: {str(e)}")
-            
-        # Save stage output
-        input_data = {
-            "Chinese Text": chinese_text,
-            "English Translation": english_text
-        }
-        self._save_stage_output(stage_num, str(results), self.output_dir, self.timestamp, results, input_data)
-        return result
+            f.write(f"- Average Cost per Stage: ${(total_cost / max(len(stages), 1)):.4f}\n")
+            f.write(f"- Cost per 1K Tokens: ${(total_cost * 1000 / max(total_input_tokens + total_output_tokens, 1)):.4f}\n")
+            hedging = self.token_tracker.get_hedge_summary()
+            if hedging:
+                f.write(f"- Hedged Request Cost: ${hedging['cost']:.4f} ({hedging['hedges']} hedged calls, not included above)\n")
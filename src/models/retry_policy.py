@@ -0,0 +1,225 @@
+"""
+Classification and retrying of failed provider calls.
+
+Provider errors are sorted into kinds. Transient errors (timeouts, dropped
+connections, 5xx) and rate limits are retried with exponential backoff and
+full jitter, waiting at least as long as a Retry-After header asks, until the
+attempts or the call's deadline run out. Context overflow, auth and
+bad-request errors will fail the same way every time, and calls refused by an
+open circuit breaker would be refused again, so they are not retried and go
+straight to the fallback model.
+
+Errors are recognised by their HTTP status and class name rather than by SDK
+exception type, so no provider SDK has to be imported here.
+"""
+import time
+import random
+import asyncio
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from utils.circuit_breaker import CircuitOpenError
+
+TRANSIENT = 'transient'
+RATE_LIMIT = 'rate_limit'
+CONTEXT_OVERFLOW = 'context_overflow'
+AUTH = 'auth'
+BAD_REQUEST = 'bad_request'
+CIRCUIT_OPEN = 'circuit_open'
+
+# Error kinds worth sending again unchanged
+RETRYABLE_KINDS = (TRANSIENT, RATE_LIMIT)
+
+# Phrases providers use when a prompt is longer than the model's context window
+CONTEXT_OVERFLOW_PHRASES = (
+    'context_length_exceeded',
+    'context length',
+    'context window',
+    'maximum context',
+    'prompt is too long',
+    'input is too long',
+    'too many tokens',
+    'exceeds the maximum number of tokens',
+    'input token count'
+)
+
+# Class name fragments of network-level errors that carry no HTTP status
+TRANSIENT_NAME_FRAGMENTS = ('Timeout', 'Connection', 'Stalled', 'Disconnect', 'Unavailable')
+
+T = TypeVar('T')
+
+def get_status_code(error: BaseException) -> Optional[int]:
+    """Get the HTTP status of a provider error, if it has one."""
+    # OpenAI-compatible and Anthropic SDKs use status_code; google.api_core uses code
+    for name in ('status_code', 'code'):
+        value = getattr(error, name, None)
+        if isinstance(value, int) and 100 <= value < 600:
+            return value
+    value = getattr(getattr(error, 'response', None), 'status_code', None)
+    return value if isinstance(value, int) else None
+
+def classify_error(error: BaseException) -> str:
+    """
+    Classify a failed provider call.
+
+    Args:
+        error: Exception raised by the call
+
+    Returns:
+        One of TRANSIENT, RATE_LIMIT, CONTEXT_OVERFLOW, AUTH, BAD_REQUEST or CIRCUIT_OPEN
+    """
+    if isinstance(error, CircuitOpenError):
+        return CIRCUIT_OPEN
+    status = get_status_code(error)
+    message = str(error).lower()
+    if status == 429:
+        # Exhausted billing quota and requests larger than the whole per-minute quota never succeed on retry
+        if 'insufficient_quota' in message:
+            return AUTH
+        if 'request too large' in message:
+            return BAD_REQUEST
+        return RATE_LIMIT
+    if status in (401, 402, 403):
+        return AUTH
+    if status == 413 or (status in (400, 422) and any(phrase in message for phrase in CONTEXT_OVERFLOW_PHRASES)):
+        return CONTEXT_OVERFLOW
+    if status is not None and (status in (408, 409) or status >= 500):
+        return TRANSIENT
+    if status is not None:
+        return BAD_REQUEST
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return TRANSIENT
+    name = type(error).__name__
+    if any(fragment in name for fragment in TRANSIENT_NAME_FRAGMENTS):
+        return TRANSIENT
+    return BAD_REQUEST
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """
+    Get the wait a provider asked for in a Retry-After header.
+
+    Reads retry-after-ms (OpenAI) and retry-after, as seconds or an HTTP date.
+
+    Returns:
+        Seconds to wait, or None if the error carries no Retry-After
+    """
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        milliseconds = headers.get('retry-after-ms')
+        if milliseconds:
+            return max(0.0, float(milliseconds) / 1000)
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    When and how long to wait before sending a failed call again.
+
+    Attributes:
+        max_attempts: Most times a call is sent, including the first
+        base_delay: Backoff ceiling of the first retry in seconds; it doubles per retry
+        max_delay: Largest backoff ceiling in seconds
+        deadline: Seconds after the first attempt beyond which no retry starts
+    """
+    max_attempts: int = 4
+    base_delay: float = 1.0
+    max_delay: float = 30.0
+    deadline: float = 300.0
+
+    def get_delay(self, error: BaseException, attempt: int, elapsed: float) -> Optional[float]:
+        """
+        Get the wait before retrying a failed attempt.
+
+        Args:
+            error: Exception raised by the attempt
+            attempt: Number of the attempt that failed (1 for the first)
+            elapsed: Seconds since the first attempt started
+
+        Returns:
+            Seconds to wait, or None if the call should not be retried
+        """
+        if attempt >= self.max_attempts or classify_error(error) not in RETRYABLE_KINDS:
+            return None
+        # Full jitter spreads out the retries of calls that failed together
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if elapsed + delay > self.deadline:
+            return None
+        return delay
+
+def _log_retry(describe: str, error: BaseException, attempt: int, policy: RetryPolicy, delay: float):
+    print(
+        f"{describe}: {classify_error(error)} error ({str(error)[:200]}); "
+        f"retrying in {delay:.1f}s (attempt {attempt + 1}/{policy.max_attempts})"
+    )
+
+def call_with_retries(
+    call: Callable[[], T],
+    policy: RetryPolicy,
+    describe: str,
+    on_retry: Optional[Callable[[BaseException, float], Any]] = None
+) -> T:
+    """
+    Run a call, retrying it according to a policy.
+
+    Args:
+        call: Function making one attempt
+        policy: Retry policy
+        describe: Name of the call for log messages (e.g. provider and model)
+        on_retry: Optional callback given the error and delay before each retry
+
+    Returns:
+        The result of the first successful attempt
+
+    Raises:
+        Exception: The error of the last attempt, once retrying stops
+    """
+    started = time.monotonic()
+    attempt = 1
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            delay = policy.get_delay(e, attempt, time.monotonic() - started)
+            if delay is None:
+                raise
+            _log_retry(describe, e, attempt, policy, delay)
+            if on_retry is not None:
+                on_retry(e, delay)
+            time.sleep(delay)
+            attempt += 1
+
+async def call_with_retries_async(
+    call: Callable[[], Awaitable[T]],
+    policy: RetryPolicy,
+    describe: str,
+    on_retry: Optional[Callable[[BaseException, float], Any]] = None
+) -> T:
+    """Async variant of call_with_retries; call returns a new awaitable per attempt."""
+    started = time.monotonic()
+    attempt = 1
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            delay = policy.get_delay(e, attempt, time.monotonic() - started)
+            if delay is None:
+                raise
+            _log_retry(describe, e, attempt, policy, delay)
+            if on_retry is not None:
+                on_retry(e, delay)
+            await asyncio.sleep(delay)
+            attempt += 1
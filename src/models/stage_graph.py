@@ -0,0 +1,227 @@
+"""
+Dependency-graph scheduler for pipeline stages.
+
+The pipeline is declared as a set of tasks, each naming the outputs it
+depends on. The executor starts every task as soon as all of its inputs
+exist, so independent work (e.g. Stage 1 and Stage 2, or each Stage 3
+review and its own pair of transcriptions) overlaps and per-image latency
+follows the critical path rather than the sum of all stages.
+"""
+import asyncio
+import threading
+from concurrent.futures import Executor, Future, FIRST_COMPLETED, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import sys
+import os
+
+# Add the src directory to the Python path
+current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
+
+from utils.concurrency import ProviderLimiter
+
+@dataclass(frozen=True)
+class StageTask:
+    """
+    A single node in the stage graph.
+
+    Attributes:
+        name: Unique task name, also the name of its output
+        func: Function called with a dict of dependency outputs keyed by task name
+        deps: Names of the tasks whose outputs this task needs
+        provider: Provider the task calls, used for per-provider concurrency caps
+    """
+    name: str
+    func: Callable[[Dict[str, Any]], Any]
+    deps: Tuple[str, ...] = ()
+    provider: Optional[str] = None
+
+class StageGraph:
+    """A declared set of stage tasks and the executor that runs them."""
+
+    def __init__(self):
+        """Initialize an empty graph."""
+        self.tasks: Dict[str, StageTask] = {}
+
+    def add(self, name: str, func: Callable[[Dict[str, Any]], Any], deps: Tuple[str, ...] = (), provider: Optional[str] = None) -> StageTask:
+        """
+        Add a task to the graph.
+
+        Args:
+            name: Unique task name
+            func: Function called with a dict of dependency outputs
+            deps: Names of tasks this task depends on
+            provider: Optional provider name for concurrency limiting
+
+        Returns:
+            The added task
+
+        Raises:
+            ValueError: If a task with the same name already exists
+        """
+        if name in self.tasks:
+            raise ValueError(f"Duplicate task name: {name}")
+        task = StageTask(name=name, func=func, deps=tuple(deps), provider=provider)
+        self.tasks[name] = task
+        return task
+
+    def validate(self) -> List[str]:
+        """
+        Check that all dependencies exist and the graph has no cycles.
+
+        Returns:
+            Task names in a valid topological order
+
+        Raises:
+            ValueError: If a dependency is unknown or a cycle exists
+        """
+        for task in self.tasks.values():
+            for dep in task.deps:
+                if dep not in self.tasks:
+                    raise ValueError(f"Task {task.name} depends on unknown task {dep}")
+
+        order = []
+        remaining = {name: set(task.deps) for name, task in self.tasks.items()}
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Cycle detected among tasks: {', '.join(sorted(remaining))}")
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+    def _seed(self, completed: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], Dict[str, StageTask]]:
+        """Split the graph into outputs already known and tasks still to run."""
+        outputs = {name: output for name, output in (completed or {}).items() if name in self.tasks}
+        waiting = {name: task for name, task in self.tasks.items() if name not in outputs}
+        return outputs, waiting
+
+    def run(
+        self,
+        executor: Executor,
+        limiter: ProviderLimiter,
+        completed: Optional[Dict[str, Any]] = None,
+        on_complete: Optional[Callable[[str, Any], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run every task once its dependencies have completed.
+
+        Args:
+            executor: Executor used to run tasks
+            limiter: Per-provider concurrency limiter for tasks that call a provider
+            completed: Optional outputs of tasks finished by an earlier run; these
+                tasks are skipped and their outputs fed to their dependents
+            on_complete: Optional callback invoked with (name, output) as each
+                task finishes, e.g. to checkpoint it
+
+        Returns:
+            Dict mapping task names to their outputs
+
+        Raises:
+            Exception: The first exception raised by any task; tasks that have
+                not started yet are cancelled
+        """
+        self.validate()
+        cancel_event = threading.Event()
+        outputs, waiting = self._seed(completed)
+        running: Dict[Future, str] = {}
+
+        def _call(task: StageTask, inputs: Dict[str, Any]) -> Any:
+            if task.provider is None:
+                return task.func(inputs)
+            with limiter.slot(task.provider, cancel_event):
+                return task.func(inputs)
+
+        def _submit_ready():
+            for name, task in list(waiting.items()):
+                if all(dep in outputs for dep in task.deps):
+                    inputs = {dep: outputs[dep] for dep in task.deps}
+                    running[executor.submit(_call, task, inputs)] = name
+                    del waiting[name]
+
+        _submit_ready()
+        while running:
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                error = future.exception()
+                if error is not None:
+                    cancel_event.set()
+                    for other in running:
+                        other.cancel()
+                    raise error
+                outputs[name] = future.result()
+                if on_complete is not None:
+                    on_complete(name, outputs[name])
+            _submit_ready()
+
+        return outputs
+
+    async def run_async(
+        self,
+        limiter: ProviderLimiter,
+        completed: Optional[Dict[str, Any]] = None,
+        on_complete: Optional[Callable[[str, Any], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run every task on the current event loop once its dependencies complete.
+
+        Coroutine task functions are awaited directly; plain functions (such as
+        report writers) run in a worker thread so they do not block the loop.
+
+        Args:
+            limiter: Per-provider concurrency limiter for tasks that call a provider
+            completed: Optional outputs of tasks finished by an earlier run (see run)
+            on_complete: Optional callback invoked with (name, output) as each
+                task finishes
+
+        Returns:
+            Dict mapping task names to their outputs
+
+        Raises:
+            Exception: The first exception raised by any task; all other running
+                tasks are cancelled
+        """
+        self.validate()
+        outputs, waiting = self._seed(completed)
+        running: Dict[asyncio.Task, str] = {}
+
+        async def _invoke(task: StageTask, inputs: Dict[str, Any]) -> Any:
+            if asyncio.iscoroutinefunction(task.func):
+                return await task.func(inputs)
+            return await asyncio.to_thread(task.func, inputs)
+
+        async def _call(task: StageTask, inputs: Dict[str, Any]) -> Any:
+            if task.provider is None:
+                return await _invoke(task, inputs)
+            async with limiter.async_slot(task.provider):
+                return await _invoke(task, inputs)
+
+        def _submit_ready():
+            for name, task in list(waiting.items()):
+                if all(dep in outputs for dep in task.deps):
+                    inputs = {dep: outputs[dep] for dep in task.deps}
+                    running[asyncio.ensure_future(_call(task, inputs))] = name
+                    del waiting[name]
+
+        _submit_ready()
+        try:
+            while running:
+                done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    outputs[name] = future.result()
+                    if on_complete is not None:
+                        # Checkpoint writes are disk work, kept off the event loop
+                        await asyncio.to_thread(on_complete, name, outputs[name])
+                _submit_ready()
+        finally:
+            for future in running:
+                future.cancel()
+
+        return outputs
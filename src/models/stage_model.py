@@ -3,9 +3,13 @@ Stage-based Model Implementation
 """
 import os
 import sys
-from typing import Dict, Any, Optional
+import time
+import asyncio
+import threading
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Any, List, Optional, Tuple, Union
 from dotenv import load_dotenv
-import tiktoken
 
 # Add the src directory to the Python path
 current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -13,9 +17,27 @@ if current_dir not in sys.path:
     sys.path.append(current_dir)
 
 from models.model_interfaces import FinalStageModel
-from utils.token_counter import TokenTracker
+from models.client_registry import get_client_registry
+from models.usage_adapters import extract_usage
+from models.streaming import (
+    ProgressiveOutput, StreamAccumulator, consume_stream, consume_stream_async, stream_kwargs
+)
+from models.retry_policy import (
+    CONTEXT_OVERFLOW, TRANSIENT, RetryPolicy, call_with_retries, call_with_retries_async, classify_error, get_status_code
+)
+from models.hedging import HEDGE, PRIMARY, HedgeAttempt, get_latency_history
+from models.structured_reviews import REVIEW_STAGES, format_reviews
+from utils.token_counter import TokenTracker, get_token_counter
+from utils.tracing import Tracer
+from utils.rate_limiter import RateLimit, get_rate_limiter
+from utils.circuit_breaker import BreakerPolicy, get_circuit_breakers
+from utils.response_cache import ResponseCache, get_response_cache, make_cache_key
+from utils.image_utils import ImageAsset, NormalizedImage, as_image_asset, get_image_normalizer, passthrough_image
+from utils.image_tiling import get_image_tiler, stitch_transcriptions
+from utils.consensus import CONSENSUS_KEY
 from prompts.stage_prompts import Stage1, Stage2, Stage3, Stage4, Stage5, Stage6, Stage7, Stage8
-from config.config import get_model_init_params
+from prompts.prompt_registry import split_prompt
+from config.pipeline_config import PipelineConfig, get_pipeline_config
 
 class StageModel(FinalStageModel):
     """
@@ -37,60 +59,84 @@ class StageModel(FinalStageModel):
         'together': 'cl100k_base'  # Using same as others since it's Llama based
     }
 
+    # Rough token cost of an uploaded image, for estimates made before a call
+    IMAGE_TOKEN_ESTIMATE = 1000
+    
     # Models that don't support system messages
     NO_SYSTEM_MESSAGE_MODELS = ['o1-mini', 'o3-mini']
     
-    def __init__(self, provider: str, model_name: str, stage: int, model_num: int):
-        """Initialize model with provider and model name."""
+    # Models that don't support a JSON response mode
+    NO_JSON_MODE_MODELS = ['o1-mini', 'gemini-pro-vision']
+    
+    # Stage method implementing each stage
+    STAGE_METHODS = {
+        1: 'generate_transcription',
+        2: 'generate_transcription',
+        3: 'analyze_context',
+        4: 'comprehensive_review',
+        5: 'generate_final_transcription',
+        6: 'add_punctuation',
+        7: 'translate_to_english',
+        8: 'generate_commentary'
+    }
+    
+    def __init__(self, provider: str, model_name: str, stage: int, model_num: int, config: Optional[PipelineConfig] = None, stream_prefix: Optional[str] = None, tracer: Optional[Tracer] = None, queue_key: Optional[str] = None):
+        """
+        Initialize model with provider and model name.
+        
+        Args:
+            provider: Provider name
+            model_name: Model name
+            stage: Stage number (1-8)
+            model_num: Model number within the stage
+            config: Optional pipeline configuration (defaults to the process configuration)
+            stream_prefix: Optional path prefix of the files streamed text is
+                written to as it arrives (see _open_progressive_output)
+            tracer: Optional tracer recording the latency of this model's calls
+            queue_key: Run this model's calls belong to; calls waiting for
+                rate limit budget are served round robin across runs
+        """
         super().__init__(provider, model_name, stage, model_num)
+        self.config = config or get_pipeline_config()
+        self.stream_prefix = stream_prefix
+        self.tracer = tracer or Tracer()
+        self.queue_key = queue_key
+        self._fallback_model: Optional['StageModel'] = None
+        self._fallback_lock = threading.Lock()
+        self._stream_outputs: List[ProgressiveOutput] = []
+        self._stream_lock = threading.Lock()
         self._client = None
+        self._async_client = None
         self._encoder = None
         self._initialize_client()
         self._initialize_encoder()
         
     def _initialize_client(self):
-        """Initialize the appropriate API client based on provider."""
-        if self.provider == 'google':
-            import google.generativeai as genai
-            genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-            self._client = genai.GenerativeModel(self.model_name)
-            
-        elif self.provider == 'openai':
-            from openai import OpenAI
-            self._client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
-            
-        elif self.provider == 'groq':
-            from groq import Groq
-            self._client = Groq(api_key=os.getenv('GROQ_API_KEY'))
-            
-        elif self.provider == 'anthropic':
-            from anthropic import Anthropic
-            self._client = Anthropic(api_key=os.getenv('ANTHROPIC_API_KEY'))
-            
-        elif self.provider == 'openrouter':
-            from openai import OpenAI
-            self._client = OpenAI(
-                base_url="https://openrouter.ai/api/v1",
-                api_key=os.getenv('OPENROUTER_API_KEY')
+        """Get the shared API client for the current provider and model."""
+        with self.tracer.span('client_init', **self._span_tags()):
+            self._client = get_client_registry().get(
+                self.provider, self.model_name, api_key=self.config.get_api_key(self.provider)
             )
             
-        elif self.provider == 'together':
-            from together import Together
-            self._client = Together(api_key=os.getenv('TOGETHER_API_KEY'))
-            
-        else:
-            raise ValueError(f"Unsupported provider: {self.provider}")
-            
+    def _span_tags(self) -> Dict[str, Any]:
+        """Tags identifying this model's calls in the trace."""
+        return {
+            'stage': self.stage,
+            'model': self.model_num,
+            'provider': self.provider,
+            'model_name': self.model_name
+        }
+        
     def _initialize_encoder(self):
         """Initialize the token counting encoder."""
         encoder_name = self.ENCODERS.get(self.provider)
         if not encoder_name:
             raise ValueError(f"No encoder defined for provider: {self.provider}")
-        self._encoder = tiktoken.get_encoding(encoder_name)
+        self._encoder = get_token_counter(encoder_name)
         
     def _count_tokens(self, text: str) -> int:
         """Count tokens in a text string."""
-        return len(self._encoder.encode(text))
+        return self._encoder.count(text)
     
     def _extract_transcription_chars(self, text: str) -> int:
         """Extract and count characters from Chinese transcription sections."""
@@ -126,280 +172,1166 @@ class StageModel(FinalStageModel):
         # For stages 7-8, don't count characters as they don't produce Chinese transcriptions
         return 0
             
-    def _generate_content(self, prompt: str, image: Optional[str] = None) -> Dict[str, Any]:
+    def _get_async_client(self):
+        """Get the shared async API client for the current provider, looking it up on first use."""
+        if self._async_client is None:
+            self._async_client = get_client_registry().get(
+                self.provider, self.model_name, use_async=True, api_key=self.config.get_api_key(self.provider)
+            )
+        return self._async_client
+        
+    def _prepare_image(self, image: ImageAsset) -> NormalizedImage:
+        """
+        Get the image as it is uploaded to the current provider.
+        
+        Args:
+            image: Source image
+            
+        Returns:
+            NormalizedImage downscaled to the provider's limit and re-encoded,
+            or the source as read if normalization is disabled
         """
-        Generate content using the appropriate provider's API.
+        if not self.config.image_normalization:
+            return passthrough_image(image)
+        normalizer = get_image_normalizer(self.config.image_format, self.config.image_quality)
+        return normalizer.normalize(image, self.config.max_image_dimensions[self.provider])
+        
+    def _uses_cache_breakpoints(self) -> bool:
+        """Whether requests to the current model mark cacheable prefixes explicitly (Anthropic's cache_control)."""
+        return self.config.prompt_caching and (
+            self.provider == 'anthropic'
+            or (self.provider == 'openrouter' and self.model_name.startswith('anthropic/'))
+        )
+        
+    def _prompt_parts(self, prompt: str, upload: Optional[NormalizedImage] = None) -> List[Tuple[Union[str, NormalizedImage], bool]]:
+        """
+        Lay out a prompt and its image as the parts of a request.
+        
+        With prompt caching, the parts that repeat from call to call come
+        first so providers can cache them: the facts context, then the image
+        (the same in every Stage 1 and 2 call on a page), then the stage's
+        fixed instructions, and last the text that varies. Without it, the
+        prompt is followed by the image.
+        
+        Args:
+            prompt: The prompt text (a RenderedPrompt marks its fixed text)
+            upload: Optional image prepared for the provider
+            
+        Returns:
+            List of (text or image, cache breakpoint) in request order; a
+            breakpoint ends a prefix the provider is asked to cache, and
+            adjacent text is merged unless a breakpoint separates it
+        """
+        if not self.config.prompt_caching:
+            return [(str(prompt), False)] + ([(upload, False)] if upload else [])
+        facts, instructions, variable = split_prompt(prompt)
+        breakpoints = self._uses_cache_breakpoints()
+        parts: List[Tuple[Union[str, NormalizedImage], bool]] = []
+        for value, breakpoint in ((facts, False), (upload, True), (instructions, True), (variable, False)):
+            if value is None or value == '':
+                continue
+            if parts and isinstance(value, str) and isinstance(parts[-1][0], str) and not parts[-1][1]:
+                parts[-1] = (parts[-1][0] + value, breakpoint and breakpoints)
+            else:
+                parts.append((value, breakpoint and breakpoints))
+        return parts
+        
+    @staticmethod
+    def _message_content(parts: List[Tuple[Union[str, NormalizedImage], bool]], image_block) -> Union[str, List[Dict[str, Any]]]:
+        """
+        Build the content of a chat message from prompt parts.
+        
+        Args:
+            parts: Parts from _prompt_parts
+            image_block: Function building the provider's content block for an image
+            
+        Returns:
+            The text itself if the parts are a single unmarked text, else a list of content blocks
+        """
+        if len(parts) == 1 and isinstance(parts[0][0], str) and not parts[0][1]:
+            return parts[0][0]
+        content = []
+        for value, breakpoint in parts:
+            block = {"type": "text", "text": value} if isinstance(value, str) else image_block(value)
+            if breakpoint:
+                block["cache_control"] = {"type": "ephemeral"}
+            content.append(block)
+        return content
+        
+    @staticmethod
+    def _image_url_block(upload: NormalizedImage) -> Dict[str, Any]:
+        """Build an OpenAI-compatible image content block."""
+        return {"type": "image_url", "image_url": {"url": upload.data_url}}
+        
+    @staticmethod
+    def _anthropic_image_block(upload: NormalizedImage) -> Dict[str, Any]:
+        """Build an Anthropic image content block."""
+        return {"type": "image", "source": {"type": "base64", "media_type": upload.mime_type, "data": upload.data}}
+        
+    def _structured_review(self) -> bool:
+        """Whether this model answers with a structured (JSON) review."""
+        return self.config.structured_reviews and self.stage in REVIEW_STAGES
+        
+    def _json_mode_kwargs(self) -> Dict[str, Any]:
+        """
+        Get the request arguments asking the provider for a JSON response.
+        
+        Only OpenAI and Gemini are asked; other providers follow the prompt's
+        output format, and parse_review tolerates text around the object.
+        """
+        if not self._structured_review() or self.model_name in self.NO_JSON_MODE_MODELS:
+            return {}
+        if self.provider == 'openai':
+            return {'response_format': {"type": "json_object"}}
+        if self.provider == 'google':
+            return {'generation_config': {"response_mime_type": "application/json"}}
+        return {}
+        
+    def _build_request(self, prompt: str, image: Optional[ImageAsset] = None) -> Dict[str, Any]:
+        """
+        Build the provider-specific request arguments.
         
         Args:
             prompt: The prompt text
-            image: Optional base64 encoded image
+            image: Optional image to upload, normalized for the provider here
+            
+        Returns:
+            Dict of keyword arguments for the provider's create call
+        """
+        upload = self._prepare_image(image) if image else None
+        parts = self._prompt_parts(prompt, upload)
+        if self.provider == 'google':
+            if len(parts) == 1 and isinstance(parts[0][0], str):
+                return {'contents': parts[0][0], **self._json_mode_kwargs()}
+            return {'contents': [
+                value if isinstance(value, str) else {"mime_type": value.mime_type, "data": value.data}
+                for value, _ in parts
+            ], **self._json_mode_kwargs()}
+            
+        elif self.provider == 'openai':
+            messages = []
+            # Only add system message for models that support it
+            if self.model_name not in self.NO_SYSTEM_MESSAGE_MODELS:
+                messages.append({"role": "system", "content": "You are a helpful assistant."})
+            
+            messages.append({"role": "user", "content": self._message_content(parts, self._image_url_block)})
+            
+            return {'model': self.model_name, 'messages': messages, **self._json_mode_kwargs()}
+            
+        elif self.provider == 'groq':
+            if upload:
+                # For vision tasks, use vision-specific format
+                messages = [
+                    {"role": "user", "content": self._message_content(parts, self._image_url_block)}
+                ]
+            else:
+                # For non-vision tasks, use standard format
+                messages = [
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": self._message_content(parts, self._image_url_block)}
+                ]
+            return {'model': self.model_name, 'messages': messages}
+            
+        elif self.provider == 'anthropic':
+            max_tokens = 4096 if 'claude-3-opus' in self.model_name else 8192
+            return {
+                'model': self.model_name,
+                'max_tokens': max_tokens,
+                'messages': [{"role": "user", "content": self._message_content(parts, self._anthropic_image_block)}]
+            }
+            
+        elif self.provider == 'openrouter':
+            return {
+                'model': self.model_name,
+                'messages': [
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": self._message_content(parts, self._image_url_block)}
+                ],
+                'extra_headers': {
+                    "HTTP-Referer": "https://github.com/reggiechan74/chinese-family-tree-transcription",
+                    "X-Title": "Chinese Family Tree Transcription"
+                }
+            }
+            
+        elif self.provider == 'together':
+            return {
+                'model': self.model_name,
+                'messages': [
+                    {"role": "system", "content": "You are a helpful assistant."},
+                    {"role": "user", "content": str(prompt)}
+                ]
+            }
+            
+        else:
+            raise ValueError(f"Unsupported provider: {self.provider}")
+            
+    def _get_create_method(self, client, use_async: bool = False):
+        """Get the provider's content generation method from a client."""
+        if self.provider == 'google':
+            return client.generate_content_async if use_async else client.generate_content
+        if self.provider == 'anthropic':
+            return client.messages.create
+        return client.chat.completions.create
+        
+    def _parse_response(self, response, prompt: str, image: Optional[ImageAsset] = None) -> Dict[str, Any]:
+        """
+        Extract content and usage from a provider response.
+        
+        Usage is the provider-reported token count. Only if a response carries
+        no usage is it estimated locally, and the usage is then marked 'estimated'.
+        
+        Args:
+            response: Raw provider response
+            prompt: The prompt text that was sent
+            image: Optional image that was sent
             
         Returns:
             Dict containing response content and usage info
         """
+        if self.provider == 'google':
+            content = response.text
+        elif self.provider in ('openai', 'openrouter', 'groq', 'together'):
+            content = response.choices[0].message.content
+        elif self.provider == 'anthropic':
+            content = response.content[0].text
+        else:
+            raise ValueError(f"Unsupported provider: {self.provider}")
+            
+        usage = extract_usage(self.provider, response)
+        if usage is None:
+            usage = self._estimate_usage(prompt, content, image)
+        return {'content': content, 'usage': usage}
+        
+    def _open_progressive_output(self, buffered: bool = False) -> Optional[ProgressiveOutput]:
+        """
+        Open the file a streamed request writes its text to as it arrives.
+        
+        The first request of this model writes to {stream_prefix}.partial.md;
+        further requests (tiles, retries, fallbacks) get numbered files so
+        concurrent streams do not interleave.
+        
+        Args:
+            buffered: Hold the text for periodic writes (see ProgressiveOutput)
+            
+        Returns:
+            The output, or None if no stream_prefix was given
+        """
+        if not self.stream_prefix:
+            return None
+        with self._stream_lock:
+            index = len(self._stream_outputs) + 1
+            suffix = '' if index == 1 else f'.{index}'
+            output = ProgressiveOutput(
+                f"{self.stream_prefix}{suffix}.partial.md",
+                f"{self.provider} {self.model_name}",
+                buffered=buffered
+            )
+            self._stream_outputs.append(output)
+        return output
+        
+    def _discard_progressive_output(self):
+        """Delete the partial output files once the stage output is complete."""
+        with self._stream_lock:
+            outputs, self._stream_outputs = self._stream_outputs, []
+        for output in outputs:
+            output.discard()
+        if self._fallback_model is not None:
+            self._fallback_model._discard_progressive_output()
+            
+    def _stream_result(self, accumulator: StreamAccumulator, prompt: str, image: Optional[ImageAsset] = None) -> Dict[str, Any]:
+        """Build a result from a completed stream, like _parse_response plus 'timing'."""
+        content = accumulator.content
+        usage = accumulator.usage
+        if usage is None:
+            usage = self._estimate_usage(prompt, content, image)
+        if accumulator.first_token_at is not None:
+            self.tracer.instant('first_token', at=accumulator.first_token_at, **self._span_tags())
+        return {'content': content, 'usage': usage, 'timing': accumulator.timing(usage['output_tokens'])}
+        
+    def _stream_content(self, request: Dict[str, Any], prompt: str, image: Optional[ImageAsset] = None, attempt: Optional[HedgeAttempt] = None) -> Dict[str, Any]:
+        """
+        Stream a response.
+        
+        Args:
+            request: Provider request arguments from _build_request
+            prompt: The prompt text
+            image: Optional image that was sent
+            attempt: Optional hedged request this stream belongs to
+            
+        Returns:
+            Dict containing response content, usage info and stream timing
+            
+        Raises:
+            StreamStalledError: If the stream stalls (retried as a transient error)
+            StreamCancelledError: If the hedged request is cancelled
+        """
+        accumulator = StreamAccumulator(self.provider, self._open_progressive_output())
+        if attempt is not None:
+            attempt.accumulator = accumulator
         try:
-            if self.provider == 'google':
-                if image:
-                    response = self._client.generate_content([prompt, {"mime_type": "image/jpeg", "data": image}])
-                else:
-                    response = self._client.generate_content(prompt)
-                content = response.text
-                return {
-                    'content': content,
-                    'usage': {
-                        'input_tokens': self._count_tokens(prompt) + (1000 if image else 0),  # Estimate image tokens
-                        'output_tokens': self._count_tokens(content)
-                    }
-                }
-                
-            elif self.provider == 'openai':
-                messages = []
-                # Only add system message for models that support it
-                if self.model_name not in self.NO_SYSTEM_MESSAGE_MODELS:
-                    messages.append({"role": "system", "content": "You are a helpful assistant."})
-                
-                if image:
-                    messages.append({
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}}
-                        ]
-                    })
-                else:
-                    messages.append({"role": "user", "content": prompt})
-                
-                response = self._client.chat.completions.create(
-                    model=self.model_name,
-                    messages=messages
+            stream = self._get_create_method(self._client)(**request, **stream_kwargs(self.provider))
+            consume_stream(
+                stream, accumulator,
+                self.config.stream_first_token_timeout, self.config.stream_stall_timeout,
+                cancelled=attempt.cancelled if attempt is not None else None
+            )
+        finally:
+            if accumulator.output is not None:
+                accumulator.output.close()
+        return self._stream_result(accumulator, prompt, image)
+        
+    async def _stream_content_async(self, request: Dict[str, Any], prompt: str, image: Optional[ImageAsset] = None, attempt: Optional[HedgeAttempt] = None) -> Dict[str, Any]:
+        """
+        Async variant of _stream_content; a hedged request is cancelled through its task.
+        
+        The partial output file is written and the result built (which may
+        count tokens locally) in worker threads, keeping the event loop free.
+        """
+        accumulator = StreamAccumulator(self.provider, self._open_progressive_output(buffered=True))
+        if attempt is not None:
+            attempt.accumulator = accumulator
+        try:
+            create = self._get_create_method(self._get_async_client(), use_async=True)
+            stream = await create(**request, **stream_kwargs(self.provider))
+            await consume_stream_async(
+                stream, accumulator,
+                self.config.stream_first_token_timeout, self.config.stream_stall_timeout
+            )
+        finally:
+            if accumulator.output is not None:
+                await asyncio.to_thread(accumulator.output.close)
+        return await asyncio.to_thread(self._stream_result, accumulator, prompt, image)
+        
+    def _estimate_usage(self, prompt: str, content: str, image: Optional[ImageAsset] = None) -> Dict[str, Any]:
+        """Estimate usage by counting tokens locally, for responses that report none."""
+        print(f"Warning: {self.provider} {self.model_name} returned no usage; estimating token counts locally")
+        return {
+            'input_tokens': self._count_tokens(prompt) + (self.IMAGE_TOKEN_ESTIMATE if image else 0),
+            'output_tokens': self._count_tokens(content),
+            'estimated': True
+        }
+        
+    def _format_error(self, error: Exception) -> str:
+        """Format a provider error for logging and fallback reporting."""
+        error_msg = str(error)
+        kind = classify_error(error)
+        if kind == CONTEXT_OVERFLOW:
+            return (
+                f"Error with {self.provider} {self.model_name}: Context window length exceeded. "
+                f"This model cannot handle the amount of text being processed. "
+                f"Consider using a model with a larger context window like gemini-2.0-flash-exp or gemini-1.5-pro. "
+                f"Original error: {error_msg}"
+            )
+        if self.provider == 'google' and get_status_code(error) == 500:
+            # Gemini answers over-long inputs with a bare 500, so say so once retries are exhausted
+            return (
+                f"Error generating content with {self.provider} {self.model_name}: {error_msg} "
+                f"(a persistent 500 from Gemini can also mean the input exceeds the model's context window)"
+            )
+        return f"Error generating content with {self.provider} {self.model_name} ({kind} error): {error_msg}"
+        
+    def _get_fallback_model(self) -> Optional['StageModel']:
+        """
+        Get the model that takes over calls this model fails.
+        
+        The fallback is created on first use and kept, so its client is set up
+        once and this model keeps its own provider and model for later calls.
+        
+        Returns:
+            The fallback model, or None if the fallback is this model itself
+            
+        Raises:
+            RuntimeError: If no valid fallback model is configured
+        """
+        fallback = self.config.get_fallback()
+        if (fallback['provider'], fallback['name']) == (self.provider, self.model_name):
+            return None
+        with self._fallback_lock:
+            if self._fallback_model is None:
+                self._fallback_model = StageModel(
+                    provider=fallback['provider'],
+                    model_name=fallback['name'],
+                    stage=self.stage,
+                    model_num=self.model_num,
+                    config=self.config,
+                    stream_prefix=f"{self.stream_prefix}_fallback" if self.stream_prefix else None,
+                    tracer=self.tracer,
+                    queue_key=self.queue_key
                 )
-                return {
-                    'content': response.choices[0].message.content,
-                    'usage': {
-                        'input_tokens': response.usage.prompt_tokens,
-                        'output_tokens': response.usage.completion_tokens
-                    }
-                }
+            return self._fallback_model
+            
+    def _fallback_info(self, fallback: 'StageModel', error_msg: str) -> Dict[str, str]:
+        """Describe a fallback for reporting."""
+        return {
+            'original_provider': self.provider,
+            'original_model': self.model_name,
+            'fallback_provider': fallback.provider,
+            'fallback_model': fallback.model_name,
+            'error': error_msg
+        }
+        
+    def _cache_key(self, prompt: str, image: Optional[ImageAsset] = None) -> str:
+        """Build the response cache key for a call with the current provider and model."""
+        request = self._build_request(prompt)
+        params = {
+            k: v for k, v in request.items()
+            if k not in ('model', 'messages', 'contents', 'extra_headers')
+        }
+        # Message framing (system prompt etc.) also shapes the response
+        params['framing'] = [m.get('role') for m in request.get('messages', [])]
+        if image and self.config.prompt_caching:
+            # The image is sent between the facts and the instructions
+            params['layout'] = 'cached_prefix'
+        # Key on the bytes actually uploaded, so changing the normalization settings misses
+        image_digest = self._prepare_image(image).digest if image else None
+        return make_cache_key(self.provider, self.model_name, params, prompt, image_digest)
+        
+    def _store_cached(self, cache: Optional[ResponseCache], key: Optional[str], result: Dict[str, Any]):
+        """Store a fresh result in the cache unless it came from another model."""
+        if cache is None or key is None or 'fallback_info' in result or self._served_by_other_model(result):
+            return
+        # Timing and hedges describe this request only; a replay takes no time and costs nothing
+        cache.put(key, {k: v for k, v in result.items() if k not in ('timing', 'hedges')}, self.config.response_cache_max_bytes)
+            
+    def _get_response_cache(self) -> Optional[ResponseCache]:
+        """Get the response cache configured for this model, or None if caching is disabled."""
+        if not self.config.response_cache_enabled or not self.config.response_cache_dir:
+            return None
+        return get_response_cache(self.config.response_cache_dir)
+        
+    def _generate_content(self, prompt: str, image: Optional[ImageAsset] = None) -> Dict[str, Any]:
+        """
+        Generate content, replaying an identical earlier call from the response cache.
+        
+        Args:
+            prompt: The prompt text
+            image: Optional image to upload
+            
+        Returns:
+            Dict containing response content and usage info; cached replays
+            carry 'cached': True
+        """
+        cache = self._get_response_cache()
+        key = None
+        if cache is not None:
+            key = self._cache_key(prompt, image)
+            cached = cache.get(key)
+            if cached is not None:
+                self.tracer.instant('cache_hit', **self._span_tags())
+                return {**cached, 'cached': True}
                 
-            elif self.provider == 'groq':
-                if image:
-                    # For vision tasks, use vision-specific format
-                    response = self._client.chat.completions.create(
-                        model=self.model_name,  # Use configured model name
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": [
-                                    {"type": "text", "text": prompt},
-                                    {
-                                        "type": "image_url",
-                                        "image_url": {
-                                            "url": f"data:image/jpeg;base64,{image}",
-                                        },
-                                    },
-                                ],
-                            }
-                        ]
-                    )
-                else:
-                    # For non-vision tasks, use standard format
-                    response = self._client.chat.completions.create(
-                        model=self.model_name,
-                        messages=[
-                            {"role": "system", "content": "You are a helpful assistant."},
-                            {"role": "user", "content": prompt}
-                        ]
-                    )
-                content = response.choices[0].message.content
-                return {
-                    'content': content,
-                    'usage': {
-                        'input_tokens': self._count_tokens(prompt) + (1000 if image else 0),  # Estimate image tokens
-                        'output_tokens': self._count_tokens(content)
-                    }
-                }
+        result = self._request_content(prompt, image)
+        self._store_cached(cache, key, result)
+        return result
+        
+    async def _generate_content_async(self, prompt: str, image: Optional[ImageAsset] = None) -> Dict[str, Any]:
+        """Async variant of _generate_content; image normalization and SQLite access run in a worker thread."""
+        cache = self._get_response_cache()
+        key = None
+        if cache is not None:
+            key = await asyncio.to_thread(self._cache_key, prompt, image)
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached is not None:
+                self.tracer.instant('cache_hit', **self._span_tags())
+                return {**cached, 'cached': True}
                 
-            elif self.provider == 'anthropic':
-                if image:
-                    max_tokens = 4096 if 'claude-3-opus' in self.model_name else 8192
-                    response = self._client.messages.create(
-                        model=self.model_name,
-                        max_tokens=max_tokens,
-                        messages=[{
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": prompt},
-                                {"type": "image", "source": {"type": "base64", "media_type": "image/jpeg", "data": image}}
-                            ]
-                        }]
-                    )
+        result = await self._request_content_async(prompt, image)
+        await asyncio.to_thread(self._store_cached, cache, key, result)
+        return result
+        
+    def _get_rate_limit(self) -> RateLimit:
+        """Get the shared RPM/TPM limit of the current provider and model."""
+        rpm, tpm = self.config.get_rate_limit(self.provider, self.model_name)
+        return get_rate_limiter().get(self.provider, self.model_name, rpm, tpm)
+        
+    def _estimate_request_tokens(self, request: Dict[str, Any], prompt: str, image: Optional[ImageAsset] = None) -> int:
+        """Estimate the tokens a call will use, to reserve against the TPM quota."""
+        output_tokens = self.config.rate_limit_output_tokens
+        if request.get('max_tokens'):
+            output_tokens = min(output_tokens, request['max_tokens'])
+        return self._count_tokens(prompt) + (self.IMAGE_TOKEN_ESTIMATE if image else 0) + output_tokens
+        
+    def _settle_rate_limit(self, limit: RateLimit, reserved_tokens: int, result: Dict[str, Any]):
+        """Correct a TPM reservation to the tokens the call used."""
+        if reserved_tokens:
+            limit.settle(reserved_tokens, result['usage']['input_tokens'] + result['usage']['output_tokens'])
+            
+    def _tag_request_span(self, span: Dict[str, Any], result: Dict[str, Any]):
+        """Add a request's token counts and stream timing to its trace span."""
+        span['input_tokens'] = result['usage']['input_tokens']
+        span['output_tokens'] = result['usage']['output_tokens']
+        if 'cache_read_tokens' in result['usage']:
+            span['cache_read_tokens'] = result['usage']['cache_read_tokens']
+        if 'cache_write_tokens' in result['usage']:
+            span['cache_write_tokens'] = result['usage']['cache_write_tokens']
+        if 'timing' in result:
+            span['ttft'] = result['timing']['ttft']
+            span['itl'] = result['timing']['itl']
+            
+    def _retry_policy(self) -> RetryPolicy:
+        """Get the retry policy of this model's calls."""
+        return RetryPolicy(
+            max_attempts=self.config.retry_max_attempts,
+            base_delay=self.config.retry_base_delay,
+            max_delay=self.config.retry_max_delay,
+            deadline=self.config.retry_deadline
+        )
+        
+    def _trace_retry(self, error: BaseException, delay: float):
+        """Record a retry in the trace."""
+        self.tracer.instant('retry', kind=classify_error(error), delay=delay, **self._span_tags())
+        
+    def _record_latency(self, started: float):
+        """Record the latency of a successful request, for timing hedges."""
+        get_latency_history().record(self.provider, self.model_name, self.stage, time.perf_counter() - started)
+        
+    @staticmethod
+    def _counts_against_circuit(error: BaseException) -> bool:
+        """Whether an error suggests the model is down (timeouts, dropped connections, 5xx)."""
+        return classify_error(error) == TRANSIENT
+        
+    def _circuit(self):
+        """
+        Guard a request with this model's circuit breaker (see utils.circuit_breaker).
+        
+        Returns:
+            Context manager yielding a dict the request sets its 'latency' in;
+            entering it raises CircuitOpenError if the breaker is open
+        """
+        if not self.config.circuit_breaker:
+            return nullcontext({})
+        policy = BreakerPolicy(
+            window=self.config.circuit_window,
+            min_calls=self.config.circuit_min_calls,
+            error_rate=self.config.circuit_error_rate,
+            slow_call_seconds=self.config.circuit_slow_call_seconds,
+            cooldown=self.config.circuit_cooldown,
+            half_open_probes=self.config.circuit_half_open_probes
+        )
+        breaker = get_circuit_breakers(self.config.circuit_state_file).get(self.provider, self.model_name, policy)
+        return breaker.call(self._counts_against_circuit)
+        
+    @staticmethod
+    def _circuit_latency(started: float, result: Dict[str, Any]) -> float:
+        """Get the latency a request is judged by: time to first token if streamed, else its duration."""
+        if 'timing' in result:
+            return result['timing']['ttft']
+        return time.perf_counter() - started
+        
+    def _request_once(self, prompt: str, image: Optional[ImageAsset] = None, attempt: Optional[HedgeAttempt] = None) -> Dict[str, Any]:
+        """
+        Send one request to this model's provider.
+        
+        Args:
+            prompt: The prompt text
+            image: Optional image to upload
+            attempt: Optional hedged request this request belongs to
+            
+        Returns:
+            Dict containing response content and usage info
+        """
+        with self.tracer.span('build_request', **self._span_tags()):
+            request = self._build_request(prompt, image)
+        with self._circuit() as circuit:
+            limit = self._get_rate_limit()
+            reserved_tokens = 0
+            if not limit.unlimited:
+                reserved_tokens = self._estimate_request_tokens(request, prompt, image)
+                with self.tracer.span('rate_limit_wait', **self._span_tags()):
+                    limit.acquire(reserved_tokens, self.queue_key)
+            if attempt is not None:
+                attempt.check()
+            started = time.perf_counter()
+            with self.tracer.span('request', **self._span_tags(), hedge=attempt.role if attempt else None) as span:
+                if self.config.streaming:
+                    result = self._stream_content(request, prompt, image, attempt)
                 else:
-                    max_tokens = 4096 if 'claude-3-opus' in self.model_name else 8192
-                    response = self._client.messages.create(
-                        model=self.model_name,
-                        max_tokens=max_tokens,
-                        messages=[{
-                            "role": "user",
-                            "content": prompt
-                        }]
-                    )
-                content = response.content[0].text
-                return {
-                    'content': content,
-                    'usage': {
-                        'input_tokens': self._count_tokens(prompt),
-                        'output_tokens': self._count_tokens(content)
-                    }
-                }
-                
-            elif self.provider == 'openrouter':
-                if image:
-                    response = self._client.chat.completions.create(
-                        model=self.model_name,
-                        messages=[
-                            {"role": "system", "content": "You are a helpful assistant."},
-                            {"role": "user", "content": [
-                                {"type": "text", "text": prompt},
-                                {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image}"}}
-                            ]}
-                        ],
-                        extra_headers={
-                            "HTTP-Referer": "https://github.com/reggiechan74/chinese-family-tree-transcription",
-                            "X-Title": "Chinese Family Tree Transcription"
-                        }
-                    )
+                    response = self._get_create_method(self._client)(**request)
+                    result = self._parse_response(response, prompt, image)
+                self._tag_request_span(span, result)
+            circuit['latency'] = self._circuit_latency(started, result)
+        self._record_latency(started)
+        self._settle_rate_limit(limit, reserved_tokens, result)
+        return result
+        
+    async def _request_once_async(self, prompt: str, image: Optional[ImageAsset] = None, attempt: Optional[HedgeAttempt] = None) -> Dict[str, Any]:
+        """
+        Async variant of _request_once using the provider's async client.
+        
+        Building the request (image resizing and re-encoding), counting its
+        tokens and parsing the response (which may count tokens locally) run in
+        a worker thread so they do not block the event loop.
+        """
+        with self.tracer.span('build_request', **self._span_tags()):
+            request = await asyncio.to_thread(self._build_request, prompt, image)
+        with self._circuit() as circuit:
+            limit = self._get_rate_limit()
+            reserved_tokens = 0
+            if not limit.unlimited:
+                reserved_tokens = await asyncio.to_thread(self._estimate_request_tokens, request, prompt, image)
+                with self.tracer.span('rate_limit_wait', **self._span_tags()):
+                    await limit.acquire_async(reserved_tokens, self.queue_key)
+            started = time.perf_counter()
+            with self.tracer.span('request', **self._span_tags(), hedge=attempt.role if attempt else None) as span:
+                if self.config.streaming:
+                    result = await self._stream_content_async(request, prompt, image, attempt)
                 else:
-                    response = self._client.chat.completions.create(
-                        model=self.model_name,
-                        messages=[
-                            {"role": "system", "content": "You are a helpful assistant."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        extra_headers={
-                            "HTTP-Referer": "https://github.com/reggiechan74/chinese-family-tree-transcription",
-                            "X-Title": "Chinese Family Tree Transcription"
-                        }
-                    )
-                return {
-                    'content': response.choices[0].message.content,
-                    'usage': {
-                        'input_tokens': response.usage.prompt_tokens,
-                        'output_tokens': response.usage.completion_tokens
-                    }
-                }
-                
-            elif self.provider == 'together':
-                response = self._client.chat.completions.create(
-                    model=self.model_name,
-                    messages=[
-                        {"role": "system", "content": "You are a helpful assistant."},
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                content = response.choices[0].message.content
-                return {
-                    'content': content,
-                    'usage': {
-                        'input_tokens': self._count_tokens(prompt),
-                        'output_tokens': self._count_tokens(content)
-                    }
-                }
-                
-            else:
-                raise ValueError(f"Unsupported provider: {self.provider}")
-                
+                    response = await self._get_create_method(self._get_async_client(), use_async=True)(**request)
+                    result = await asyncio.to_thread(self._parse_response, response, prompt, image)
+                self._tag_request_span(span, result)
+            circuit['latency'] = self._circuit_latency(started, result)
+        self._record_latency(started)
+        self._settle_rate_limit(limit, reserved_tokens, result)
+        return result
+        
+    def _request_with_retries(self, prompt: str, image: Optional[ImageAsset] = None, attempt: Optional[HedgeAttempt] = None) -> Dict[str, Any]:
+        """Send a request, retrying transient and rate limit errors (see models.retry_policy)."""
+        return call_with_retries(
+            lambda: self._request_once(prompt, image, attempt),
+            self._retry_policy(),
+            f"{self.provider} {self.model_name}",
+            on_retry=self._trace_retry
+        )
+        
+    async def _request_with_retries_async(self, prompt: str, image: Optional[ImageAsset] = None, attempt: Optional[HedgeAttempt] = None) -> Dict[str, Any]:
+        """Async variant of _request_with_retries."""
+        return await call_with_retries_async(
+            lambda: self._request_once_async(prompt, image, attempt),
+            self._retry_policy(),
+            f"{self.provider} {self.model_name}",
+            on_retry=self._trace_retry
+        )
+        
+    def _hedge_delay(self) -> Optional[float]:
+        """
+        Get how long a call runs before it is hedged.
+        
+        Returns:
+            Seconds to wait (the configured percentile of this model's recent
+            latencies in this stage), or None if the call is not hedged
+        """
+        if not self.config.hedging or self.stage not in self.config.hedge_stages:
+            return None
+        return get_latency_history().percentile(
+            self.provider, self.model_name, self.stage,
+            self.config.hedge_percentile, self.config.hedge_min_samples
+        )
+        
+    def _get_hedge_model(self) -> 'StageModel':
+        """Get the model hedge requests are sent to: this model, or its fallback if HEDGE_TARGET=fallback."""
+        if self.config.hedge_target == 'fallback':
+            try:
+                fallback = self._get_fallback_model()
+            except RuntimeError:
+                fallback = None
+            if fallback is not None:
+                return fallback
+        return self
+        
+    def _start_hedge(self, hedge_model: 'StageModel', delay: float):
+        """Log and trace the start of a hedge request."""
+        print(
+            f"{self.provider} {self.model_name}: no response after {delay:.1f}s; "
+            f"hedging with {hedge_model.provider} {hedge_model.model_name}"
+        )
+        self.tracer.instant('hedge', delay=delay, hedge_model=hedge_model.model_name, **self._span_tags())
+        
+    def _hedge_overhead(self, loser: 'StageModel', attempt: HedgeAttempt, prompt: str, image: Optional[ImageAsset],
+                        winner_result: Dict[str, Any], loser_result: Optional[Dict[str, Any]] = None,
+                        failed: bool = False) -> Dict[str, Any]:
+        """
+        Estimate the tokens spent on the request that lost a hedged call.
+        
+        A loser that finished reports its own usage and one that failed cost
+        nothing. A cancelled stream counts the text it had received; a request
+        that could not be cancelled mid-response is assumed to produce as much
+        as the winner.
+        
+        Returns:
+            Dict with the loser's provider, model_name, input_tokens and output_tokens
+        """
+        overhead = {'provider': loser.provider, 'model_name': loser.model_name}
+        if loser_result is not None:
+            return {**overhead, **{k: loser_result['usage'][k] for k in ('input_tokens', 'output_tokens')}}
+        if failed:
+            return {**overhead, 'input_tokens': 0, 'output_tokens': 0}
+        received = attempt.received_text()
+        return {
+            **overhead,
+            'input_tokens': loser._count_tokens(prompt) + (self.IMAGE_TOKEN_ESTIMATE if image else 0),
+            'output_tokens': (
+                loser._count_tokens(received) if received is not None
+                else winner_result['usage']['output_tokens']
+            ),
+            'estimated': True
+        }
+        
+    def _settle_hedge(self, racers: Dict[Any, Tuple['StageModel', HedgeAttempt]], done: Any, delay: float,
+                      prompt: str, image: Optional[ImageAsset] = None) -> Optional[Dict[str, Any]]:
+        """
+        Pick the winner of a hedged call among its finished requests and cancel the other.
+        
+        Args:
+            racers: The model and attempt of each request's future (or task)
+            done: Futures that have finished
+            delay: Seconds the call ran before it was hedged
+            prompt: The prompt text
+            image: Optional image that was sent
+            
+        Returns:
+            The winning result with 'hedges' added, or None if no finished request succeeded
+        """
+        # The primary wins a tie
+        winners = sorted((f for f in done if f.exception() is None), key=lambda f: racers[f][1].role != PRIMARY)
+        if not winners:
+            return None
+        future = winners[0]
+        winner, attempt = racers[future]
+        result = future.result()
+        loser_future = next(f for f in racers if f is not future)
+        loser, loser_attempt = racers[loser_future]
+        loser_attempt.cancel()
+        loser_error = loser_future.exception() if loser_future.done() else None
+        overhead = self._hedge_overhead(
+            loser, loser_attempt, prompt, image, result,
+            loser_result=loser_future.result() if loser_future.done() and loser_error is None else None,
+            failed=loser_error is not None
+        )
+        result['hedges'] = [{
+            'delay': delay,
+            'winner': attempt.role,
+            'provider': winner.provider,
+            'model_name': winner.model_name,
+            'overhead': overhead
+        }]
+        if attempt.role == HEDGE:
+            print(f"Hedge request to {winner.provider} {winner.model_name} finished first")
+        return result
+        
+    def _served_by_other_model(self, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Get the hedge whose winner was another model than this one, if any."""
+        for hedge in result.get('hedges', []):
+            if (hedge['provider'], hedge['model_name']) != (self.provider, self.model_name):
+                return hedge
+        return None
+        
+    def _request_hedged(self, prompt: str, image: Optional[ImageAsset] = None) -> Dict[str, Any]:
+        """
+        Send a request with retries, hedging it if it runs longer than usual.
+        
+        If the request has not finished once _hedge_delay has passed, a
+        duplicate is sent to the hedge model. The first to succeed is used and
+        the other is cancelled (a request that is not streamed cannot be
+        stopped and is left to finish in the background). Results of hedged
+        calls carry 'hedges'.
+        
+        Returns:
+            Dict containing response content and usage info
+            
+        Raises:
+            Exception: The primary request's error if both requests fail
+        """
+        delay = self._hedge_delay()
+        if delay is None:
+            return self._request_with_retries(prompt, image)
+        
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f"stage{self.stage}-hedge")
+        try:
+            primary = HedgeAttempt(PRIMARY)
+            primary_future = pool.submit(self._request_with_retries, prompt, image, primary)
+            racers = {primary_future: (self, primary)}
+            if wait(racers, timeout=delay).done:
+                return primary_future.result()
+            
+            hedge_model = self._get_hedge_model()
+            self._start_hedge(hedge_model, delay)
+            hedge = HedgeAttempt(HEDGE)
+            racers[pool.submit(hedge_model._request_with_retries, prompt, image, hedge)] = (hedge_model, hedge)
+            
+            pending = set(racers)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                result = self._settle_hedge(racers, done, delay, prompt, image)
+                if result is not None:
+                    return result
+            raise primary_future.exception()
+        finally:
+            pool.shutdown(wait=False)
+            
+    async def _request_hedged_async(self, prompt: str, image: Optional[ImageAsset] = None) -> Dict[str, Any]:
+        """Async variant of _request_hedged; the losing request's task is cancelled."""
+        delay = self._hedge_delay()
+        if delay is None:
+            return await self._request_with_retries_async(prompt, image)
+        
+        primary = HedgeAttempt(PRIMARY)
+        primary_task = asyncio.ensure_future(self._request_with_retries_async(prompt, image, primary))
+        racers = {primary_task: (self, primary)}
+        try:
+            done, _ = await asyncio.wait(racers, timeout=delay)
+            if done:
+                return primary_task.result()
+            
+            hedge_model = self._get_hedge_model()
+            self._start_hedge(hedge_model, delay)
+            hedge = HedgeAttempt(HEDGE)
+            racers[asyncio.ensure_future(hedge_model._request_with_retries_async(prompt, image, hedge))] = (hedge_model, hedge)
+            
+            pending = set(racers)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                result = self._settle_hedge(racers, done, delay, prompt, image)
+                if result is not None:
+                    return result
+            raise primary_task.exception()
+        finally:
+            for task in racers:
+                if not task.done():
+                    task.cancel()
+        
+    def _request_content(self, prompt: str, image: Optional[ImageAsset] = None) -> Dict[str, Any]:
+        """
+        Generate content using the appropriate provider's API.
+        
+        Transient and rate limit errors are retried with backoff, and a slow
+        request may be hedged (see _request_hedged). Once retrying stops, or
+        for errors that retrying cannot fix, the call is sent to the fallback
+        model; results it serves carry 'fallback_info'.
+        
+        Args:
+            prompt: The prompt text
+            image: Optional image to upload
+            
+        Returns:
+            Dict containing response content and usage info
+            
+        Raises:
+            RuntimeError: If both this model and the fallback fail
+        """
+        try:
+            return self._request_hedged(prompt, image)
         except Exception as e:
-            error_msg = str(e)
-            if self.provider == 'google' and '500' in error_msg:
-                error_msg = (
-                    f"Error with {self.provider} {self.model_name}: Context window length exceeded. "
-                    f"This model cannot handle the amount of text being processed. "
-                    f"Consider using a model with a larger context window like gemini-2.0-flash-exp or gemini-1.5-pro. "
-                    f"Original error: {error_msg}"
-                )
-            else:
-                error_msg = f"Error generating content with {self.provider} {self.model_name}: {error_msg}"
+            error_msg = self._format_error(e)
             print(error_msg)
             
             # Try fallback model
             try:
-                from config.config import get_fallback_model_config
-                fallback = get_fallback_model_config()
-                print(f"Attempting fallback to {fallback['provider']} {fallback['name']}...")
-                
-                # Save original provider and model
-                original_provider = self.provider
-                original_model = self.model_name
-                
-                # Switch to fallback model
-                self.provider = fallback['provider']
-                self.model_name = fallback['name']
-                
-                # Reinitialize client with new provider
-                self._initialize_client()
-                
-                # Try again with fallback model
-                result = self._generate_content(prompt, image)
-                
-                # Store fallback info for reporting
-                result['fallback_info'] = {
-                    'original_provider': original_provider,
-                    'original_model': original_model,
-                    'fallback_provider': self.provider,
-                    'fallback_model': self.model_name,
-                    'error': error_msg
-                }
-                
-                # If successful, return result but keep original error in logs
-                print(f"Fallback successful. Original error was: {error_msg}")
-                return result
+                fallback = self._get_fallback_model()
+                if fallback is None:
+                    raise RuntimeError(error_msg)
+                print(f"Attempting fallback to {fallback.provider} {fallback.model_name}...")
+                result = fallback._request_with_retries(prompt, image)
+            except Exception as fallback_error:
+                # If fallback fails, raise original error
+                raise RuntimeError(error_msg) from fallback_error
                 
+            # If successful, return result but keep original error in logs
+            result['fallback_info'] = self._fallback_info(fallback, error_msg)
+            print(f"Fallback successful. Original error was: {error_msg}")
+            return result
+            
+    async def _request_content_async(self, prompt: str, image: Optional[ImageAsset] = None) -> Dict[str, Any]:
+        """
+        Generate content using the provider's async API.
+        
+        Mirrors _request_content, but awaits the SDK's async client so a single
+        event loop can drive many in-flight requests.
+        
+        Args:
+            prompt: The prompt text
+            image: Optional image to upload
+            
+        Returns:
+            Dict containing response content and usage info
+        """
+        try:
+            return await self._request_hedged_async(prompt, image)
+        except Exception as e:
+            error_msg = self._format_error(e)
+            print(error_msg)
+            
+            # Try fallback model
+            try:
+                fallback = self._get_fallback_model()
+                if fallback is None:
+                    raise RuntimeError(error_msg)
+                print(f"Attempting fallback to {fallback.provider} {fallback.model_name}...")
+                result = await fallback._request_with_retries_async(prompt, image)
             except Exception as fallback_error:
                 # If fallback fails, raise original error
-                raise RuntimeError(error_msg)
-    
-    def generate_transcription(self, image_base64: str, token_tracker: TokenTracker = None) -> str:
+                raise RuntimeError(error_msg) from fallback_error
+                
+            result['fallback_info'] = self._fallback_info(fallback, error_msg)
+            print(f"Fallback successful. Original error was: {error_msg}")
+            return result
+            
+    def _build_stage_prompt(self, *args) -> Tuple[str, Optional[ImageAsset]]:
         """
-        Generate transcription from base64 encoded image.
+        Build the prompt (and image, for transcription) for this model's stage.
         
         Args:
-            image_base64: Base64 encoded image string
-            token_tracker: Optional token tracker for monitoring usage
+            *args: The stage method's inputs (see run_stage)
             
         Returns:
-            str: Generated transcription
+            Tuple of (prompt, optional image)
             
         Raises:
-            ValueError: If stage is not a transcription stage (1-2)
+            ValueError: If the stage is invalid
         """
-        # Call parent validation
-        super().generate_transcription(image_base64, token_tracker)
-        
-        # Get appropriate prompt based on stage
         if self.stage == 1:
-            prompt = Stage1.get_prompt()
+            return Stage1.get_prompt(), as_image_asset(args[0])
         elif self.stage == 2:
-            prompt = Stage2.get_prompt()
-        else:
-            raise ValueError(f"Invalid stage {self.stage} for transcription")
+            return Stage2.get_prompt(), as_image_asset(args[0])
+        elif self.stage == 3:
+            context = args[0]
+            if CONSENSUS_KEY in context:
+                # Only the spans the transcriptions disagree on are reviewed
+                return Stage3.get_consensus_prompt(context[CONSENSUS_KEY], structured=self._structured_review()), None
+            # Get transcriptions from Stage 1 and 2 for this model number
+            transcriptions = {}
+            for stage in [1, 2]:
+                key = self.config.get_result_key(stage, self.model_num)
+                if key in context:
+                    transcriptions[key] = context[key]
+            return Stage3.get_prompt(transcriptions, structured=self._structured_review()), None
+        elif self.stage == 4:
+            # Get all Stage 3 reviews using actual Stage 3 model configs
+            context = args[0]
+            stage3_reviews = {}
+            for model_num in range(1, 4):
+                key = self.config.get_result_key(3, model_num)
+                if key in context:
+                    stage3_reviews[key] = context[key]
+            if self._structured_review():
+                # Compacted reviews are passed as labelled text rather than a dict dump
+                return Stage4.get_prompt(format_reviews(stage3_reviews), structured=True), None
+            return Stage4.get_prompt(stage3_reviews), None
+        elif self.stage == 5:
+            context = args[0]
+            if CONSENSUS_KEY in context:
+                # Stages 3-4 were skipped after a strong local consensus
+                return Stage5.get_consensus_prompt(context[CONSENSUS_KEY], structured=self._structured_review()), None
+            # Get stage 4 reviews using actual Stage 4 model configs
+            stage4_reviews = {}
+            for model_num in range(1, 4):
+                key = self.config.get_result_key(4, model_num)
+                if key in context:
+                    stage4_reviews[key] = context[key]
+            if self._structured_review():
+                return Stage5.get_prompt(format_reviews(stage4_reviews), structured=True), None
+            return Stage5.get_prompt(stage4_reviews), None
+        elif self.stage == 6:
+            return Stage6.get_prompt(args[0]), None
+        elif self.stage == 7:
+            return Stage7.get_prompt(args[0]), None
+        elif self.stage == 8:
+            return Stage8.get_prompt(args[0], args[1]), None
+        raise ValueError(f"Invalid stage: {self.stage}")
         
-        # Call provider's API with the prompt and image
-        result = self._generate_content(prompt, image_base64)
+    def _split_tiles(self, image: ImageAsset) -> List[ImageAsset]:
+        """Get the tiles a transcription image is sent as (just the image unless it is tiled)."""
+        if not self.config.image_tiling:
+            return [image]
+        tiler = get_image_tiler(self.config.tile_max_count, self.config.tile_overlap, self.config.tile_min_aspect)
+        return tiler.split(image)
         
-        # Track token usage if tracker provided
+    def _build_tile_prompts(self, tile_count: int) -> List[str]:
+        """Build the transcription prompt of each tile, in reading order."""
+        stage_prompts = Stage1 if self.stage == 1 else Stage2
+        return [stage_prompts.get_tile_prompt(tile_num, tile_count) for tile_num in range(1, tile_count + 1)]
+        
+    def _combine_tile_results(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Merge the results of a tiled transcription into a single result.
+        
+        Args:
+            results: Result of each tile, in reading order
+            
+        Returns:
+            Dict with the stitched content and the summed usage
+        """
+        combined = {
+            'content': stitch_transcriptions([result['content'] for result in results]),
+            'usage': {
+                'input_tokens': sum(result['usage']['input_tokens'] for result in results),
+                'output_tokens': sum(result['usage']['output_tokens'] for result in results)
+            },
+            'tiles': len(results)
+        }
+        for key in ('cache_read_tokens', 'cache_write_tokens'):
+            tokens = sum(result['usage'].get(key, 0) for result in results)
+            if tokens:
+                combined['usage'][key] = tokens
+        if any(result['usage'].get('estimated') for result in results):
+            combined['usage']['estimated'] = True
+        if all(result.get('cached') for result in results):
+            combined['cached'] = True
+        timings = [result['timing'] for result in results if 'timing' in result]
+        if timings:
+            # The tiles stream side by side, so the slowest tile sets the pace
+            combined['timing'] = {
+                'ttft': max(timing['ttft'] for timing in timings),
+                'itl': sum(timing['itl'] for timing in timings) / len(timings),
+                'max_gap': max(timing['max_gap'] for timing in timings),
+                'duration': max(timing['duration'] for timing in timings)
+            }
+        fallback_info = [result['fallback_info'] for result in results if 'fallback_info' in result]
+        if fallback_info:
+            combined['fallback_info'] = fallback_info[0]
+        hedges = [hedge for result in results for hedge in result.get('hedges', [])]
+        if hedges:
+            combined['hedges'] = hedges
+        return combined
+        
+    def _generate_tiled(self, tiles: List[ImageAsset]) -> Dict[str, Any]:
+        """
+        Transcribe the tiles of an image at once and stitch the results.
+        
+        The tiles of one call share the provider slot held for the call, so a
+        tiled transcription takes as long as its slowest tile.
+        
+        Args:
+            tiles: Image tiles, in reading order
+            
+        Returns:
+            Combined result (see _combine_tile_results)
+        """
+        prompts = self._build_tile_prompts(len(tiles))
+        with ThreadPoolExecutor(max_workers=len(tiles), thread_name_prefix=f"stage{self.stage}-tile") as pool:
+            results = list(pool.map(self._generate_content, prompts, tiles))
+        return self._combine_tile_results(results)
+        
+    async def _generate_tiled_async(self, tiles: List[ImageAsset]) -> Dict[str, Any]:
+        """Async variant of _generate_tiled; prompts are rendered and results stitched in worker threads."""
+        prompts = await asyncio.to_thread(self._build_tile_prompts, len(tiles))
+        results = await asyncio.gather(*(
+            self._generate_content_async(prompt, tile) for prompt, tile in zip(prompts, tiles)
+        ))
+        return await asyncio.to_thread(self._combine_tile_results, list(results))
+        
+    def _track_usage(self, result: Dict[str, Any], token_tracker: TokenTracker = None) -> str:
+        """
+        Record token usage for a result and return its stripped content.
+        
+        Args:
+            result: Result from _generate_content
+            token_tracker: Optional token tracker for monitoring usage
+            
+        Returns:
+            str: Stripped response content
+        """
+        content = result['content'].strip()
         if token_tracker:
-            content = result['content'].strip()
+            # Usage is billed to the model that produced the result
+            provider, model_name = self.provider, self.model_name
+            served_by = self._served_by_other_model(result)
+            if 'fallback_info' in result:
+                provider = result['fallback_info']['fallback_provider']
+                model_name = result['fallback_info']['fallback_model']
+            elif served_by is not None:
+                provider, model_name = served_by['provider'], served_by['model_name']
+            for hedge in result.get('hedges', []):
+                overhead = hedge['overhead']
+                token_tracker.add_hedge_cost(
+                    stage=f"Stage {self.stage}",
+                    model=f"Stage {self.stage} Model {self.model_num} - {overhead['provider'].title()} {overhead['model_name']}",
+                    model_name=overhead['model_name'],
+                    input_tokens=overhead['input_tokens'],
+                    output_tokens=overhead['output_tokens'],
+                    won=hedge['winner'] == HEDGE
+                )
             token_tracker.add_usage(
                 stage=f"Stage {self.stage}",
-                model=f"Stage {self.stage} Model {self.model_num} - {self.provider.title()} {self.model_name}",
-                model_name=self.model_name,
+                model=f"Stage {self.stage} Model {self.model_num} - {provider.title()} {model_name}",
+                model_name=model_name,
                 input_tokens=result['usage']['input_tokens'],
                 output_tokens=result['usage']['output_tokens'],
                 char_count=self._extract_transcription_chars(content),
-                fallback_info=result.get('fallback_info')
+                fallback_info=result.get('fallback_info'),
+                cached=result.get('cached', False),
+                timing=result.get('timing'),
+                cache_read_tokens=result['usage'].get('cache_read_tokens', 0),
+                cache_write_tokens=result['usage'].get('cache_write_tokens', 0)
             )
+        return content
         
-        return result['content'].strip()
+    def run_stage(self, *args, token_tracker: TokenTracker = None) -> str:
+        """
+        Run this model's stage method with the given inputs.
+        
+        Args:
+            *args: Inputs of the stage method:
+                - Stages 1-2: image (ImageAsset or base64 string)
+                - Stages 3-5: context dict
+                - Stages 6-7: text
+                - Stage 8: chinese_text, english_text
+            token_tracker: Optional token tracker for monitoring usage
+            
+        Returns:
+            str: The stage output
+        """
+        method = getattr(self, self.STAGE_METHODS[self.stage])
+        output = method(*args, token_tracker)
+        self._discard_progressive_output()
+        return output
+        
+    async def run_stage_async(self, *args, token_tracker: TokenTracker = None) -> str:
+        """
+        Async variant of run_stage using the provider's async client.
+        
+        Args:
+            *args: Inputs of the stage method (see run_stage)
+            token_tracker: Optional token tracker for monitoring usage
+            
+        Returns:
+            str: The stage output
+        """
+        tiles = []
+        if self.stage <= 2:
+            # Decoding and cropping the image is CPU work, kept off the event loop
+            args = (await asyncio.to_thread(as_image_asset, args[0]),)
+            tiles = await asyncio.to_thread(self._split_tiles, args[0])
+        if len(tiles) > 1:
+            result = await self._generate_tiled_async(tiles)
+        else:
+            # The first render of a template compiles it and loads the tokenizer
+            prompt, image = await asyncio.to_thread(self._build_stage_prompt, *args)
+            result = await self._generate_content_async(prompt, image)
+        output = self._track_usage(result, token_tracker)
+        await asyncio.to_thread(self._discard_progressive_output)
+        return output
+    
+    def generate_transcription(self, image: Union[str, ImageAsset], token_tracker: TokenTracker = None) -> str:
+        """
+        Generate transcription from an image.
+        
+        Args:
+            image: ImageAsset, or base64 encoded image string
+            token_tracker: Optional token tracker for monitoring usage
+            
+        Returns:
+            str: Generated transcription
+            
+        Raises:
+            ValueError: If stage is not a transcription stage (1-2)
+        """
+        # Call parent validation
+        super().generate_transcription(image, token_tracker)
+        image = as_image_asset(image)
+        
+        # Wide scans are transcribed as overlapping tiles when tiling is enabled
+        tiles = self._split_tiles(image)
+        if len(tiles) > 1:
+            result = self._generate_tiled(tiles)
+        else:
+            # Get appropriate prompt based on stage
+            prompt, image = self._build_stage_prompt(image)
+            
+            # Call provider's API with the prompt and image
+            result = self._generate_content(prompt, image)
+        
+        # Track token usage if tracker provided
+        return self._track_usage(result, token_tracker)
 
     def analyze_context(self, context: Dict[str, Any], token_tracker: TokenTracker = None) -> str:
         """
@@ -423,34 +1355,14 @@ class StageModel(FinalStageModel):
         # Call parent validation
         super().analyze_context(context, token_tracker)
         
-        # Get transcriptions from Stage 1 and 2 for this model number
-        transcriptions = {}
-        for stage in [1, 2]:
-            stage_config = get_model_init_params(stage, self.model_num)
-            key = f"Stage {stage} Model {self.model_num} - {stage_config['provider'].title()} {stage_config['name']} Transcription"
-            if key in context:
-                transcriptions[key] = context[key]
-        
         # Get prompt from Stage3
-        prompt = Stage3.get_prompt(transcriptions)
+        prompt, _ = self._build_stage_prompt(context)
         
         # Call provider's API
         result = self._generate_content(prompt)
         
         # Track token usage if tracker provided
-        if token_tracker:
-            content = result['content'].strip()
-            token_tracker.add_usage(
-                stage=f"Stage {self.stage}",
-                model=f"Stage {self.stage} Model {self.model_num} - {self.provider.title()} {self.model_name}",
-                model_name=self.model_name,
-                input_tokens=result['usage']['input_tokens'],
-                output_tokens=result['usage']['output_tokens'],
-                char_count=self._extract_transcription_chars(content),
-                fallback_info=result.get('fallback_info')
-            )
-        
-        return result['content'].strip()
+        return self._track_usage(result, token_tracker)
         
     def comprehensive_review(self, context: Dict[str, Any], token_tracker: TokenTracker = None) -> str:
         """
@@ -473,34 +1385,14 @@ class StageModel(FinalStageModel):
         # Call parent validation
         super().comprehensive_review(context, token_tracker)
         
-        # Get all Stage 3 reviews using actual Stage 3 model configs
-        stage3_reviews = {}
-        for model_num in range(1, 4):
-            stage3_config = get_model_init_params(3, model_num)
-            key = f"Stage 3 Model {model_num} - {stage3_config['provider'].title()} {stage3_config['name']} Review"
-            if key in context:
-                stage3_reviews[key] = context[key]
-        
         # Get prompt from Stage4
-        prompt = Stage4.get_prompt(stage3_reviews)
+        prompt, _ = self._build_stage_prompt(context)
         
         # Call provider's API
         result = self._generate_content(prompt)
         
         # Track token usage if tracker provided
-        if token_tracker:
-            content = result['content'].strip()
-            token_tracker.add_usage(
-                stage=f"Stage {self.stage}",
-                model=f"Stage {self.stage} Model {self.model_num} - {self.provider.title()} {self.model_name}",
-                model_name=self.model_name,
-                input_tokens=result['usage']['input_tokens'],
-                output_tokens=result['usage']['output_tokens'],
-                char_count=self._extract_transcription_chars(content),
-                fallback_info=result.get('fallback_info')
-            )
-        
-        return result['content'].strip()
+        return self._track_usage(result, token_tracker)
         
     def generate_final_transcription(self, context: Dict[str, Any], token_tracker: TokenTracker = None) -> str:
         """
@@ -523,34 +1415,14 @@ class StageModel(FinalStageModel):
         # Call parent validation
         super().generate_final_transcription(context, token_tracker)
         
-        # Get stage 4 reviews using actual Stage 4 model configs
-        stage4_reviews = {}
-        for model_num in range(1, 4):
-            stage4_config = get_model_init_params(4, model_num)
-            key = f"Stage 4 Model {model_num} - {stage4_config['provider'].title()} {stage4_config['name']} Review"
-            if key in context:
-                stage4_reviews[key] = context[key]
-        
         # Get prompt from Stage5
-        prompt = Stage5.get_prompt(stage4_reviews)
+        prompt, _ = self._build_stage_prompt(context)
         
         # Call provider's API
         result = self._generate_content(prompt)
         
         # Track token usage if tracker provided
-        if token_tracker:
-            content = result['content'].strip()
-            token_tracker.add_usage(
-                stage=f"Stage {self.stage}",
-                model=f"Stage {self.stage} Model {self.model_num} - {self.provider.title()} {self.model_name}",
-                model_name=self.model_name,
-                input_tokens=result['usage']['input_tokens'],
-                output_tokens=result['usage']['output_tokens'],
-                char_count=self._extract_transcription_chars(content),
-                fallback_info=result.get('fallback_info')
-            )
-        
-        return result['content'].strip()
+        return self._track_usage(result, token_tracker)
         
     def add_punctuation(self, text: str, token_tracker: TokenTracker = None) -> str:
         """
@@ -570,25 +1442,13 @@ class StageModel(FinalStageModel):
         super().add_punctuation(text, token_tracker)
         
         # Get prompt from Stage6
-        prompt = Stage6.get_prompt(text)
+        prompt, _ = self._build_stage_prompt(text)
         
         # Call provider's API
         result = self._generate_content(prompt)
         
         # Track token usage if tracker provided
-        if token_tracker:
-            content = result['content'].strip()
-            token_tracker.add_usage(
-                stage=f"Stage {self.stage}",
-                model=f"Stage {self.stage} Model {self.model_num} - {self.provider.title()} {self.model_name}",
-                model_name=self.model_name,
-                input_tokens=result['usage']['input_tokens'],
-                output_tokens=result['usage']['output_tokens'],
-                char_count=self._extract_transcription_chars(content),
-                fallback_info=result.get('fallback_info')
-            )
-        
-        return result['content'].strip()
+        return self._track_usage(result, token_tracker)
         
     def translate_to_english(self, text: str, token_tracker: TokenTracker = None) -> str:
         """
@@ -608,25 +1468,13 @@ class StageModel(FinalStageModel):
         super().translate_to_english(text, token_tracker)
         
         # Get prompt from Stage7
-        prompt = Stage7.get_prompt(text)
+        prompt, _ = self._build_stage_prompt(text)
         
         # Call provider's API
         result = self._generate_content(prompt)
         
         # Track token usage if tracker provided
-        if token_tracker:
-            content = result['content'].strip()
-            token_tracker.add_usage(
-                stage=f"Stage {self.stage}",
-                model=f"Stage {self.stage} Model {self.model_num} - {self.provider.title()} {self.model_name}",
-                model_name=self.model_name,
-                input_tokens=result['usage']['input_tokens'],
-                output_tokens=result['usage']['output_tokens'],
-                char_count=self._extract_transcription_chars(content),
-                fallback_info=result.get('fallback_info')
-            )
-        
-        return result['content'].strip()
+        return self._track_usage(result, token_tracker)
         
     def generate_commentary(self, chinese_text: str, english_text: str, token_tracker: TokenTracker = None) -> str:
         """
@@ -647,22 +1495,10 @@ class StageModel(FinalStageModel):
         super().generate_commentary(chinese_text, english_text, token_tracker)
         
         # Get prompt from Stage8
-        prompt = Stage8.get_prompt(chinese_text, english_text)
+        prompt, _ = self._build_stage_prompt(chinese_text, english_text)
         
         # Call provider's API
         result = self._generate_content(prompt)
         
         # Track token usage if tracker provided
-        if token_tracker:
-            content = result['content'].strip()
-            token_tracker.add_usage(
-                stage=f"Stage {self.stage}",
-                model=f"Stage {self.stage} Model {self.model_num} - {self.provider.title()} {self.model_name}",
-                model_name=self.model_name,
-                input_tokens=result['usage']['input_tokens'],
-                output_tokens=result['usage']['output_tokens'],
-                char_count=self._extract_transcription_chars(content),
-                fallback_info=result.get('fallback_info')
-            )
-        
-        return result['content'].strip()
+        return self._track_usage(result, token_tracker)
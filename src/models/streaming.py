@@ -0,0 +1,345 @@
+"""
+Streaming of provider responses.
+
+Each supported SDK can stream a response as a sequence of chunks. The helpers
+here request a stream, read the text and usage out of each provider's chunk
+format, time the stream (time to first token, inter-token latency) and abort
+a stream that stops producing chunks, so a stalled connection is retried
+instead of holding its provider slot until the HTTP timeout.
+"""
+import os
+import time
+import queue
+import asyncio
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from models.usage_adapters import _get, anthropic_usage, google_usage, openai_usage
+
+# Extra create() arguments that turn on streaming for each provider
+STREAM_KWARGS: Dict[str, Dict[str, Any]] = {
+    'google': {'stream': True},
+    # OpenAI-compatible APIs only report usage in a stream when asked to
+    'openai': {'stream': True, 'stream_options': {'include_usage': True}},
+    'openrouter': {'stream': True, 'stream_options': {'include_usage': True}},
+    'groq': {'stream': True},
+    'together': {'stream': True},
+    'anthropic': {'stream': True}
+}
+
+class StreamStalledError(RuntimeError):
+    """Raised when a stream produces no chunk within its timeout."""
+
+class StreamCancelledError(RuntimeError):
+    """Raised when a stream is abandoned by its caller (e.g. a hedged request that lost)."""
+
+def google_chunk_text(chunk: Any) -> str:
+    """Read the text of a google.generativeai stream chunk."""
+    try:
+        return chunk.text or ''
+    except ValueError:
+        # Chunks without text parts (e.g. the final finish-reason chunk) raise on .text
+        return ''
+
+def openai_chunk_text(chunk: Any) -> str:
+    """Read the text of an OpenAI-compatible chat completion chunk."""
+    choices = _get(chunk, 'choices')
+    if not choices:
+        return ''
+    return _get(_get(choices[0], 'delta'), 'content') or ''
+
+def anthropic_chunk_text(event: Any) -> str:
+    """Read the text of an Anthropic stream event."""
+    if _get(event, 'type') != 'content_block_delta':
+        return ''
+    return _get(_get(event, 'delta'), 'text') or ''
+
+def groq_chunk_usage(chunk: Any) -> Optional[Dict[str, int]]:
+    """Read usage from a Groq chunk, which reports it under x_groq on the last chunk."""
+    return openai_usage(_get(chunk, 'x_groq')) or openai_usage(chunk)
+
+class _AnthropicUsage:
+    """Collects usage spread over Anthropic's message_start and message_delta events."""
+
+    def __init__(self):
+        self.input_usage = None
+        self.output_tokens = None
+
+    def __call__(self, event: Any) -> Optional[Dict[str, int]]:
+        event_type = _get(event, 'type')
+        if event_type == 'message_start':
+            usage = anthropic_usage(_get(event, 'message'))
+            if usage:
+                # Input and prompt cache tokens are only reported here
+                self.input_usage = {k: v for k, v in usage.items() if k != 'output_tokens'}
+        elif event_type == 'message_delta':
+            # message_delta carries the cumulative output token count
+            self.output_tokens = _get(_get(event, 'usage'), 'output_tokens')
+            if self.input_usage is not None and self.output_tokens is not None:
+                return {**self.input_usage, 'output_tokens': int(self.output_tokens)}
+        return None
+
+# Chunk text reader for each provider
+CHUNK_TEXT_READERS: Dict[str, Callable[[Any], str]] = {
+    'google': google_chunk_text,
+    'openai': openai_chunk_text,
+    'openrouter': openai_chunk_text,
+    'groq': openai_chunk_text,
+    'together': openai_chunk_text,
+    'anthropic': anthropic_chunk_text
+}
+
+def _chunk_usage_reader(provider: str) -> Callable[[Any], Optional[Dict[str, int]]]:
+    """Get a reader of the usage reported in a provider's chunks (stateful for Anthropic)."""
+    if provider == 'anthropic':
+        return _AnthropicUsage()
+    if provider == 'google':
+        return google_usage
+    if provider == 'groq':
+        return groq_chunk_usage
+    return openai_usage
+
+def stream_kwargs(provider: str) -> Dict[str, Any]:
+    """
+    Get the create() arguments that stream a provider's response.
+
+    Raises:
+        ValueError: If the provider is not supported
+    """
+    kwargs = STREAM_KWARGS.get(provider)
+    if kwargs is None:
+        raise ValueError(f"Unsupported provider: {provider}")
+    return dict(kwargs)
+
+# Seconds a buffered progressive output holds text before it is written out
+PROGRESSIVE_FLUSH_INTERVAL = 0.5
+
+class ProgressiveOutput:
+    """
+    Appends streamed text to a file as it arrives.
+
+    The file is created on the first chunk, so a request that fails before
+    producing any text leaves nothing behind. A buffered output only collects
+    the text; its owner writes it out with flush (e.g. from a worker thread,
+    so an event loop does not block on disk for every chunk).
+    """
+
+    def __init__(self, path: str, header: str, buffered: bool = False):
+        """
+        Initialize the output.
+
+        Args:
+            path: File the text is appended to
+            header: Line written before the text (e.g. the provider and model)
+            buffered: Hold written text until flush instead of writing each chunk
+        """
+        self.path = path
+        self.header = header
+        self.buffered = buffered
+        self._file = None
+        self._pending: List[str] = []
+        self._flushed_at = time.perf_counter()
+
+    def write(self, text: str):
+        """Append a chunk of text and flush it to disk, or hold it if buffered."""
+        self._pending.append(text)
+        if not self.buffered:
+            self.flush()
+
+    def flush_due(self) -> bool:
+        """Check whether a buffered output has held text for PROGRESSIVE_FLUSH_INTERVAL."""
+        return bool(self._pending) and time.perf_counter() - self._flushed_at >= PROGRESSIVE_FLUSH_INTERVAL
+
+    def flush(self):
+        """Write the held text to disk."""
+        self._flushed_at = time.perf_counter()
+        if not self._pending:
+            return
+        text, self._pending = ''.join(self._pending), []
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            self._file.write(f"<!-- {self.header} -->\n")
+        self._file.write(text)
+        self._file.flush()
+
+    def close(self):
+        """Write any held text and close the file if it was opened."""
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Close and delete the file."""
+        self._pending = []
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class StreamAccumulator:
+    """
+    Collects the text, usage and timing of one streamed response.
+    """
+
+    def __init__(self, provider: str, output: Optional[ProgressiveOutput] = None):
+        """
+        Initialize the accumulator.
+
+        Args:
+            provider: Provider name
+            output: Optional file the text is appended to as it arrives
+        """
+        self._read_text = CHUNK_TEXT_READERS[provider]
+        self._read_usage = _chunk_usage_reader(provider)
+        self.output = output
+        self.parts: List[str] = []
+        self.usage: Optional[Dict[str, int]] = None
+        self.started_at = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.last_token_at: Optional[float] = None
+        self.max_gap = 0.0
+
+    def add(self, chunk: Any):
+        """Record a chunk."""
+        usage = self._read_usage(chunk)
+        if usage:
+            self.usage = usage
+        text = self._read_text(chunk)
+        if not text:
+            return
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self.max_gap = max(self.max_gap, now - self.last_token_at)
+        self.last_token_at = now
+        self.parts.append(text)
+        if self.output is not None:
+            self.output.write(text)
+
+    @property
+    def content(self) -> str:
+        """The text received so far."""
+        return ''.join(self.parts)
+
+    def timing(self, output_tokens: int) -> Dict[str, float]:
+        """
+        Get the timing of the stream.
+
+        Args:
+            output_tokens: Tokens generated, to spread the streaming time over
+
+        Returns:
+            Dict of seconds: 'ttft' (time to first token), 'itl' (mean
+            inter-token latency), 'max_gap' (longest wait between chunks) and
+            'duration' (whole request)
+        """
+        end = self.last_token_at or time.perf_counter()
+        first = self.first_token_at or end
+        return {
+            'ttft': first - self.started_at,
+            'itl': (end - first) / (output_tokens - 1) if output_tokens > 1 else 0.0,
+            'max_gap': self.max_gap,
+            'duration': time.perf_counter() - self.started_at
+        }
+
+    def timeout(self, first_token_timeout: float, stall_timeout: float) -> float:
+        """Get how long to wait for the next chunk."""
+        return stall_timeout if self.first_token_at is not None else first_token_timeout
+
+def _close_stream(stream: Any):
+    """Close a stream's connection if the SDK supports it."""
+    close = getattr(stream, 'close', None)
+    if callable(close):
+        try:
+            close()
+        except Exception:
+            pass
+
+_END = object()
+
+# Seconds between checks of a stream's cancellation flag
+CANCEL_POLL_INTERVAL = 0.1
+
+def consume_stream(stream: Any, accumulator: StreamAccumulator, first_token_timeout: float, stall_timeout: float,
+                   cancelled: Optional[threading.Event] = None):
+    """
+    Read a stream into an accumulator, aborting it if it stalls.
+
+    The SDK iterators block on the socket, so the stream is read on a helper
+    thread and handed over through a queue that can be waited on with a
+    timeout. A stalled stream is closed where the SDK allows; otherwise the
+    helper thread is left to finish on its own.
+
+    Args:
+        stream: Iterable stream returned by the provider's create call
+        accumulator: Accumulator receiving the chunks
+        first_token_timeout: Seconds to wait for the first text
+        stall_timeout: Seconds to wait for each later chunk
+        cancelled: Optional flag that aborts the stream once set
+
+    Raises:
+        StreamStalledError: If no chunk arrives in time
+        StreamCancelledError: If cancelled is set
+    """
+    chunks: queue.Queue = queue.Queue()
+
+    def pump():
+        try:
+            for chunk in stream:
+                chunks.put((chunk, None))
+            chunks.put((_END, None))
+        except BaseException as e:
+            chunks.put((None, e))
+
+    threading.Thread(target=pump, name='stream-reader', daemon=True).start()
+    while True:
+        timeout = accumulator.timeout(first_token_timeout, stall_timeout)
+        deadline = time.monotonic() + timeout
+        while True:
+            if cancelled is not None and cancelled.is_set():
+                _close_stream(stream)
+                raise StreamCancelledError("Stream cancelled")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                _close_stream(stream)
+                raise StreamStalledError(f"Stream stalled: no data for {timeout:g}s")
+            try:
+                chunk, error = chunks.get(timeout=min(remaining, CANCEL_POLL_INTERVAL) if cancelled is not None else remaining)
+                break
+            except queue.Empty:
+                continue
+        if error is not None:
+            raise error
+        if chunk is _END:
+            return
+        accumulator.add(chunk)
+
+async def consume_stream_async(stream: Any, accumulator: StreamAccumulator, first_token_timeout: float, stall_timeout: float):
+    """
+    Async variant of consume_stream for the SDKs' async streams.
+
+    A buffered progressive output is written out from a worker thread every
+    PROGRESSIVE_FLUSH_INTERVAL seconds instead of on the event loop per chunk.
+    """
+    output = accumulator.output
+    iterator = stream.__aiter__()
+    while True:
+        timeout = accumulator.timeout(first_token_timeout, stall_timeout)
+        try:
+            chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+        except StopAsyncIteration:
+            return
+        except asyncio.TimeoutError:
+            close = getattr(stream, 'close', None)
+            if callable(close):
+                try:
+                    result = close()
+                    if asyncio.iscoroutine(result):
+                        await result
+                except Exception:
+                    pass
+            raise StreamStalledError(f"Stream stalled: no data for {timeout:g}s")
+        accumulator.add(chunk)
+        if output is not None and output.buffered and output.flush_due():
+            await asyncio.to_thread(output.flush)
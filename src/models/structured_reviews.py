@@ -0,0 +1,101 @@
+"""
+Structured review outputs for Stages 3-5.
+
+By default the reviews are free-form reports, and each later stage receives
+the previous stage's reports whole, chain-of-thought included. With
+structured reviews, the Stage 3-5 models answer with a JSON object holding
+the recommended transcription, the character swaps (each with its category),
+the remaining uncertainties and the reasoning. Only the fields the next stage
+needs are passed on; the reasoning is archived next to the stage reports.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+# Stages whose models answer with a structured review
+REVIEW_STAGES = (3, 4, 5)
+
+# Why a character was swapped (the categories Stage 4 is asked for)
+SWAP_CATEGORIES = ('image_recognition', 'grammar', 'context', 'other')
+
+def _load_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Read a JSON object from a response, ignoring code fences and text around it."""
+    text = text.strip()
+    candidates = [text]
+    # Models without a JSON mode may wrap the object in ```json fences or prose
+    start, end = text.find('{'), text.rfind('}')
+    if 0 <= start < end:
+        candidates.append(text[start:end + 1])
+    for candidate in candidates:
+        try:
+            value = json.loads(candidate)
+        except ValueError:
+            continue
+        if isinstance(value, dict):
+            return value
+    return None
+
+def _string_items(items: Any, fields: tuple) -> List[Dict[str, str]]:
+    """Keep the list entries that are objects, with their given fields as strings."""
+    if not isinstance(items, list):
+        return []
+    return [
+        {field: str(item.get(field, '')).strip() for field in fields}
+        for item in items if isinstance(item, dict)
+    ]
+
+def parse_review(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Parse a structured review.
+
+    Args:
+        text: Response of a Stage 3-5 model
+
+    Returns:
+        Dict with 'transcription', 'swaps', 'uncertainties' and 'reasoning',
+        or None if the response holds no review with a transcription
+    """
+    value = _load_json_object(text)
+    if value is None or not isinstance(value.get('transcription'), str) or not value['transcription'].strip():
+        return None
+    swaps = _string_items(value.get('swaps'), ('original', 'replacement', 'category', 'justification'))
+    for swap in swaps:
+        if swap['category'] not in SWAP_CATEGORIES:
+            swap['category'] = 'other'
+    return {
+        'transcription': value['transcription'].strip(),
+        'swaps': swaps,
+        'uncertainties': _string_items(value.get('uncertainties'), ('text', 'note')),
+        'reasoning': str(value.get('reasoning', '')).strip()
+    }
+
+def compact_review(review: Dict[str, Any], stage: int) -> str:
+    """
+    Get the part of a review the next stage needs.
+
+    Stages 3 and 4 pass on the transcription, swaps and uncertainties, without
+    the reasoning. Stage 5 passes on only the transcription, which Stage 6
+    punctuates.
+
+    Args:
+        review: Review from parse_review
+        stage: Stage that wrote the review
+
+    Returns:
+        Text passed to the next stage
+    """
+    if stage == 5:
+        return review['transcription']
+    compact = {key: review[key] for key in ('transcription', 'swaps', 'uncertainties')}
+    return json.dumps(compact, ensure_ascii=False)
+
+def format_reviews(reviews: Dict[str, str]) -> str:
+    """
+    Format compacted reviews for the next stage's prompt.
+
+    Args:
+        reviews: Compacted review of each model, by result key
+
+    Returns:
+        One labelled section per review
+    """
+    return '\n\n'.join(f"[{key}]\n{review}" for key, review in reviews.items())
@@ -0,0 +1,105 @@
+"""
+Per-provider adapters that read token usage reported by the provider.
+
+Every supported SDK returns the real token counts with its response. The
+adapters pull them out in a common {'input_tokens', 'output_tokens'} shape so
+callers only fall back to local tokenization when a response carries none.
+
+Prompt tokens served from a provider's prompt cache are reported as
+'cache_read_tokens', and tokens written to it as 'cache_write_tokens'. Both
+are part of 'input_tokens', which always counts the whole prompt (Anthropic
+reports cached tokens apart from input_tokens, so they are added back).
+"""
+from typing import Any, Callable, Dict, Optional
+
+def _get(obj: Any, name: str) -> Any:
+    """Read a field from an SDK object or a plain dict."""
+    if obj is None:
+        return None
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+def _build_usage(input_tokens: Any, output_tokens: Any) -> Optional[Dict[str, int]]:
+    """Build a usage dict, or None if either count is missing."""
+    if input_tokens is None or output_tokens is None:
+        return None
+    return {'input_tokens': int(input_tokens), 'output_tokens': int(output_tokens)}
+
+def _add_cache_usage(usage: Optional[Dict[str, int]], cache_read: Any, cache_write: Any = None) -> Optional[Dict[str, int]]:
+    """Add the prompt cache token counts a provider reported to a usage dict."""
+    if usage is None:
+        return None
+    if isinstance(cache_read, int) and cache_read > 0:
+        usage['cache_read_tokens'] = cache_read
+    if isinstance(cache_write, int) and cache_write > 0:
+        usage['cache_write_tokens'] = cache_write
+    return usage
+
+def google_usage(response: Any) -> Optional[Dict[str, int]]:
+    """Read usage_metadata from a google.generativeai response."""
+    metadata = _get(response, 'usage_metadata')
+    # Unset protobuf fields read as 0, so an all-zero total means no usage was reported
+    if not _get(metadata, 'total_token_count'):
+        return None
+    usage = _build_usage(
+        _get(metadata, 'prompt_token_count'),
+        _get(metadata, 'candidates_token_count')
+    )
+    return _add_cache_usage(usage, _get(metadata, 'cached_content_token_count'))
+
+def openai_usage(response: Any) -> Optional[Dict[str, int]]:
+    """Read response.usage from an OpenAI-compatible chat completion (OpenAI, OpenRouter, Groq, Together)."""
+    usage = _get(response, 'usage')
+    details = _get(usage, 'prompt_tokens_details')
+    # OpenRouter also reports the tokens written to caches it manages explicitly
+    return _add_cache_usage(
+        _build_usage(_get(usage, 'prompt_tokens'), _get(usage, 'completion_tokens')),
+        _get(details, 'cached_tokens'),
+        _get(details, 'cache_write_tokens')
+    )
+
+def anthropic_usage(response: Any) -> Optional[Dict[str, int]]:
+    """Read response.usage from an Anthropic message."""
+    usage = _get(response, 'usage')
+    input_tokens = _get(usage, 'input_tokens')
+    cache_read = _get(usage, 'cache_read_input_tokens') or 0
+    cache_write = _get(usage, 'cache_creation_input_tokens') or 0
+    if input_tokens is not None:
+        input_tokens = int(input_tokens) + int(cache_read) + int(cache_write)
+    return _add_cache_usage(
+        _build_usage(input_tokens, _get(usage, 'output_tokens')),
+        int(cache_read),
+        int(cache_write)
+    )
+
+# Usage adapter for each provider
+USAGE_ADAPTERS: Dict[str, Callable[[Any], Optional[Dict[str, int]]]] = {
+    'google': google_usage,
+    'openai': openai_usage,
+    'openrouter': openai_usage,
+    'groq': openai_usage,
+    'together': openai_usage,
+    'anthropic': anthropic_usage
+}
+
+def extract_usage(provider: str, response: Any) -> Optional[Dict[str, int]]:
+    """
+    Get the token usage a provider reported for a response.
+
+    Args:
+        provider: Provider name
+        response: Raw provider response
+
+    Returns:
+        Dict with 'input_tokens' and 'output_tokens' (and 'cache_read_tokens'
+        and 'cache_write_tokens' if any), or None if the response does not
+        report usage
+
+    Raises:
+        ValueError: If the provider is not supported
+    """
+    adapter = USAGE_ADAPTERS.get(provider)
+    if adapter is None:
+        raise ValueError(f"Unsupported provider: {provider}")
+    return adapter(response)
@@ -9,8 +9,10 @@ from .stage_prompts import (
     Stage5,
     Stage6,
     Stage7,
-    Stage8
+    Stage8,
+    get_prompt_registry
 )
+from .prompt_registry import PromptRegistry, PromptTemplate, FactsFile
 
 __all__ = [
     'Stage1',
@@ -20,5 +22,9 @@ __all__ = [
     'Stage5',
     'Stage6',
     'Stage7',
-    'Stage8'
+    'Stage8',
+    'get_prompt_registry',
+    'PromptRegistry',
+    'PromptTemplate',
+    'FactsFile'
 ]
@@ -0,0 +1,244 @@
+"""
+Compiled prompt templates and the cached confirmed-facts file.
+
+Every stage prompt starts with the confirmed facts, followed by the stage's
+instructions with the stage inputs filled in. The registry reads the facts
+file once and re-reads it only when its modification time changes, and
+splits each stage template into literal text and fields once, so building a
+prompt is a join of strings. The tokens of each template's fixed text are
+counted when it is compiled, so a prompt's size is known before it is sent.
+Built prompts mark where their fixed text ends, so the request can put it
+first and let the provider cache it.
+"""
+import os
+import sys
+import string
+import threading
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+# Add the src directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.token_counter import count_tokens, count_tokens_batch
+
+# The facts file at the project root
+FACTS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+    'confirmed_facts_do_not_delete.md'
+)
+
+def format_facts_context(facts: str) -> str:
+    """Format confirmed facts as the context that opens every prompt."""
+    return f"""
+CONFIRMED FACTS TO CONSIDER:
+{facts}
+
+"""
+
+class FactsFile:
+    """
+    The confirmed-facts file, read once and re-read when it changes on disk.
+    """
+
+    def __init__(self, path: str = FACTS_PATH):
+        """
+        Initialize the cache.
+
+        Args:
+            path: Path of the facts file
+        """
+        self.path = path
+        self._signature: Optional[Tuple[int, int]] = None
+        self._facts = ''
+        self._lock = threading.Lock()
+
+    def read(self) -> Tuple[str, Tuple[int, int]]:
+        """
+        Get the facts and the file version they were read from.
+
+        The file is stat'ed on every call, and read only if its modification
+        time or size changed since the last read.
+
+        Returns:
+            Tuple of (stripped facts text, (mtime in ns, size))
+        """
+        stat = os.stat(self.path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if signature != self._signature:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self._facts = f.read().strip()
+                self._signature = signature
+            return self._facts, self._signature
+
+class RenderedPrompt(str):
+    """
+    A built prompt that knows which part of it is fixed.
+
+    The first facts_length characters are the facts context, the same in
+    every prompt; up to static_length the text is the same in every prompt
+    built from the template. Providers can cache that prefix. Plain strings
+    used as prompts have no fixed part.
+    """
+
+    def __new__(cls, text: str, facts_length: int = 0, static_length: int = 0):
+        prompt = super().__new__(cls, text)
+        prompt.facts_length = facts_length
+        prompt.static_length = max(facts_length, static_length)
+        return prompt
+
+def split_prompt(prompt: str) -> Tuple[str, str, str]:
+    """
+    Split a prompt into its facts context, the rest of its fixed text, and its variable text.
+
+    Args:
+        prompt: A RenderedPrompt or plain string
+
+    Returns:
+        Tuple of (facts, fixed instructions, variable text); any may be empty,
+        and a plain string is all variable text
+    """
+    facts_length = getattr(prompt, 'facts_length', 0)
+    static_length = getattr(prompt, 'static_length', 0)
+    text = str(prompt)
+    return text[:facts_length], text[facts_length:static_length], text[static_length:]
+
+class PromptTemplate:
+    """
+    A stage prompt split into literal text and named fields.
+
+    Fields use str.format syntax ({name}); literal braces are written {{ }}.
+    Values are inserted with str(), as the f-strings they replace did.
+    """
+
+    def __init__(self, name: str, text: str):
+        """
+        Compile a template.
+
+        Args:
+            name: Template name (e.g. 'stage3')
+            text: Template text
+
+        Raises:
+            ValueError: If the template uses conversions, format specs or
+                positional fields
+        """
+        self.name = name
+        self.literals: List[str] = []
+        self.fields: List[str] = []
+        literal_parts: List[str] = []
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(text):
+            # Escaped braces ({{ }}) split the text into several literals in a row
+            literal_parts.append(literal)
+            if field_name is None:
+                continue
+            if not field_name or field_name.isdigit() or format_spec or conversion:
+                raise ValueError(f"Template {name} may only use plain named fields, got {{{field_name}}}")
+            self.literals.append(''.join(literal_parts))
+            self.fields.append(field_name)
+            literal_parts = []
+        self.literals.append(''.join(literal_parts))
+        self.static_tokens = sum(count_tokens_batch(self.literals))
+
+    def render(self, prefix: str, values: Mapping[str, Any]) -> RenderedPrompt:
+        """
+        Fill in the fields.
+
+        Args:
+            prefix: Text put before the template (the facts context)
+            values: Value of each field
+
+        Returns:
+            The prompt, with the prefix and the text before the first field
+            marked as fixed
+
+        Raises:
+            KeyError: If a field has no value
+        """
+        parts = [prefix, self.literals[0]]
+        for field_name, literal in zip(self.fields, self.literals[1:]):
+            parts.append(str(values[field_name]))
+            parts.append(literal)
+        return RenderedPrompt(''.join(parts), len(prefix), len(prefix) + len(self.literals[0]))
+
+class PromptRegistry:
+    """
+    The compiled stage templates, sharing the cached facts prefix.
+    """
+
+    def __init__(self, templates: Mapping[str, str], facts_file: Optional[FactsFile] = None):
+        """
+        Compile the templates.
+
+        Args:
+            templates: Template text by name
+            facts_file: Facts file whose context opens every prompt
+        """
+        self.facts_file = facts_file or FactsFile()
+        self.templates: Dict[str, PromptTemplate] = {
+            name: PromptTemplate(name, text) for name, text in templates.items()
+        }
+        self._prefix = ''
+        self._prefix_tokens = 0
+        self._prefix_version: Optional[Tuple[int, int]] = None
+        self._lock = threading.Lock()
+
+    def get_prefix(self) -> Tuple[str, int]:
+        """
+        Get the facts context and its token count, refreshed if the facts file changed.
+
+        Returns:
+            Tuple of (prefix text, prefix tokens)
+        """
+        facts, version = self.facts_file.read()
+        with self._lock:
+            if version != self._prefix_version:
+                self._prefix = format_facts_context(facts)
+                self._prefix_tokens = count_tokens(self._prefix)
+                self._prefix_version = version
+            return self._prefix, self._prefix_tokens
+
+    def get_template(self, name: str) -> PromptTemplate:
+        """
+        Get a compiled template.
+
+        Raises:
+            ValueError: If there is no template of that name
+        """
+        try:
+            return self.templates[name]
+        except KeyError:
+            raise ValueError(f"Unknown prompt template: {name}") from None
+
+    def render(self, name: str, **values: Any) -> RenderedPrompt:
+        """
+        Build a prompt: the facts context followed by the filled-in template.
+
+        Args:
+            name: Template name
+            **values: Value of each of the template's fields
+        """
+        prefix, _ = self.get_prefix()
+        return self.get_template(name).render(prefix, values)
+
+    def static_tokens(self, name: str) -> int:
+        """Get the tokens of a prompt's fixed text (facts context and template literals)."""
+        _, prefix_tokens = self.get_prefix()
+        return prefix_tokens + self.get_template(name).static_tokens
+
+    def estimate_tokens(self, name: str, **values: Any) -> int:
+        """
+        Estimate the tokens of a prompt without building it.
+
+        Fixed text is counted once per template; only the field values are
+        tokenized. Token boundaries at the joins may make the estimate differ
+        from a count of the built prompt by a few tokens.
+
+        Args:
+            name: Template name
+            **values: Value of each of the template's fields
+
+        Returns:
+            Estimated prompt tokens
+        """
+        template = self.get_template(name)
+        return self.static_tokens(name) + sum(count_tokens_batch([str(values[field]) for field in template.fields]))
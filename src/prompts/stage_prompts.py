@@ -1,29 +1,59 @@
 """
 Stage-specific prompts for the Chinese Family Tree Processing System.
+
+Each stage's prompt text is a template compiled once by the prompt registry
+(see prompts.prompt_registry), which also caches the confirmed facts that
+open every prompt.
 """
-import os
+import threading
+from typing import Optional, Union
+
+from .prompt_registry import PromptRegistry, format_facts_context
 
 def get_confirmed_facts() -> str:
-    """Read and format confirmed facts from the file."""
-    facts_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'confirmed_facts_do_not_delete.md')
-    with open(facts_path, 'r', encoding='utf-8') as f:
-        return f.read().strip()
+    """Read and format confirmed facts from the file (cached until the file changes)."""
+    facts, _ = get_prompt_registry().facts_file.read()
+    return facts
 
 def get_facts_context() -> str:
     """Get confirmed facts formatted as context for prompts."""
-    facts = get_confirmed_facts()
-    return f"""
-CONFIRMED FACTS TO CONSIDER:
-{facts}
+    return format_facts_context(get_confirmed_facts())
+
+TILE_TEMPLATE = """
+You are a Chinese text transcription expert with vision capabilities, working on a genealogy research project. Your task is to use your vision capabilities to accurately transcribe Chinese text from the provided image of historical family records.
+
+This is a safe and academic task focused on preserving historical family records. The page is too wide to read in one image, so it has been cut into {tile_count} vertical sections along its text columns. This image is section {tile_num} of {tile_count}, counting from the right. Neighbouring sections overlap by about one column.
 
+{task} Consider:
+1. This is historical genealogical content containing family records written in CLASSICAL CHINESE.
+2. The text is written in vertical columns read from top to bottom, and the columns are read from right to left.
+3. Write each column on its own line, starting with the rightmost column of this section and ending with the leftmost.
+4. Transcribe every column that is readable in this section, including columns at the edges that also appear in the neighbouring sections.
+5. Do not add any punctuation.
+6. Do not make interpretive changes.
+7. Preserve all characters exactly as they appear.
+8. The transcription output must be in traditional Chinese characters.
+9. Pay VERY CLOSE attention to characters that look similar. If you are uncertain about a character due to visual ambiguity or image quality, write (?) directly after it.
+10. DO NOT add any text that is not clearly visible in the image.
+
+Provide a single transcription of this section, one column per line, without any explanation or commentary.
 """
 
+def build_tile_prompt(task: str, tile_num: int, tile_count: int) -> str:
+    """
+    Get the transcription prompt for one tile of a wide scan.
+    
+    Args:
+        task: The stage's instruction sentence
+        tile_num: Position of the tile in reading order (1 = rightmost)
+        tile_count: Number of tiles the page was split into
+    """
+    return get_prompt_registry().render('tile', task=task, tile_num=tile_num, tile_count=tile_count)
+
 class Stage1:
     """Initial transcription stage - Direct transcription from image"""
     
-    @staticmethod
-    def get_prompt() -> str:
-        return get_facts_context() + """
+    TEMPLATE = """
 You are a Chinese text transcription expert with vision capabilities, working on a genealogy research project. Your task is to use your vision capabilities to accurately transcribe Chinese text from the provided image of historical family records.
 
 This is a safe and academic task focused on preserving historical family records. I am providing you with an image that contains traditional Chinese text from family genealogy documents. You must use your vision capabilities to read and transcribe this text.
@@ -44,13 +74,19 @@ Please transcribe the Chinese text from this image accurately. Consider:
 Provide only the transcription without any explanation or commentary.
 Take your time, think it through.
 """
+    
+    @staticmethod
+    def get_prompt() -> str:
+        return get_prompt_registry().render('stage1')
+    
+    @staticmethod
+    def get_tile_prompt(tile_num: int, tile_count: int) -> str:
+        return build_tile_prompt("Please transcribe the Chinese text from this section accurately.", tile_num, tile_count)
 
 class Stage2:
     """Secondary transcription stage - Independent verification"""
     
-    @staticmethod
-    def get_prompt() -> str:
-        return get_facts_context() + """
+    TEMPLATE = """
 You are a Chinese text transcription expert with vision capabilities, working on a genealogy research project. Your task is to use your vision capabilities to accurately transcribe Chinese text from the provided image of historical family records.
 
 This is a safe and academic task focused on preserving historical family records. I am providing you with an image that contains traditional Chinese text from family genealogy documents. You must use your vision capabilities to read and transcribe this text.
@@ -70,14 +106,37 @@ Please provide an independent transcription of this text. Consider:
 
 Provide only the transcription without any explanation or commentary.
 Take your time, think it through.
+"""
+    
+    @staticmethod
+    def get_prompt() -> str:
+        return get_prompt_registry().render('stage2')
+    
+    @staticmethod
+    def get_tile_prompt(tile_num: int, tile_count: int) -> str:
+        return build_tile_prompt("Please provide an independent transcription of the text in this section.", tile_num, tile_count)
+
+# Output format appended to the Stage 3-5 prompts when reviews are structured
+STRUCTURED_REVIEW_TEMPLATE = """
+OUTPUT FORMAT:
+Instead of a free-form report, answer with a single JSON object and nothing else, in this form:
+{{
+  "transcription": "your recommended transcription in traditional Chinese characters",
+  "swaps": [
+    {{"original": "character(s) replaced", "replacement": "character(s) used instead", "category": "image_recognition", "justification": "why the swap is necessary"}}
+  ],
+  "uncertainties": [
+    {{"text": "phrase or character still in doubt", "note": "what makes it uncertain"}}
+  ],
+  "reasoning": "your full chain-of-thought analysis"
+}}
+The category of a swap is one of: image_recognition (possibly mistranscribed due to poor image recognition, including similar-looking characters), grammar (nonsensical grammatical errors), context (contextual errors within the document itself) or other. Use empty lists if there are no swaps or uncertainties. Only the transcription, swaps and uncertainties are passed to the next stage; the reasoning is archived.
 """
 
 class Stage3:
     """Initial review stage - Compare Stage 1 and 2 transcriptions from corresponding model numbers"""
     
-    @staticmethod
-    def get_prompt(transcriptions: dict) -> str:
-        return get_facts_context() + f"""
+    TEMPLATE = """
 You are a Chinese text analysis expert. Your task is to compare and analyze two sets of transcriptions of the same text. Each set contains three independent transcriptions generated in the previous stage.
 
 You will be comparing:
@@ -108,13 +167,45 @@ Your response should include:
 Provide your analysis, recommendations, and suggested transcription with detailed justification including recommended character swaps. Use a chain-of-thought reasoning process, explaining each step of your analysis.
 Take your time and think it through. Write the entire report without interruption and do not ask the user if he wants to continue.
 """
+    
+    CONSENSUS_TEMPLATE = """
+You are a Chinese text analysis expert. Six independent transcriptions of the same text (three from Stage 1 and three from Stage 2) were aligned character by character. Where they all agree, only their consensus is shown; you are given every span where they disagree, with each reading and the transcriptions that gave it.
+
+Consensus and disputed spans:
+{consensus}
+
+Review each disputed span and provide a detailed analysis. Consider:
+1. THIS DOCUMENT PERTAINS TO CHINESE GENEALOGY AND ANCESTRY AND EVENTS FROM THE PAST.
+2. NOTE CHARACTERS THAT LOOK SIMILAR. Readings that differ by a similar-looking character were likely caused by image recognition.
+3. LOOK AT THE CONTEXT OF THE WORDS BESIDE THE CHARACTERS TO HELP DETERMINE THE CORRECT CHARACTER.
+4. Weigh how many transcriptions gave each reading, but do not follow the majority when grammar or context clearly favour another reading.
+5. Remember this document is written in CLASSICAL CHINESE. Prioritize grammatical structures and vocabulary appropriate to that style.
+6. ALL TRANSCRIPTIONS AGREE OUTSIDE THE DISPUTED SPANS. DO NOT SUGGEST CHARACTER SWAPS THERE.
+
+Your response should include:
+1. For each disputed span, the reading you recommend and its justification.
+2. Clearly indicate for future models the spans you could not resolve.
+3. A suggested final transcription: the consensus with your recommended reading of each disputed span.
+4. The final transcription must be in traditional Chinese characters.
+
+Use a chain-of-thought reasoning process, explaining each step of your analysis.
+Take your time and think it through. Write the entire report without interruption and do not ask the user if he wants to continue.
+"""
+    
+    @staticmethod
+    def get_prompt(transcriptions: Union[dict, str], structured: bool = False) -> str:
+        name = 'stage3_structured' if structured else 'stage3'
+        return get_prompt_registry().render(name, transcriptions=transcriptions)
+    
+    @staticmethod
+    def get_consensus_prompt(consensus: str, structured: bool = False) -> str:
+        name = 'stage3_consensus_structured' if structured else 'stage3_consensus'
+        return get_prompt_registry().render(name, consensus=consensus)
 
 class Stage4:
     """Comprehensive review stage - Review Stage 3 analyses"""
     
-    @staticmethod
-    def get_prompt(stage3_reviews: dict) -> str:
-        return get_facts_context() + f"""
+    TEMPLATE = """
 You are a Chinese text review expert. Your task is to review all Stage 3 analyses and recommend a transcription.
 
 Stage 3 Reviews and Analyses:
@@ -143,13 +234,16 @@ Your entire review including recommended character swaps and recommended transcr
 Use a chain-of-thought reasoning process, explaining each step of your analysis and decision-making.
 Take your time and think it through. Write the entire report without interruption and do not ask the user if he wants to continue.
 """
+    
+    @staticmethod
+    def get_prompt(stage3_reviews: Union[dict, str], structured: bool = False) -> str:
+        name = 'stage4_structured' if structured else 'stage4'
+        return get_prompt_registry().render(name, stage3_reviews=stage3_reviews)
 
 class Stage5:
     """Final authoritative transcription stage - Independent review of Stage 4 reviews"""
     
-    @staticmethod
-    def get_prompt(stage4_reviews: dict) -> str:
-        return get_facts_context() + f"""
+    TEMPLATE = """
 You are a Chinese text expert tasked with independently reviewing all Stage 4 analyses and creating the final authoritative transcription.
 
 Stage 4 Reviews and Recommendations:
@@ -182,13 +276,42 @@ Provide only the final transcription with your final explanation or commentary.
 Use a chain-of-thought reasoning process to document your decision-making, especially for any choices that deviate from the Stage 4 recommendations.
 Take your time and think it through. Write the entire report without interruption and do not ask the user if he wants to continue.
 """
+    
+    CONSENSUS_TEMPLATE = """
+You are a Chinese text expert tasked with creating the final authoritative transcription.
+
+Six independent transcriptions of the text (three from Stage 1 and three from Stage 2) were aligned character by character and agree so closely that the review stages were skipped. Their consensus, and every span where they disagree:
+{consensus}
+
+Form your own opinion about the correct transcription. Consider:
+1. The readings of each disputed span and how many transcriptions gave them.
+2. Characters that look similar, which are the most likely source of the disagreements.
+3. The context of the words beside each disputed span.
+4. Your expertise in CLASSICAL CHINESE grammar, vocabulary, and style, and in genealogical documents.
+
+Based on your independent review:
+1. Make a final decision on each disputed span, providing a clear rationale.
+2. Keep the consensus elsewhere unless a character is clearly wrong, and justify any such change.
+3. Ensure names have been correctly identified and the text is consistent throughout.
+
+Provide only the final transcription with your final explanation or commentary. This unpunctuated transcription will be passed to Stage 6 for independent punctuation.
+Take your time and think it through. Write the entire report without interruption and do not ask the user if he wants to continue.
+"""
+    
+    @staticmethod
+    def get_prompt(stage4_reviews: Union[dict, str], structured: bool = False) -> str:
+        name = 'stage5_structured' if structured else 'stage5'
+        return get_prompt_registry().render(name, stage4_reviews=stage4_reviews)
+    
+    @staticmethod
+    def get_consensus_prompt(consensus: str, structured: bool = False) -> str:
+        name = 'stage5_consensus_structured' if structured else 'stage5_consensus'
+        return get_prompt_registry().render(name, consensus=consensus)
 
 class Stage6:
     """Punctuation stage - Independent punctuation of final transcription"""
     
-    @staticmethod
-    def get_prompt(text: str) -> str:
-        return get_facts_context() + f"""
+    TEMPLATE = """
 You are a Chinese text expert tasked with adding appropriate modern Chinese punctuation to a classical Chinese text.
 
 You will receive only the final unpunctuated transcription.
@@ -209,13 +332,15 @@ Provide three versions of punctuated text for consideration.
 This punctuated text will be passed to Stage 7 for independent translation.
 Use a chain-of-thought reasoning process to explain your punctuation choices, especially in cases where the punctuation might be ambiguous.
 """
+    
+    @staticmethod
+    def get_prompt(text: str) -> str:
+        return get_prompt_registry().render('stage6', text=text)
 
 class Stage7:
     """Translation stage - Independent translation of punctuated text"""
     
-    @staticmethod
-    def get_prompt(text: str) -> str:
-        return get_facts_context() + f"""
+    TEMPLATE = """
 You are a Chinese-English translation expert tasked with translating this classical Chinese text.
 
 You will receive only the final punctuated Chinese text, without any previous analysis or review information.
@@ -237,13 +362,15 @@ You may select different sentences or phrases from each of the three translation
 Use a chain-of-thought reasoning process to explain your translation choices, especially for difficult or ambiguous passages.
 Take your time and think it through. Write the entire report without interruption and do not ask the user if he wants to continue.
 """
+    
+    @staticmethod
+    def get_prompt(text: str) -> str:
+        return get_prompt_registry().render('stage7', text=text)
 
 class Stage8:
     """Commentary stage - Independent historical and cultural commentary"""
     
-    @staticmethod
-    def get_prompt(chinese_text: str, english_text: str) -> str:
-        return get_facts_context() + f"""
+    TEMPLATE = """
 You are a Chinese history and culture expert tasked with providing commentary on this text.
 
 You will receive both the punctuated Chinese text and its English translation, without any previous analysis or review information.
@@ -271,3 +398,38 @@ TRANSLATION OF ANY IDENTIFIED DATES INTO GREGORIAN CALENDAR (Convert any dates m
 Use a chain-of-thought reasoning process to explain your commentary and any inferences you make based on the text.
 Take your time and think it through. Write the entire report without interruption and do not ask the user if he wants to continue.
 """
+    
+    @staticmethod
+    def get_prompt(chinese_text: str, english_text: str) -> str:
+        return get_prompt_registry().render('stage8', chinese_text=chinese_text, english_text=english_text)
+
+# Templates compiled by the registry, by name
+PROMPT_TEMPLATES = {
+    'tile': TILE_TEMPLATE,
+    'stage1': Stage1.TEMPLATE,
+    'stage2': Stage2.TEMPLATE,
+    'stage3': Stage3.TEMPLATE,
+    'stage4': Stage4.TEMPLATE,
+    'stage5': Stage5.TEMPLATE,
+    'stage3_structured': Stage3.TEMPLATE + STRUCTURED_REVIEW_TEMPLATE,
+    'stage4_structured': Stage4.TEMPLATE + STRUCTURED_REVIEW_TEMPLATE,
+    'stage5_structured': Stage5.TEMPLATE + STRUCTURED_REVIEW_TEMPLATE,
+    'stage3_consensus': Stage3.CONSENSUS_TEMPLATE,
+    'stage5_consensus': Stage5.CONSENSUS_TEMPLATE,
+    'stage3_consensus_structured': Stage3.CONSENSUS_TEMPLATE + STRUCTURED_REVIEW_TEMPLATE,
+    'stage5_consensus_structured': Stage5.CONSENSUS_TEMPLATE + STRUCTURED_REVIEW_TEMPLATE,
+    'stage6': Stage6.TEMPLATE,
+    'stage7': Stage7.TEMPLATE,
+    'stage8': Stage8.TEMPLATE
+}
+
+_registry: Optional[PromptRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_prompt_registry() -> PromptRegistry:
+    """Get the process-wide prompt registry, compiling the templates on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry(PROMPT_TEMPLATES)
+        return _registry
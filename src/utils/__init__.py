@@ -3,23 +3,36 @@ Utility functions and classes for the Chinese Family Tree Processing System.
 """
 import sys
 import os
+import importlib
 
 # Add the src directory to the Python path
 current_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if current_dir not in sys.path:
     sys.path.append(current_dir)
 
-from .token_counter import TokenTracker, TokenUsage
-from .image_utils import (
-    load_image,
-    get_image_info,
-    validate_image,
-    encode_image_for_vision_models
-)
+# Public names and the submodules that define them, imported on first access
+# so that importing one utility does not load the others' dependencies
+_EXPORTS = {
+    'TokenTracker': '.token_counter',
+    'TokenUsage': '.token_counter',
+    'ImageAsset': '.image_utils',
+    'load_image': '.image_utils',
+    'get_image_info': '.image_utils',
+    'validate_image': '.image_utils',
+    'encode_image_for_vision_models': '.image_utils'
+}
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 __all__ = [
     'TokenTracker',
     'TokenUsage',
+    'ImageAsset',
     'load_image',
     'get_image_info',
     'validate_image',
@@ -0,0 +1,287 @@
+"""
+Edit distance and alignment of long transcriptions.
+
+Comparing transcriptions (building a consensus, scoring character error
+rates, finding what a stage changed) needs the Levenshtein distance and
+alignment of texts several thousand characters long. A pure-Python dynamic
+program visits every cell of the len(a) x len(b) table one at a time.
+Here the table is computed with Myers' bit-parallel algorithm: a column of
+the table is held as two bit vectors (the rows where the distance goes up or
+down by one) in Python integers, so each character costs a few big-integer
+operations instead of len(a) cell updates.
+
+- levenshtein and character_error_rate keep only the current column.
+- get_opcodes keeps every column and traces the alignment back through them,
+  reading any cell as a count of bits.
+- pairwise_distances compares every pair of a set of texts, building each
+  text's bit masks once.
+
+Run this module to benchmark it against a pure-Python dynamic program:
+
+    python src/utils/alignment.py [--length 1000] [--candidates 6] [--runs 3]
+"""
+import sys
+import time
+import random
+import argparse
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+def _pattern_masks(pattern: str) -> Dict[str, int]:
+    """Get the bit mask of the positions of each character of a pattern."""
+    masks: Dict[str, int] = {}
+    for index, character in enumerate(pattern):
+        masks[character] = masks.get(character, 0) | (1 << index)
+    return masks
+
+def _myers_distance(masks: Dict[str, int], length: int, text: str, columns: Optional[List[Tuple[int, int]]] = None) -> int:
+    """
+    Levenshtein distance of a pattern to a text, using Myers' bit-parallel algorithm.
+
+    Bit k of a column's positive (negative) vector is set if the distance
+    goes up (down) by one from row k to row k + 1 of the table.
+
+    Args:
+        masks: Bit masks of the pattern (see _pattern_masks)
+        length: Length of the pattern (at least 1)
+        text: Text compared with the pattern
+        columns: Optional list the (positive, negative) vectors of the
+            column of each character of the text are appended to
+
+    Returns:
+        Edit distance
+    """
+    full = (1 << length) - 1
+    last = 1 << (length - 1)
+    # Every row of the first column is one more than the row above it
+    positive, negative = full, 0
+    score = length
+    for character in text:
+        match = masks.get(character, 0)
+        vertical = match | negative
+        horizontal = ((((match & positive) + positive) & full) ^ positive) | match
+        horizontal_positive = negative | (~(horizontal | positive) & full)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last:
+            score += 1
+        elif horizontal_negative & last:
+            score -= 1
+        # The first row grows by one per character of the text
+        horizontal_positive = ((horizontal_positive << 1) | 1) & full
+        horizontal_negative = (horizontal_negative << 1) & full
+        positive = horizontal_negative | (~(vertical | horizontal_positive) & full)
+        negative = horizontal_positive & vertical
+        if columns is not None:
+            columns.append((positive, negative))
+    return score
+
+def levenshtein(a: str, b: str) -> int:
+    """
+    Get the Levenshtein distance of two texts.
+
+    Args:
+        a: First text
+        b: Second text
+
+    Returns:
+        Least insertions, deletions and substitutions turning a into b
+    """
+    # The shorter text is the pattern, keeping the bit vectors small
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return len(b)
+    return _myers_distance(_pattern_masks(a), len(a), b)
+
+def character_error_rate(reference: str, hypothesis: str) -> float:
+    """
+    Get the character error rate of a transcription.
+
+    Args:
+        reference: Correct text
+        hypothesis: Transcription scored against it
+
+    Returns:
+        Edit distance divided by the reference length (0 if both are empty)
+    """
+    if not reference:
+        return float(bool(hypothesis))
+    return levenshtein(reference, hypothesis) / len(reference)
+
+def pairwise_distances(texts: Sequence[str]) -> np.ndarray:
+    """
+    Get the Levenshtein distance of every pair of texts.
+
+    Args:
+        texts: Texts to compare
+
+    Returns:
+        Symmetric len(texts) x len(texts) integer matrix of distances
+    """
+    count = len(texts)
+    distances = np.zeros((count, count), dtype=np.int64)
+    for i in range(count):
+        if not texts[i]:
+            for j in range(i + 1, count):
+                distances[i, j] = distances[j, i] = len(texts[j])
+            continue
+        masks = _pattern_masks(texts[i])
+        for j in range(i + 1, count):
+            distances[i, j] = distances[j, i] = _myers_distance(masks, len(texts[i]), texts[j])
+    return distances
+
+def get_opcodes(a: str, b: str) -> List[Tuple[str, int, int, int, int]]:
+    """
+    Align two texts with the fewest edits.
+
+    Unlike difflib.SequenceMatcher, which matches the longest common blocks,
+    the alignment has the least insertions, deletions and substitutions.
+
+    Args:
+        a: First text
+        b: Second text
+
+    Returns:
+        difflib-style opcodes (tag, i1, i2, j1, j2) turning a into b, with
+        tags 'equal', 'replace', 'delete' and 'insert'
+    """
+    if not a or not b:
+        if a:
+            return [('delete', 0, len(a), 0, 0)]
+        return [('insert', 0, 0, 0, len(b))] if b else []
+    columns = [((1 << len(a)) - 1, 0)]
+    distance = _myers_distance(_pattern_masks(a), len(a), b, columns)
+
+    def cell(i: int, j: int) -> int:
+        # Distance of a[:i] and b[:j]: the first row's j plus the steps down column j (bit_count needs Python 3.10)
+        positive, negative = columns[j]
+        rows = (1 << i) - 1
+        return j + (positive & rows).bit_count() - (negative & rows).bit_count()
+
+    # Trace the path back from the last cell, preferring matches and substitutions
+    steps = []
+    i, j = len(a), len(b)
+    current = distance
+    while i > 0 and j > 0:
+        cost = a[i - 1] != b[j - 1]
+        diagonal = cell(i - 1, j - 1)
+        if current == diagonal + cost:
+            steps.append('replace' if cost else 'equal')
+            i, j, current = i - 1, j - 1, diagonal
+            continue
+        positive, negative = columns[j]
+        # The step from row i - 1 to row i of column j
+        up = current - (1 if positive >> (i - 1) & 1 else -1 if negative >> (i - 1) & 1 else 0)
+        if current == up + 1:
+            steps.append('delete')
+            i, current = i - 1, up
+        else:
+            steps.append('insert')
+            j, current = j - 1, current - 1
+    steps.extend(['delete'] * i + ['insert'] * j)
+
+    opcodes = []
+    i = j = 0
+    for tag in reversed(steps):
+        next_i = i + (tag != 'insert')
+        next_j = j + (tag != 'delete')
+        if opcodes and opcodes[-1][0] == tag:
+            opcodes[-1] = (tag, opcodes[-1][1], next_i, opcodes[-1][3], next_j)
+        else:
+            opcodes.append((tag, i, next_i, j, next_j))
+        i, j = next_i, next_j
+    return opcodes
+
+def levenshtein_reference(a: str, b: str) -> int:
+    """Levenshtein distance by a pure-Python dynamic program, the benchmark baseline."""
+    previous = list(range(len(b) + 1))
+    for i, character in enumerate(a, 1):
+        current = [i]
+        for j, other in enumerate(b, 1):
+            current.append(min(previous[j - 1] + (character != other), previous[j] + 1, current[j - 1] + 1))
+        previous = current
+    return previous[-1]
+
+def _make_candidates(length: int, count: int, error_rate: float, seed: int) -> List[str]:
+    """Make transcriptions of one random CJK text, each with random edits."""
+    rng = random.Random(seed)
+    alphabet = [chr(code) for code in range(0x4e00, 0x4e00 + 3000)]
+    base = [rng.choice(alphabet) for _ in range(length)]
+    candidates = []
+    for _ in range(count):
+        characters = []
+        for character in base:
+            roll = rng.random()
+            if roll < error_rate / 3:
+                continue
+            if roll < 2 * error_rate / 3:
+                characters.append(rng.choice(alphabet))
+            else:
+                characters.append(character)
+            if rng.random() < error_rate / 3:
+                characters.append(rng.choice(alphabet))
+        candidates.append(''.join(characters))
+    return candidates
+
+def _best_time(function, runs: int) -> float:
+    """Get the fastest of several timed calls, in seconds."""
+    best = None
+    for _ in range(max(runs, 1)):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark edit distance and alignment against pure Python.')
+    parser.add_argument('--length', type=int, default=1000,
+                        help='Characters per transcription (default: 1000)')
+    parser.add_argument('--candidates', type=int, default=6,
+                        help='Transcriptions compared all-pairs (default: 6)')
+    parser.add_argument('--error-rate', type=float, default=0.05,
+                        help='Share of characters edited in each transcription (default: 0.05)')
+    parser.add_argument('--runs', type=int, default=3,
+                        help='Timed runs of the fast versions; the fastest is used (default: 3)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+    args = parser.parse_args()
+
+    from difflib import SequenceMatcher
+
+    candidates = _make_candidates(args.length, args.candidates, args.error_rate, args.seed)
+    pairs = [(i, j) for i in range(len(candidates)) for j in range(i + 1, len(candidates))]
+    print(f"{len(candidates)} transcriptions of ~{args.length} characters, {len(pairs)} pairs")
+
+    # The pure-Python baseline is slow, so it runs once
+    start = time.perf_counter()
+    reference = [levenshtein_reference(candidates[i], candidates[j]) for i, j in pairs]
+    python_seconds = time.perf_counter() - start
+    fast = pairwise_distances(candidates)
+    if [int(fast[i, j]) for i, j in pairs] != reference:
+        print("FAIL: bit-parallel distances differ from the pure-Python baseline")
+        return 1
+    for a, b in ((candidates[0], candidates[1]), (candidates[0], ''), ('', '')):
+        operations = sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in get_opcodes(a, b) if tag != 'equal')
+        if operations != levenshtein(a, b):
+            print("FAIL: alignment cost differs from the edit distance")
+            return 1
+
+    timings = [
+        ("pure-Python DP, all pairs", python_seconds),
+        ("bit-parallel, all pairs", _best_time(lambda: pairwise_distances(candidates), args.runs)),
+        ("bit-parallel alignment, all pairs", _best_time(
+            lambda: [get_opcodes(candidates[i], candidates[j]) for i, j in pairs], args.runs
+        )),
+        ("difflib opcodes, all pairs", _best_time(
+            lambda: [SequenceMatcher(None, candidates[i], candidates[j], autojunk=False).get_opcodes() for i, j in pairs],
+            args.runs
+        ))
+    ]
+    for name, seconds in timings:
+        print(f"  {name:<34} {seconds * 1000:10.1f} ms  {python_seconds / seconds:8.1f}x")
+    print("OK")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
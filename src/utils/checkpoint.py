@@ -0,0 +1,111 @@
+"""
+Machine-readable checkpoints for pipeline runs.
+
+Every completed stage task's raw output is written to checkpoint.json in the
+run directory, so an interrupted run can be resumed from the first missing
+task instead of starting over. The token usage of each model task is stored
+with it, so the resumed run's reports still count what the earlier run paid.
+"""
+import os
+import json
+import threading
+from datetime import datetime
+from typing import Any, Dict, List
+
+CHECKPOINT_FILENAME = 'checkpoint.json'
+CHECKPOINT_VERSION = 1
+
+class RunCheckpoint:
+    """Completed task outputs and run metadata for one run directory."""
+
+    def __init__(self, output_dir: str, resume: bool = False):
+        """
+        Initialize the checkpoint for a run directory.
+
+        Args:
+            output_dir: Run directory holding checkpoint.json
+            resume: Load an existing checkpoint instead of starting a new one
+
+        Raises:
+            FileNotFoundError: If resume is True and no checkpoint exists
+            ValueError: If the checkpoint file has an unsupported version
+        """
+        self.path = os.path.join(output_dir, CHECKPOINT_FILENAME)
+        self._lock = threading.Lock()
+        self.metadata: Dict[str, Any] = {}
+        self.tasks: Dict[str, Any] = {}
+        self.usage: Dict[str, List[Dict[str, Any]]] = {}
+
+        if resume:
+            data = self.read(output_dir)
+            self.metadata = data.get('metadata', {})
+            self.tasks = data.get('tasks', {})
+            self.usage = data.get('usage', {})
+
+    @staticmethod
+    def read(output_dir: str) -> Dict[str, Any]:
+        """
+        Read the raw checkpoint data of a run directory.
+
+        Args:
+            output_dir: Run directory holding checkpoint.json
+
+        Returns:
+            Dict with 'version', 'metadata', 'tasks' and 'usage'
+
+        Raises:
+            FileNotFoundError: If no checkpoint exists
+            ValueError: If the checkpoint file has an unsupported version
+        """
+        path = os.path.join(output_dir, CHECKPOINT_FILENAME)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No checkpoint found in {output_dir}")
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version in {path}: {data.get('version')}")
+        return data
+
+    def set_metadata(self, **metadata: Any):
+        """Record run metadata (e.g. image_path) and save."""
+        with self._lock:
+            self.metadata.update(metadata)
+            self._write()
+
+    def save_usage(self, name: str, records: List[Dict[str, Any]]):
+        """
+        Record the token usage of a task and save.
+
+        Args:
+            name: Stage graph task name
+            records: UsageRecorder.records of the task's model calls
+        """
+        with self._lock:
+            self.usage[name] = records
+            self._write()
+
+    def save_task(self, name: str, output: Any):
+        """
+        Record a completed task's output and save.
+
+        Args:
+            name: Stage graph task name (e.g. "stage3.model2" or "stage5")
+            output: JSON-serializable task output
+        """
+        with self._lock:
+            self.tasks[name] = output
+            self._write()
+
+    def _write(self):
+        """Atomically write the checkpoint file."""
+        data = {
+            'version': CHECKPOINT_VERSION,
+            'updated': datetime.now().isoformat(),
+            'metadata': self.metadata,
+            'tasks': self.tasks,
+            'usage': self.usage
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
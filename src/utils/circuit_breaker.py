@@ -0,0 +1,302 @@
+"""
+Circuit breakers for provider models.
+
+When a provider has an outage, every call to it waits for its error (and its
+retries) before falling back. A breaker watches the outcome of each model's
+recent requests; once too many of them fail (or run slower than a
+threshold), it opens and calls are sent straight to the fallback model. After
+a cooldown the breaker lets a few probe requests through (half-open) and
+closes again once one succeeds.
+
+Breakers are shared by every image in the process. With a state file, an
+open breaker is also seen by other processes, so a batch split over several
+processes stops calling the failing model together.
+"""
+import os
+import time
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Iterator, Optional, Tuple
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Seconds between reads of the shared state file by a closed breaker
+SHARED_STATE_POLL_SECONDS = 1.0
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling a model whose breaker is open."""
+
+@dataclass(frozen=True)
+class BreakerPolicy:
+    """
+    When a breaker opens and how it recovers.
+
+    Attributes:
+        window: Recent requests whose outcome is considered
+        min_calls: Requests in the window before the breaker may open
+        error_rate: Fraction of failed (or slow) requests that opens the breaker
+        slow_call_seconds: Latency above which a request counts as failed, or None
+        cooldown: Seconds an open breaker waits before letting probes through
+        half_open_probes: Probe requests allowed at once while half-open
+    """
+    window: int = 20
+    min_calls: int = 5
+    error_rate: float = 0.5
+    slow_call_seconds: Optional[float] = None
+    cooldown: float = 30.0
+    half_open_probes: int = 1
+
+class CircuitStateStore:
+    """
+    Open breakers recorded in a SQLite file shared between processes.
+    """
+
+    def __init__(self, path: str):
+        """
+        Initialize the store.
+
+        Args:
+            path: State file; created if missing
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS circuits ('
+            'name TEXT PRIMARY KEY, open_until REAL NOT NULL, reason TEXT)'
+        )
+        self._conn.commit()
+
+    def get_open_until(self, name: str) -> Optional[float]:
+        """Get the time (time.time()) until which a breaker is open, or None if it is closed."""
+        with self._lock:
+            row = self._conn.execute('SELECT open_until FROM circuits WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_open(self, name: str, open_until: float, reason: str):
+        """Record an open breaker."""
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO circuits (name, open_until, reason) VALUES (?, ?, ?)',
+                (name, open_until, reason)
+            )
+            self._conn.commit()
+
+    def set_closed(self, name: str):
+        """Record a closed breaker."""
+        with self._lock:
+            self._conn.execute('DELETE FROM circuits WHERE name = ?', (name,))
+            self._conn.commit()
+
+class CircuitBreaker:
+    """
+    Breaker of one provider model.
+    """
+
+    def __init__(self, name: str, policy: BreakerPolicy, store: Optional[CircuitStateStore] = None):
+        """
+        Initialize the breaker.
+
+        Args:
+            name: Name of the model (e.g. 'openai/gpt-4-turbo')
+            policy: Opening and recovery policy
+            store: Optional state file shared with other processes
+        """
+        self.name = name
+        self.policy = policy
+        self.store = store
+        self.state = CLOSED
+        self.open_until = 0.0
+        self._outcomes: Deque[bool] = deque(maxlen=policy.window)
+        self._probes = 0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def configure(self, policy: BreakerPolicy):
+        """Apply a new policy, keeping the current state."""
+        with self._lock:
+            if policy == self.policy:
+                return
+            self.policy = policy
+            self._outcomes = deque(self._outcomes, maxlen=policy.window)
+
+    def _open(self, reason: str):
+        """Open the breaker. Must be called with the lock held."""
+        self.state = OPEN
+        self.open_until = time.time() + self.policy.cooldown
+        self._outcomes.clear()
+        print(f"Circuit for {self.name} opened ({reason}); sending its calls to the fallback for {self.policy.cooldown:g}s")
+        if self.store is not None:
+            self.store.set_open(self.name, self.open_until, reason)
+
+    def _close(self):
+        """Close the breaker after a successful probe. Must be called with the lock held."""
+        self.state = CLOSED
+        self._outcomes.clear()
+        print(f"Circuit for {self.name} closed; probe request succeeded")
+        if self.store is not None:
+            self.store.set_closed(self.name)
+
+    def _check_shared_state(self, now: float):
+        """Adopt an open state recorded by another process. Must be called with the lock held."""
+        if self.store is None or now - self._checked_at < SHARED_STATE_POLL_SECONDS:
+            return
+        self._checked_at = now
+        open_until = self.store.get_open_until(self.name)
+        if open_until is not None and open_until > max(now, self.open_until if self.state == OPEN else 0.0):
+            self.state = OPEN
+            self.open_until = open_until
+            self._outcomes.clear()
+
+    def allow(self) -> bool:
+        """
+        Check that a request may be sent.
+
+        Returns:
+            True if the request is a half-open probe, False for a normal request
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+        """
+        with self._lock:
+            now = time.time()
+            if self.state != HALF_OPEN:
+                self._check_shared_state(now)
+            if self.state == OPEN:
+                if now < self.open_until:
+                    raise CircuitOpenError(
+                        f"Circuit open for {self.name} for another {self.open_until - now:.1f}s"
+                    )
+                self.state = HALF_OPEN
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.policy.half_open_probes:
+                    raise CircuitOpenError(f"Circuit half-open for {self.name}; waiting for a probe request")
+                self._probes += 1
+                return True
+            return False
+
+    def record(self, failed: bool, probe: bool):
+        """
+        Record the outcome of a request.
+
+        Args:
+            failed: Whether the request failed (or was too slow)
+            probe: Whether the request was a half-open probe (from allow)
+        """
+        with self._lock:
+            if probe:
+                self._probes = max(0, self._probes - 1)
+                if self.state == HALF_OPEN:
+                    if failed:
+                        self._open("probe request failed")
+                    else:
+                        self._close()
+                return
+            if self.state != CLOSED:
+                return
+            self._outcomes.append(failed)
+            failures = sum(self._outcomes)
+            if len(self._outcomes) >= self.policy.min_calls and failures >= self.policy.error_rate * len(self._outcomes):
+                self._open(f"{failures} of its last {len(self._outcomes)} requests failed")
+
+    def release(self, probe: bool):
+        """Return the slot of a request whose outcome says nothing about the model's health."""
+        if probe:
+            with self._lock:
+                self._probes = max(0, self._probes - 1)
+
+    @contextmanager
+    def call(self, is_failure: Callable[[BaseException], bool]) -> Iterator[Dict[str, Any]]:
+        """
+        Guard a request with the breaker.
+
+        Yields a dict the request sets 'latency' in once it succeeds, so slow
+        requests can count as failures.
+
+        Args:
+            is_failure: Whether an error the request raises counts against the model
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+        """
+        probe = self.allow()
+        outcome: Dict[str, Any] = {}
+        try:
+            yield outcome
+        except Exception as e:
+            if is_failure(e):
+                self.record(True, probe)
+            else:
+                self.release(probe)
+            raise
+        except BaseException:
+            self.release(probe)
+            raise
+        latency = outcome.get('latency')
+        slow = self.policy.slow_call_seconds is not None and latency is not None and latency > self.policy.slow_call_seconds
+        self.record(slow, probe)
+
+class CircuitBreakers:
+    """
+    Process-wide breakers, one per provider model.
+    """
+
+    def __init__(self, store: Optional[CircuitStateStore] = None):
+        """
+        Initialize the registry.
+
+        Args:
+            store: Optional state file shared with other processes
+        """
+        self.store = store
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str, model_name: str, policy: BreakerPolicy) -> CircuitBreaker:
+        """
+        Get the breaker of a provider model, applying the given policy.
+
+        Args:
+            provider: Provider name
+            model_name: Model name
+            policy: Opening and recovery policy
+
+        Returns:
+            The model's CircuitBreaker
+        """
+        key = (provider, model_name)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = self._breakers[key] = CircuitBreaker(f"{provider}/{model_name}", policy, self.store)
+                return breaker
+        breaker.configure(policy)
+        return breaker
+
+_registries: Dict[Optional[str], CircuitBreakers] = {}
+_registries_lock = threading.Lock()
+
+def get_circuit_breakers(state_file: Optional[str] = None) -> CircuitBreakers:
+    """
+    Get the process-wide breakers.
+
+    Args:
+        state_file: Optional SQLite file sharing open breakers with other processes
+
+    Returns:
+        The breakers of the state file (or of this process only, if None)
+    """
+    key = os.path.abspath(state_file) if state_file else None
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = CircuitBreakers(CircuitStateStore(key) if key else None)
+        return _registries[key]
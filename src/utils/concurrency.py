@@ -0,0 +1,138 @@
+"""
+Concurrency helpers for running provider calls in parallel.
+"""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_EXCEPTION, wait
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import sys
+import os
+
+# Add the src directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config.config import get_provider_concurrency_limit
+
+class CallCancelledError(RuntimeError):
+    """Raised when a queued call is abandoned because a sibling call failed."""
+
+class ProviderLimiter:
+    """
+    Caps the number of in-flight calls per provider.
+
+    One semaphore is created lazily for each provider, sized from
+    get_provider_concurrency_limit(). A limiter can be shared by any number
+    of stages or images so the cap holds across the whole process.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, int]] = None):
+        """
+        Initialize the limiter.
+
+        Args:
+            limits: Optional per-provider overrides of the configured limits
+        """
+        self._limits = dict(limits or {})
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._async_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._lock = threading.Lock()
+
+    def get_limit(self, provider: str) -> int:
+        """Get the concurrency limit for a provider."""
+        if provider in self._limits:
+            return self._limits[provider]
+        return get_provider_concurrency_limit(provider)
+
+    def _get_semaphore(self, provider: str) -> threading.BoundedSemaphore:
+        """Get or create the semaphore for a provider."""
+        with self._lock:
+            if provider not in self._semaphores:
+                self._semaphores[provider] = threading.BoundedSemaphore(self.get_limit(provider))
+            return self._semaphores[provider]
+
+    @contextmanager
+    def slot(self, provider: str, cancel_event: Optional[threading.Event] = None):
+        """
+        Hold one in-flight slot for a provider.
+
+        Args:
+            provider: Provider name
+            cancel_event: Optional event; if set while waiting, the wait is abandoned
+
+        Raises:
+            CallCancelledError: If cancel_event is set before a slot is acquired
+        """
+        semaphore = self._get_semaphore(provider)
+        while not semaphore.acquire(timeout=0.1):
+            if cancel_event is not None and cancel_event.is_set():
+                raise CallCancelledError(f"Call to {provider} cancelled before it started")
+        try:
+            if cancel_event is not None and cancel_event.is_set():
+                raise CallCancelledError(f"Call to {provider} cancelled before it started")
+            yield
+        finally:
+            semaphore.release()
+
+    @asynccontextmanager
+    async def async_slot(self, provider: str):
+        """
+        Hold one in-flight slot for a provider from a coroutine.
+
+        Async slots are counted separately from thread slots and belong to the
+        event loop that first uses them.
+
+        Args:
+            provider: Provider name
+        """
+        with self._lock:
+            if provider not in self._async_semaphores:
+                self._async_semaphores[provider] = asyncio.Semaphore(self.get_limit(provider))
+            semaphore = self._async_semaphores[provider]
+        async with semaphore:
+            yield
+
+def run_in_parallel(
+    tasks: List[Tuple[Any, str, Callable[[], Any]]],
+    executor: ThreadPoolExecutor,
+    limiter: ProviderLimiter
+) -> Dict[Any, Any]:
+    """
+    Run provider calls concurrently and gather their results in task order.
+
+    Each task is a (key, provider, func) tuple. Calls are bounded by the
+    executor's worker count and by the limiter's per-provider cap. When any
+    call fails, calls that have not started yet are cancelled and the error is
+    raised immediately instead of after the remaining calls finish.
+
+    Args:
+        tasks: List of (key, provider, func) tuples
+        executor: Executor used to run the calls
+        limiter: Per-provider concurrency limiter
+
+    Returns:
+        Dict mapping each task key to its result, in the order of tasks
+
+    Raises:
+        Exception: The first exception raised by any task
+    """
+    cancel_event = threading.Event()
+
+    def _call(provider: str, func: Callable[[], Any]) -> Any:
+        with limiter.slot(provider, cancel_event):
+            return func()
+
+    futures: List[Tuple[Any, Future]] = [
+        (key, executor.submit(_call, provider, func))
+        for key, provider, func in tasks
+    ]
+
+    done, pending = wait([future for _, future in futures], return_when=FIRST_EXCEPTION)
+    for future in done:
+        error = future.exception()
+        if error is not None:
+            cancel_event.set()
+            for other in pending:
+                other.cancel()
+            raise error
+
+    return {key: future.result() for key, future in futures}
@@ -0,0 +1,307 @@
+"""
+Local character-level consensus of the Stage 1-2 transcriptions.
+
+The six transcriptions are aligned character by character into a multiple
+alignment (center-star: the transcription with the least total edit distance
+to all others is the center, and every other one is aligned to it with the
+fewest edits; see utils.alignment). Each column of the alignment
+is voted on; the winning character of each column makes up the consensus,
+and its share of the votes is the character's confidence. Columns where the
+transcriptions disagree are grouped into disputed spans. When the
+transcriptions agree closely enough, the review stages can be skipped; when
+they do not, the reviews only need to see the disputed spans.
+
+Only CJK characters are compared: punctuation, notes in Latin script and
+confidence ratings differ between models without saying anything about the
+text.
+"""
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Tuple
+
+from utils.alignment import get_opcodes, pairwise_distances
+
+# Key under which the consensus is passed to Stage 3 and Stage 5
+CONSENSUS_KEY = 'Local Consensus of Stage 1-2 Transcriptions'
+
+# CJK unified ideographs (with extension A) and compatibility ideographs
+CJK_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+# Consensus characters shown on each side of a disputed span
+DISPUTE_CONTEXT_CHARS = 4
+
+def extract_characters(text: str) -> Tuple[str, List[int]]:
+    """
+    Get the CJK characters of a transcription and where its lines end.
+
+    Args:
+        text: Transcription as returned by a model
+
+    Returns:
+        Tuple of (characters, number of characters before each line break)
+    """
+    characters = []
+    line_ends = []
+    for line in text.splitlines():
+        line_characters = CJK_PATTERN.findall(line)
+        if line_characters:
+            characters.extend(line_characters)
+            line_ends.append(len(characters))
+    return ''.join(characters), line_ends[:-1]
+
+def _align_to_center(center: str, other: str) -> Tuple[List[str], List[str]]:
+    """
+    Align a sequence to the center sequence.
+
+    Args:
+        center: Center sequence
+        other: Sequence to align
+
+    Returns:
+        Tuple of (character of other aligned to each center position, '' for
+        a gap; characters of other inserted before each center position and
+        at the end)
+    """
+    aligned = [''] * len(center)
+    insertions = [''] * (len(center) + 1)
+    for tag, i1, i2, j1, j2 in get_opcodes(center, other):
+        if tag in ('equal', 'replace'):
+            for offset in range(i2 - i1):
+                aligned[i1 + offset] = other[j1 + offset]
+        elif tag == 'insert':
+            insertions[i1] += other[j1:j2]
+    return aligned, insertions
+
+def align_sequences(sequences: List[str]) -> Tuple[List[List[str]], int]:
+    """
+    Build a center-star multiple alignment.
+
+    Args:
+        sequences: Sequences to align (at least one)
+
+    Returns:
+        Tuple of (alignment columns, each holding one symbol per sequence with
+        '' for a gap; index of the center sequence)
+    """
+    center_index = int(pairwise_distances(sequences).sum(axis=1).argmin())
+    center = sequences[center_index]
+
+    alignments = [
+        (list(center), [''] * (len(center) + 1)) if i == center_index else _align_to_center(center, sequence)
+        for i, sequence in enumerate(sequences)
+    ]
+    columns = []
+    for position in range(len(center) + 1):
+        # Insertions before a center position become gap columns in the center
+        width = max(len(insertions[position]) for _, insertions in alignments)
+        for offset in range(width):
+            columns.append([
+                insertions[position][offset] if offset < len(insertions[position]) else ''
+                for _, insertions in alignments
+            ])
+        if position < len(center):
+            columns.append([aligned[position] for aligned, _ in alignments])
+    return columns, center_index
+
+@dataclass(frozen=True)
+class DisputedSpan:
+    """
+    A run of consensus positions where the transcriptions disagree.
+
+    Attributes:
+        start: Index of the span's first consensus character
+        end: Index after its last consensus character (start if the consensus
+            omits the disputed characters)
+        readings: Sources giving each reading of the span, most common first;
+            '' is the reading of sources that omit it
+    """
+    start: int
+    end: int
+    readings: Mapping[str, List[str]]
+
+@dataclass(frozen=True)
+class ConsensusResult:
+    """
+    Consensus of a set of transcriptions.
+
+    Attributes:
+        consensus: Consensus characters, without line breaks
+        confidence: Share of the transcriptions agreeing on each consensus character
+        agreement: Mean share of the transcriptions agreeing on each alignment
+            column, for display; it can stay high while single columns are tied
+        min_support: Smallest share of the transcriptions agreeing on any
+            alignment column
+        sources: Name of each transcription
+        line_ends: Number of consensus characters before each line break
+        disputed: Spans where the transcriptions disagree
+    """
+    consensus: str
+    confidence: List[float]
+    agreement: float
+    min_support: float
+    sources: List[str]
+    line_ends: List[int] = field(default_factory=list)
+    disputed: List[DisputedSpan] = field(default_factory=list)
+
+    @property
+    def text(self) -> str:
+        """The consensus with the line breaks of the center transcription."""
+        lines = []
+        start = 0
+        for end in self.line_ends + [len(self.consensus)]:
+            if end > start:
+                lines.append(self.consensus[start:end])
+                start = end
+        return '\n'.join(lines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get the result as JSON-serializable data."""
+        return {
+            'consensus': self.consensus,
+            'confidence': self.confidence,
+            'agreement': self.agreement,
+            'min_support': self.min_support,
+            'sources': self.sources,
+            'line_ends': self.line_ends,
+            'disputed': [
+                {'start': span.start, 'end': span.end, 'readings': dict(span.readings)}
+                for span in self.disputed
+            ]
+        }
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> 'ConsensusResult':
+        """Rebuild a result from to_dict data."""
+        return cls(
+            consensus=data['consensus'],
+            confidence=list(data['confidence']),
+            agreement=data['agreement'],
+            min_support=data['min_support'],
+            sources=list(data['sources']),
+            line_ends=list(data['line_ends']),
+            disputed=[
+                DisputedSpan(start=span['start'], end=span['end'], readings=dict(span['readings']))
+                for span in data['disputed']
+            ]
+        )
+
+def _group_disputes(
+    columns: List[List[str]], positions: List[int], disputed: List[int], sources: List[str]
+) -> List[DisputedSpan]:
+    """Merge runs of adjacent disputed columns into spans."""
+    groups: List[List[int]] = []
+    for column in disputed:
+        if groups and column == groups[-1][-1] + 1:
+            groups[-1].append(column)
+        else:
+            groups.append([column])
+
+    spans = []
+    for group in groups:
+        sources_by_reading: Dict[str, List[str]] = {}
+        for index, source in enumerate(sources):
+            reading = ''.join(columns[column][index] for column in group)
+            sources_by_reading.setdefault(reading, []).append(source)
+        readings = dict(sorted(sources_by_reading.items(), key=lambda item: -len(item[1])))
+        spans.append(DisputedSpan(start=positions[group[0]], end=positions[group[-1] + 1], readings=readings))
+    return spans
+
+def build_consensus(transcriptions: Mapping[str, str]) -> ConsensusResult:
+    """
+    Align transcriptions and vote on each position.
+
+    Each alignment column goes to its most common symbol, preferring the
+    center transcription's on a tie; a column won by a gap adds no character.
+
+    Args:
+        transcriptions: Transcription text by source name (e.g. result key)
+
+    Returns:
+        ConsensusResult; its agreement and min_support are 0 if there are no
+        CJK characters
+
+    Raises:
+        ValueError: If there are no transcriptions
+    """
+    if not transcriptions:
+        raise ValueError("No transcriptions to build a consensus from")
+    sources = list(transcriptions)
+    extracted = [extract_characters(transcriptions[source]) for source in sources]
+    columns, center_index = align_sequences([characters for characters, _ in extracted])
+    center_line_ends = set(extracted[center_index][1])
+
+    consensus = []
+    confidence = []
+    supports = []
+    line_ends = []
+    # Consensus index of each column, plus one past the last, for locating disputes
+    positions = []
+    disputed = []
+    center_position = 0
+    for index, column in enumerate(columns):
+        positions.append(len(consensus))
+        votes = Counter(column)
+        symbol = max(votes, key=lambda candidate: (votes[candidate], candidate == column[center_index]))
+        support = votes[symbol] / len(sources)
+        supports.append(support)
+        if support < 1.0:
+            disputed.append(index)
+        if symbol:
+            consensus.append(symbol)
+            confidence.append(support)
+        if column[center_index]:
+            center_position += 1
+            if center_position in center_line_ends and (not line_ends or line_ends[-1] < len(consensus)):
+                line_ends.append(len(consensus))
+    positions.append(len(consensus))
+
+    return ConsensusResult(
+        consensus=''.join(consensus),
+        confidence=confidence,
+        agreement=sum(supports) / len(supports) if supports else 0.0,
+        min_support=min(supports, default=0.0),
+        sources=sources,
+        line_ends=[end for end in line_ends if 0 < end < len(consensus)],
+        disputed=_group_disputes(columns, positions, disputed, sources)
+    )
+
+def format_consensus(result: ConsensusResult, context: int = DISPUTE_CONTEXT_CHARS) -> str:
+    """
+    Format a consensus and its disputed spans for a review prompt.
+
+    Each span is shown in brackets between the consensus characters around
+    it, followed by every reading and the transcriptions that gave it. Result
+    keys are shortened to the part before ' - ' (e.g. 'Stage 1 Model 2').
+
+    Args:
+        result: Consensus to format
+        context: Consensus characters shown on each side of a span
+
+    Returns:
+        Text passed to the review models
+    """
+    count = len(result.sources)
+    lines = [
+        f"Consensus of {count} transcriptions ({result.agreement:.1%} mean agreement, "
+        f"{result.min_support:.0%} at the least agreed position):",
+        result.text,
+        ""
+    ]
+    if not result.disputed:
+        lines.append("The transcriptions agree at every position.")
+        return '\n'.join(lines)
+
+    lines.append(f"Disputed spans ({len(result.disputed)}), with the consensus reading in brackets:")
+    consensus = result.consensus
+    for number, span in enumerate(result.disputed, 1):
+        before = consensus[max(0, span.start - context):span.start]
+        after = consensus[span.end:span.end + context]
+        location = f"after character {span.start}" if span.end == span.start else (
+            f"character {span.start + 1}" if span.end == span.start + 1 else f"characters {span.start + 1}-{span.end}"
+        )
+        lines.append(f"{number}. {location}: {before}[{consensus[span.start:span.end]}]{after}")
+        for reading, sources in span.readings.items():
+            labels = ', '.join(source.split(' - ')[0] for source in sources)
+            lines.append(f"   - {reading or '(omitted)'}: {len(sources)} of {count} ({labels})")
+    return '\n'.join(lines)
@@ -0,0 +1,219 @@
+"""
+Tiling of wide scans for transcription, and stitching of the tile transcriptions.
+
+Classical genealogy pages are written in vertical columns read right to left.
+A wide scroll is split into vertical strips that each span the full height,
+with cuts placed in the blank gutters between columns and a small overlap on
+each side so no column is lost at a cut. Each strip is transcribed on its own
+and the texts are joined in reading order, dropping the columns that were
+transcribed twice in an overlap.
+"""
+import io
+import base64
+import threading
+from difflib import SequenceMatcher
+from typing import Dict, List, Tuple
+
+from utils.image_utils import ImageAsset, SharedResultCache
+
+def plan_tile_bounds(profile: List[float], tile_count: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    Choose the horizontal extent of each tile.
+
+    Nominal cuts split the width evenly. Each cut is moved to the brightest
+    (least inked) column within the overlap distance, which on a scan is the
+    gutter between two text columns.
+
+    Args:
+        profile: Mean brightness of each pixel column, left to right
+        tile_count: Number of tiles
+        overlap: Pixels each tile extends past its cuts
+
+    Returns:
+        List of (left, right) pixel bounds, ordered right to left (reading order)
+    """
+    width = len(profile)
+    cuts = [0]
+    for index in range(1, tile_count):
+        nominal = width * index // tile_count
+        low = max(cuts[-1] + 1, nominal - overlap)
+        high = min(width - 1, nominal + overlap)
+        # Score each candidate by the brightness around it, so a single light pixel is not a gutter
+        best, best_score = nominal, None
+        for x in range(low, high + 1):
+            window = profile[max(0, x - 3):x + 4]
+            score = sum(window) / len(window)
+            if best_score is None or score > best_score:
+                best, best_score = x, score
+        cuts.append(best)
+    cuts.append(width)
+
+    bounds = [
+        (max(0, cuts[index] - overlap), min(width, cuts[index + 1] + overlap))
+        for index in range(tile_count)
+    ]
+    return list(reversed(bounds))
+
+class ImageTiler:
+    """
+    Splits wide scans into overlapping vertical strips.
+
+    Tiles are cached by source digest, so the six transcription calls for an
+    image split it only once.
+    """
+
+    def __init__(self, max_tiles: int = 6, overlap: float = 0.1, min_aspect: float = 1.5, max_entries: int = 8):
+        """
+        Initialize the tiler.
+
+        Args:
+            max_tiles: Most tiles an image is split into
+            overlap: Fraction of a tile's width shared with each neighbour
+            min_aspect: Width/height ratio from which an image is tiled
+            max_entries: Maximum number of tiled images kept in memory
+        """
+        self.max_tiles = max_tiles
+        self.overlap = overlap
+        self.min_aspect = min_aspect
+        self._cache = SharedResultCache(max_entries)
+
+    def split(self, image: ImageAsset) -> List[ImageAsset]:
+        """
+        Split an image into tiles in reading order (right to left).
+
+        Images narrower than min_aspect, or that Pillow cannot read, are
+        returned whole as a single tile.
+
+        Args:
+            image: Source image
+
+        Returns:
+            List of tiles
+        """
+        if not image.width:
+            return [image]
+        return self._cache.get_or_compute(image.digest, lambda: self._split_or_whole(image))
+
+    def _split_or_whole(self, image: ImageAsset) -> List[ImageAsset]:
+        """Split an image, falling back to the whole image if Pillow cannot read it."""
+        try:
+            return self._split(image)
+        except Exception as e:
+            print(f"Warning: Could not tile image, transcribing it whole: {str(e)}")
+            return [image]
+
+    def discard(self, digest: str) -> List[ImageAsset]:
+        """
+        Drop the cached tiles of a source image.
+
+        Returns:
+            The tiles that were cached, so their own derived data can be dropped too
+        """
+        return self._cache.pop(digest, [])
+
+    def _split(self, source: ImageAsset) -> List[ImageAsset]:
+        """Cut an image into strips and encode each one."""
+        # Imported on first use so that startup does not pay for Pillow
+        from PIL import Image, ImageOps
+
+        with Image.open(io.BytesIO(base64.b64decode(source.data))) as original:
+            image = ImageOps.exif_transpose(original)
+            source_format = original.format
+
+        width, height = image.size
+        if width < height * self.min_aspect:
+            return [source]
+
+        # Roughly square tiles keep the most detail once each is downscaled for upload
+        tile_count = min(self.max_tiles, max(2, round(width / height)))
+        overlap = int(width / tile_count * self.overlap)
+        # Averaging each pixel column down to one row gives its ink density
+        profile = list(image.convert('L').resize((width, 1), Image.Resampling.BOX).tobytes())
+        bounds = plan_tile_bounds(profile, tile_count, overlap)
+
+        # Keep lossless sources lossless; the upload step re-encodes each tile anyway
+        tile_format = 'PNG' if source_format in ('PNG', 'GIF') else 'JPEG'
+        if tile_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        tiles = []
+        for left, right in bounds:
+            buffer = io.BytesIO()
+            image.crop((left, 0, right, height)).save(buffer, format=tile_format, quality=95)
+            tiles.append(ImageAsset.from_bytes(buffer.getvalue()))
+
+        print(f"Split {width}x{height} image into {tile_count} tiles of ~{width // tile_count}px columns")
+        return tiles
+
+_tilers: Dict[Tuple[int, float, float], ImageTiler] = {}
+_tilers_lock = threading.Lock()
+
+def get_image_tiler(max_tiles: int = 6, overlap: float = 0.1, min_aspect: float = 1.5) -> ImageTiler:
+    """Get the process-wide image tiler for a set of tiling settings."""
+    with _tilers_lock:
+        key = (max_tiles, overlap, min_aspect)
+        if key not in _tilers:
+            _tilers[key] = ImageTiler(max_tiles, overlap, min_aspect)
+        return _tilers[key]
+
+def _compact(line: str) -> str:
+    """Strip whitespace and uncertainty markers from a line for comparison."""
+    return ''.join(line.replace('(?)', '').split())
+
+def _line_overlap(previous: List[str], following: List[str], threshold: float, max_lines: int) -> int:
+    """Get the number of leading lines of following that repeat the last lines of previous."""
+    for count in range(min(len(previous), len(following), max_lines), 0, -1):
+        pairs = zip(previous[-count:], following[:count])
+        if all(SequenceMatcher(None, _compact(a), _compact(b)).ratio() >= threshold for a, b in pairs):
+            return count
+    return 0
+
+def stitch_transcriptions(texts: List[str], threshold: float = 0.9, max_overlap_lines: int = 6, min_overlap_chars: int = 4) -> str:
+    """
+    Join tile transcriptions in reading order, removing overlap duplicates.
+
+    Tiles are transcribed one column per line, so an overlap shows up as the
+    last lines of one tile repeating as the first lines of the next. Lines are
+    compared ignoring whitespace and (?) markers, and of each duplicated pair
+    the longer read is kept, since a column at a tile's edge may be partly
+    cut off. If a
+    transcription did not keep line breaks, the longest run of text shared
+    by the end of one tile and the start of the next is dropped instead.
+
+    Args:
+        texts: Transcription of each tile, in reading order
+        threshold: Similarity (0-1) at which two lines count as the same column
+        max_overlap_lines: Most lines an overlap can span
+        min_overlap_chars: Shortest shared run treated as an overlap when
+            comparing text without line breaks
+
+    Returns:
+        str: The stitched transcription
+    """
+    lines: List[str] = []
+    for text in texts:
+        following = [line.rstrip() for line in text.strip().splitlines() if line.strip()]
+        if not following:
+            continue
+        if not lines:
+            lines = following
+            continue
+
+        count = _line_overlap(lines, following, threshold, max_overlap_lines)
+        if count:
+            for offset in range(count):
+                index = len(lines) - count + offset
+                if len(_compact(following[offset])) > len(_compact(lines[index])):
+                    lines[index] = following[offset]
+            lines.extend(following[count:])
+            continue
+
+        # No repeated lines: look for text shared across the boundary
+        tail = lines[-1]
+        head = following[0]
+        match = SequenceMatcher(None, tail, head, autojunk=False).find_longest_match(0, len(tail), 0, len(head))
+        if match.size >= min_overlap_chars and match.a + match.size >= len(tail) - 1 and match.b <= 1:
+            lines[-1] = tail[:match.a + match.size] + head[match.b + match.size:]
+            lines.extend(following[1:])
+        else:
+            lines.extend(following)
+    return '\n'.join(lines)
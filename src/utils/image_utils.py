@@ -1,9 +1,39 @@
 """
 Image utility functions for handling and preprocessing images.
 """
+import io
 import os
+import mmap
 import base64
-from typing import Dict, Any, Tuple
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
+from typing import Dict, Any, Callable, Hashable, Optional, Tuple, Union
+
+# Image formats accepted by the vision models (file extensions without the dot)
+SUPPORTED_FORMATS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
+
+# Largest image file accepted, in MB
+MAX_IMAGE_SIZE_MB = 20
+
+# MIME type of each format images are sent in (Pillow format names)
+IMAGE_MIME_TYPES = {
+    'JPEG': 'image/jpeg',
+    'MPO': 'image/jpeg',  # Multi-picture JPEG written by some cameras
+    'PNG': 'image/png',
+    'GIF': 'image/gif',
+    'WEBP': 'image/webp'
+}
+
+# Leading bytes identifying each format
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF')
+)
 
 def encode_image_for_vision_models(image_path: str) -> str:
     """
@@ -55,17 +85,19 @@ def validate_image(image_path: str) -> Tuple[bool, str]:
         info = get_image_info(image_path)
         
         # Check file size
-        if info['size_mb'] > 20:
+        if info['size_mb'] > MAX_IMAGE_SIZE_MB:
             return False, f"Image file too large: {info['size_mb']:.1f}MB"
+        if info['size_bytes'] == 0:
+            return False, "Image file is empty"
             
         # Check file format
-        valid_formats = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
-        if info['format'].lower() not in valid_formats:
+        if info['format'].lower() not in SUPPORTED_FORMATS:
             return False, f"Unsupported image format: {info['format']}"
             
-        # Try to read and encode the file
+        # Check the file can be opened; its contents are read once, by ImageAsset
         try:
-            encode_image_for_vision_models(image_path)
+            with open(image_path, "rb") as image_file:
+                image_file.read(1)
         except Exception as e:
             return False, f"Failed to read image file: {str(e)}"
             
@@ -87,10 +119,364 @@ def load_image(image_path: str) -> str:
     Raises:
         ValueError: If image validation fails
     """
-    # Validate image
-    is_valid, message = validate_image(image_path)
-    if not is_valid:
-        raise ValueError(f"Invalid image: {message}")
+    return ImageAsset.open(image_path).data
+
+def detect_mime_type(image_base64: str) -> str:
+    """
+    Get the MIME type of a base64 encoded image from its leading bytes.
+    
+    Args:
+        image_base64: Base64 encoded image string
+        
+    Returns:
+        str: MIME type, defaulting to image/jpeg if the format is not recognized
+    """
+    header = base64.b64decode(image_base64[:24])
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return IMAGE_MIME_TYPES['WEBP']
+    for signature, image_format in _SIGNATURES:
+        if header.startswith(signature):
+            return IMAGE_MIME_TYPES[image_format]
+    return IMAGE_MIME_TYPES['JPEG']
+
+def _read_header(source) -> Tuple[Optional[str], int, int]:
+    """Read an image's format and size from its header, or (None, 0, 0) if Pillow cannot read it."""
+    # Imported on first use so that startup does not pay for Pillow
+    from PIL import Image
+    try:
+        with Image.open(source) as image:
+            return image.format, image.width, image.height
+    except Exception:
+        return None, 0, 0
+
+class ImageAsset:
+    """
+    A source image, read once and shared by every request that uploads it.
+    
+    The file is memory-mapped, so hashing, reading the header and base64
+    encoding all work from the same pages without first copying the file into
+    a bytes object. The asset holds a single base64 string that every provider
+    request references, and release() drops it once no stage needs the image.
+    """
+    
+    def __init__(self, data: str, digest: str, size_bytes: int, image_format: Optional[str] = None,
+                 width: int = 0, height: int = 0, path: Optional[str] = None):
+        """
+        Initialize the asset. Use open(), from_bytes() or from_base64() instead.
         
-    # Encode image
-    return encode_image_for_vision_models(image_path)
+        Args:
+            data: Base64 encoded image
+            digest: SHA-256 hex digest of the raw image bytes
+            size_bytes: Size of the raw image in bytes
+            image_format: Pillow format name, or None if Pillow cannot read the image
+            width: Width in pixels (0 if unknown)
+            height: Height in pixels (0 if unknown)
+            path: Source file, if the image was read from disk
+        """
+        self._data: Optional[str] = data
+        self._passthrough: Optional['NormalizedImage'] = None
+        self.digest = digest
+        self.size_bytes = size_bytes
+        self.format = image_format
+        self.width = width
+        self.height = height
+        self.path = path
+        self.mime_type = IMAGE_MIME_TYPES.get(image_format) or detect_mime_type(data)
+        
+    @classmethod
+    def open(cls, image_path: str) -> 'ImageAsset':
+        """
+        Validate and read an image file.
+        
+        Args:
+            image_path: Path to the image file
+            
+        Returns:
+            ImageAsset holding the encoded image
+            
+        Raises:
+            ValueError: If image validation fails
+        """
+        is_valid, message = validate_image(image_path)
+        if not is_valid:
+            raise ValueError(f"Invalid image: {message}")
+            
+        with open(image_path, "rb") as image_file, \
+                mmap.mmap(image_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            digest = hashlib.sha256(mapped).hexdigest()
+            image_format, width, height = _read_header(mapped)
+            data = base64.b64encode(mapped).decode('ascii')
+            size_bytes = len(mapped)
+        return cls(data, digest, size_bytes, image_format, width, height, path=image_path)
+        
+    @classmethod
+    def from_bytes(cls, raw: bytes) -> 'ImageAsset':
+        """Build an asset from raw image bytes held in memory."""
+        image_format, width, height = _read_header(io.BytesIO(raw))
+        return cls(
+            base64.b64encode(raw).decode('ascii'),
+            hashlib.sha256(raw).hexdigest(),
+            len(raw),
+            image_format,
+            width,
+            height
+        )
+        
+    @classmethod
+    def from_base64(cls, image_base64: str) -> 'ImageAsset':
+        """Build an asset around an already encoded image, without re-encoding it."""
+        raw = base64.b64decode(image_base64)
+        image_format, width, height = _read_header(io.BytesIO(raw))
+        return cls(image_base64, hashlib.sha256(raw).hexdigest(), len(raw), image_format, width, height)
+        
+    @property
+    def data(self) -> str:
+        """
+        The base64 encoded image.
+        
+        Raises:
+            RuntimeError: If the asset has been released
+        """
+        if self._data is None:
+            raise RuntimeError(f"Image {self.path or self.digest[:12]} was released and can no longer be uploaded")
+        return self._data
+        
+    @property
+    def released(self) -> bool:
+        """Whether the encoded image has been dropped."""
+        return self._data is None
+        
+    def release(self):
+        """Drop the encoded image so its memory can be reclaimed."""
+        self._data = None
+        self._passthrough = None
+        
+    def describe(self) -> str:
+        """Get a short description such as '4000x6000 JPEG, 5.2 MB'."""
+        size = f"{self.width}x{self.height} " if self.width else ""
+        return f"{size}{self.format or 'unknown format'}, {self.size_bytes / (1024 * 1024):.1f} MB"
+
+def as_image_asset(image: Union[str, ImageAsset]) -> ImageAsset:
+    """Get an ImageAsset for an image given either as an asset or as a base64 string."""
+    if isinstance(image, ImageAsset):
+        return image
+    return ImageAsset.from_base64(image)
+
+@dataclass(frozen=True)
+class NormalizedImage:
+    """
+    An image prepared for upload.
+    
+    Attributes:
+        data: Base64 encoded image bytes
+        mime_type: MIME type of the encoded bytes
+        digest: SHA-256 hex digest of the encoded bytes
+        width: Width in pixels (0 if the image was passed through unread)
+        height: Height in pixels (0 if the image was passed through unread)
+    """
+    data: str
+    mime_type: str
+    digest: str
+    width: int = 0
+    height: int = 0
+    
+    @cached_property
+    def data_url(self) -> str:
+        """The image as a data: URL, built once and shared by every request that sends it."""
+        return f"data:{self.mime_type};base64,{self.data}"
+
+def passthrough_image(image: ImageAsset) -> NormalizedImage:
+    """Get an image for upload exactly as it was read."""
+    if image._passthrough is None:
+        image._passthrough = NormalizedImage(
+            data=image.data,
+            mime_type=image.mime_type,
+            digest=image.digest,
+            width=image.width,
+            height=image.height
+        )
+    return image._passthrough
+
+class SharedResultCache:
+    """
+    A bounded LRU cache of computed results, computed once per key.
+    
+    The transcription calls for an image start together, so without
+    coordination each of them would miss the cache and do the same work.
+    Callers asking for a key that is being computed wait for that result.
+    """
+    
+    def __init__(self, max_entries: int):
+        """
+        Initialize the cache.
+        
+        Args:
+            max_entries: Maximum number of results kept
+        """
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._key_locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+        
+    def _lookup(self, key: Hashable) -> Tuple[bool, Any]:
+        """Get (found, value) for a key, marking it as recently used."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return True, self._entries[key]
+            return False, None
+            
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Get the cached result for a key, computing it if no caller has yet.
+        
+        Args:
+            key: Cache key
+            compute: Function producing the result
+            
+        Returns:
+            The cached or newly computed result
+        """
+        found, value = self._lookup(key)
+        if found:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                found, value = self._lookup(key)
+                if found:
+                    return value
+                value = compute()
+                with self._lock:
+                    self._entries[key] = value
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+                return value
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+                
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a key, returning its result or default."""
+        with self._lock:
+            return self._entries.pop(key, default)
+            
+    def discard_where(self, predicate: Callable[[Hashable], bool]):
+        """Remove every key matching a predicate."""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+                
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+class ImageNormalizer:
+    """
+    Downscales and re-encodes images before they are uploaded.
+    
+    Scans are often far larger than the resolution a vision model reads, and
+    every provider downsizes them server side anyway. Clamping the longest side
+    to the provider's limit and re-encoding without metadata cuts the upload
+    (and the vision tokens billed for it) before the request leaves the machine.
+    Results are cached by source digest and target size, so the six
+    transcription calls for an image only normalize it once per provider limit.
+    """
+    
+    def __init__(self, image_format: str = 'JPEG', quality: int = 85, max_entries: int = 16):
+        """
+        Initialize the normalizer.
+        
+        Args:
+            image_format: Pillow format to re-encode to (JPEG, WEBP or PNG)
+            quality: Encoder quality for JPEG and WEBP (1-100)
+            max_entries: Maximum number of normalized images kept in memory
+        """
+        if image_format not in IMAGE_MIME_TYPES:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self.image_format = image_format
+        self.quality = quality
+        self._cache = SharedResultCache(max_entries)
+        
+    def normalize(self, image: ImageAsset, max_dimension: int) -> NormalizedImage:
+        """
+        Get an image downscaled to fit max_dimension and re-encoded.
+        
+        Images that Pillow cannot read are passed through unchanged, with the
+        MIME type detected from their bytes.
+        
+        Args:
+            image: Source image
+            max_dimension: Longest side of the result in pixels
+            
+        Returns:
+            NormalizedImage ready to upload
+        """
+        if image.width:
+            # Limits above the image's own size all give the same result
+            max_dimension = min(max_dimension, max(image.width, image.height))
+        return self._cache.get_or_compute((image.digest, max_dimension), lambda: self._normalize(image, max_dimension))
+        
+    def _normalize(self, image: ImageAsset, max_dimension: int) -> NormalizedImage:
+        """Normalize an image, passing it through if Pillow cannot re-encode it."""
+        try:
+            return self._encode(base64.b64decode(image.data), max_dimension)
+        except Exception as e:
+            print(f"Warning: Could not normalize image, sending it unchanged: {str(e)}")
+            return passthrough_image(image)
+            
+    def discard(self, digest: str):
+        """Drop every cached normalization of a source image."""
+        self._cache.discard_where(lambda key: key[0] == digest)
+        
+    def _encode(self, source: bytes, max_dimension: int) -> NormalizedImage:
+        """Downscale and re-encode raw image bytes."""
+        # Imported on first use so that startup does not pay for Pillow
+        from PIL import Image, ImageOps
+        
+        with Image.open(io.BytesIO(source)) as original:
+            source_size = original.size
+            source_format = original.format
+            # Apply EXIF rotation before the EXIF block is dropped
+            image = ImageOps.exif_transpose(original)
+            image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            
+            # Flatten transparency onto white and drop palette, CMYK and 16-bit modes
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                image = image.convert('RGBA')
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+            elif image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+                
+            # Saving without the source's info drops EXIF, ICC and text metadata
+            image.info = {}
+            buffer = io.BytesIO()
+            image.save(buffer, format=self.image_format, quality=self.quality, optimize=True)
+            
+        encoded = buffer.getvalue()
+        print(
+            f"Normalized image {source_size[0]}x{source_size[1]} {source_format} "
+            f"({len(source) / 1024:.0f} KB) -> {image.width}x{image.height} {self.image_format} "
+            f"({len(encoded) / 1024:.0f} KB)"
+        )
+        return NormalizedImage(
+            data=base64.b64encode(encoded).decode('ascii'),
+            mime_type=IMAGE_MIME_TYPES[self.image_format],
+            digest=hashlib.sha256(encoded).hexdigest(),
+            width=image.width,
+            height=image.height
+        )
+
+_normalizers: Dict[Tuple[str, int], ImageNormalizer] = {}
+_normalizers_lock = threading.Lock()
+
+def get_image_normalizer(image_format: str = 'JPEG', quality: int = 85) -> ImageNormalizer:
+    """Get the process-wide image normalizer for an output format and quality."""
+    with _normalizers_lock:
+        key = (image_format, quality)
+        if key not in _normalizers:
+            _normalizers[key] = ImageNormalizer(image_format, quality)
+        return _normalizers[key]
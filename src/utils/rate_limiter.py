@@ -0,0 +1,232 @@
+"""
+Requests-per-minute and tokens-per-minute limiting of provider calls.
+
+Each (provider, model) has a pair of token buckets, one for requests and one
+for tokens, refilled continuously at the quota rate. A call reserves one
+request and its estimated tokens before it is sent; once the provider reports
+the real usage, the reservation is corrected. Buckets hold at most
+BURST_SECONDS of budget, so after an idle spell calls are released at the
+quota rate instead of in a burst that trips the provider's own limiter.
+
+Callers waiting for budget are queued per run (one image) and served round
+robin, so one image with many calls cannot starve the others in a batch.
+"""
+import time
+import asyncio
+import threading
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Hashable, Optional, Tuple
+
+# Seconds of quota a full bucket holds
+BURST_SECONDS = 10.0
+
+class _Bucket:
+    """A continuously refilled budget."""
+
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * BURST_SECONDS)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        """Add the budget accrued since the last update."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """
+        Get the seconds until amount can be taken (0 if it can be now).
+
+        A call larger than the bucket may go once the bucket is full, leaving
+        it in debt, so oversized calls still run at the quota rate.
+        """
+        needed = min(amount, self.capacity)
+        if self.level >= needed:
+            return 0.0
+        return (needed - self.level) / self.rate
+
+class RateLimit:
+    """
+    Request and token budget of one provider model, with a fair wait queue.
+    """
+
+    def __init__(self, rpm: Optional[int] = None, tpm: Optional[int] = None):
+        """
+        Initialize the limit.
+
+        Args:
+            rpm: Requests per minute, or None for no request limit
+            tpm: Tokens per minute, or None for no token limit
+        """
+        self._condition = threading.Condition()
+        self._queues: 'OrderedDict[Hashable, Deque[object]]' = OrderedDict()
+        self.configure(rpm, tpm)
+
+    def configure(self, rpm: Optional[int], tpm: Optional[int]):
+        """Set the quotas, keeping the current budget if they are unchanged."""
+        with self._condition:
+            if getattr(self, 'limits', None) == (rpm, tpm):
+                return
+            self.limits = (rpm, tpm)
+            self._requests = _Bucket(rpm) if rpm else None
+            self._tokens = _Bucket(tpm) if tpm else None
+            self._condition.notify_all()
+
+    @property
+    def unlimited(self) -> bool:
+        """Whether neither requests nor tokens are limited."""
+        return self._requests is None and self._tokens is None
+
+    def _enqueue(self, queue_key: Hashable) -> object:
+        """Add a waiter to the back of its run's queue."""
+        ticket = object()
+        self._queues.setdefault(queue_key, deque()).append(ticket)
+        return ticket
+
+    def _dequeue(self, queue_key: Hashable, ticket: object):
+        """Remove a waiter that was granted budget or gave up."""
+        queue = self._queues.get(queue_key)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del self._queues[queue_key]
+
+    def _try_take(self, queue_key: Hashable, ticket: object, tokens: int) -> float:
+        """
+        Take budget for a waiter if it is next in line and budget is available.
+
+        Must be called with the condition held.
+
+        Returns:
+            0 if budget was taken, otherwise seconds to wait before trying again
+        """
+        # Round robin: the next waiter is the oldest one of the run at the front
+        front_key = next(iter(self._queues))
+        if front_key != queue_key or self._queues[front_key][0] is not ticket:
+            return BURST_SECONDS
+        now = time.monotonic()
+        wait = 0.0
+        if self._requests is not None:
+            self._requests.refill(now)
+            wait = max(wait, self._requests.wait_for(1))
+        if self._tokens is not None:
+            self._tokens.refill(now)
+            wait = max(wait, self._tokens.wait_for(tokens))
+        if wait > 0:
+            return wait
+        if self._requests is not None:
+            self._requests.level -= 1
+        if self._tokens is not None:
+            self._tokens.level -= tokens
+        self._dequeue(queue_key, ticket)
+        # The run just served moves behind the others
+        if queue_key in self._queues:
+            self._queues.move_to_end(queue_key)
+        self._condition.notify_all()
+        return 0.0
+
+    def acquire(self, tokens: int, queue_key: Hashable = None) -> float:
+        """
+        Wait until a call of the given size fits the budget, then reserve it.
+
+        Args:
+            tokens: Estimated tokens of the call (prompt and output)
+            queue_key: Run the call belongs to, for round-robin queueing
+
+        Returns:
+            Seconds spent waiting
+        """
+        if self.unlimited:
+            return 0.0
+        started = time.monotonic()
+        with self._condition:
+            ticket = self._enqueue(queue_key)
+            try:
+                while True:
+                    wait = self._try_take(queue_key, ticket, tokens)
+                    if wait == 0:
+                        return time.monotonic() - started
+                    self._condition.wait(wait)
+            finally:
+                self._dequeue(queue_key, ticket)
+
+    async def acquire_async(self, tokens: int, queue_key: Hashable = None) -> float:
+        """Async variant of acquire that waits without blocking the event loop."""
+        if self.unlimited:
+            return 0.0
+        started = time.monotonic()
+        with self._condition:
+            ticket = self._enqueue(queue_key)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_take(queue_key, ticket, tokens)
+                if wait == 0:
+                    return time.monotonic() - started
+                # Coroutines cannot wait on the condition, so waiters not yet at the front poll
+                await asyncio.sleep(min(wait, 0.05))
+        finally:
+            with self._condition:
+                self._dequeue(queue_key, ticket)
+
+    def settle(self, reserved_tokens: int, used_tokens: int):
+        """
+        Correct a reservation to the tokens a call actually used.
+
+        Args:
+            reserved_tokens: Tokens reserved by acquire
+            used_tokens: Tokens the provider reported
+        """
+        if self._tokens is None or reserved_tokens == used_tokens:
+            return
+        with self._condition:
+            self._tokens.refill(time.monotonic())
+            self._tokens.level = min(self._tokens.capacity, self._tokens.level + reserved_tokens - used_tokens)
+            self._condition.notify_all()
+
+class RateLimiter:
+    """
+    Process-wide RPM/TPM limits, one RateLimit per provider model.
+
+    Shared by every image in a batch so their combined calls stay within
+    the account's quota.
+    """
+
+    def __init__(self):
+        self._limits: Dict[Tuple[str, str], RateLimit] = {}
+        self._lock = threading.Lock()
+
+    def get(self, provider: str, model_name: str, rpm: Optional[int], tpm: Optional[int]) -> RateLimit:
+        """
+        Get the limit of a provider model, applying the given quotas.
+
+        Args:
+            provider: Provider name
+            model_name: Model name
+            rpm: Requests per minute, or None for no limit
+            tpm: Tokens per minute, or None for no limit
+
+        Returns:
+            The model's RateLimit
+        """
+        key = (provider, model_name)
+        with self._lock:
+            limit = self._limits.get(key)
+            if limit is None:
+                limit = self._limits[key] = RateLimit(rpm, tpm)
+                return limit
+        limit.configure(rpm, tpm)
+        return limit
+
+_rate_limiter: Optional[RateLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process-wide rate limiter."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
@@ -0,0 +1,151 @@
+"""
+Persistent, content-addressed cache of provider responses.
+
+Responses are keyed by a hash of everything that determines them (provider,
+model, generation parameters, prompt text and image digest), so re-running an
+image replays identical calls from disk instead of paying for them again.
+"""
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Any, Dict, Optional
+
+def make_cache_key(provider: str, model_name: str, params: Dict[str, Any], prompt: str, image_digest: Optional[str] = None) -> str:
+    """
+    Build a cache key for a provider call.
+
+    Args:
+        provider: Provider name
+        model_name: Model name
+        params: Generation parameters that affect the response
+        prompt: Full prompt text
+        image_digest: Optional digest of the image sent with the prompt
+
+    Returns:
+        str: Hex SHA-256 digest identifying the call
+    """
+    payload = json.dumps({
+        'provider': provider,
+        'model': model_name,
+        'params': params,
+        'prompt': prompt,
+        'image': image_digest
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    On-disk response store with a size cap and least-recently-used eviction.
+
+    Entries live in a SQLite database so the cache is safe to share between
+    threads and between concurrent processes of a batch run. The size cap is
+    given with each put, so jobs with different caps can share a directory.
+    """
+
+    def __init__(self, cache_dir: str):
+        """
+        Initialize the cache.
+
+        Args:
+            cache_dir: Directory holding the cache database
+        """
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, 'responses.sqlite3'),
+            check_same_thread=False,
+            timeout=30
+        )
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+            'size INTEGER NOT NULL, last_access REAL NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached response and mark it as recently used.
+
+        Args:
+            key: Cache key from make_cache_key
+
+        Returns:
+            Dict with 'content' and 'usage', or None on a miss
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (time.time(), key))
+            self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, Any], max_bytes: int):
+        """
+        Store a response, evicting least-recently-used entries over the size cap.
+
+        Args:
+            key: Cache key from make_cache_key
+            result: Result dict; only 'content' and 'usage' are stored
+            max_bytes: Maximum total size of stored entries
+        """
+        value = json.dumps({'content': result['content'], 'usage': result['usage']}, ensure_ascii=False)
+        size = len(value.encode('utf-8'))
+        if size > max_bytes:
+            return
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)',
+                (key, value, size, time.time())
+            )
+            total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            while total > max_bytes:
+                oldest = self._conn.execute(
+                    'SELECT key, size FROM responses ORDER BY last_access ASC LIMIT 64'
+                ).fetchall()
+                if not oldest:
+                    break
+                for old_key, old_size in oldest:
+                    if total <= max_bytes:
+                        break
+                    self._conn.execute('DELETE FROM responses WHERE key = ?', (old_key,))
+                    total -= old_size
+            self._conn.commit()
+
+    def invalidate(self, key: str):
+        """Remove a single entry."""
+        with self._lock:
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def clear(self):
+        """Remove every entry."""
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+            self._conn.commit()
+
+_caches: Dict[str, ResponseCache] = {}
+_caches_lock = threading.Lock()
+
+def get_response_cache(cache_dir: str) -> ResponseCache:
+    """
+    Get the process-wide response cache of a directory.
+
+    Args:
+        cache_dir: Directory holding the cache database (PipelineConfig.response_cache_dir)
+
+    Returns:
+        The shared ResponseCache of the directory
+    """
+    key = os.path.abspath(cache_dir)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ResponseCache(key)
+        return _caches[key]
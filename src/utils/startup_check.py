@@ -0,0 +1,129 @@
+"""
+Startup import budget check for the CLI.
+
+Runs `python -X importtime src/main.py --help` in a fresh interpreter and fails
+if a heavy module (provider SDKs, the tokenizer, image libraries or the model
+pipeline) is imported, or if the modules imported by main.py take longer than
+the budget. Interpreter start-up imports (site, encodings, ...) are measured
+separately with `python -X importtime -c pass` and excluded.
+
+Usage:
+    python src/utils/startup_check.py [--budget-ms 100] [--runs 5]
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+from typing import Dict, List, Sequence, Tuple
+
+MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+# Modules that must not be imported just to show help or report argument errors
+FORBIDDEN_MODULES = (
+    'tiktoken',
+    'openai',
+    'anthropic',
+    'groq',
+    'together',
+    'google.generativeai',
+    'PIL',
+    'numpy',
+    'sqlite3',
+    'models.model_manager',
+    'models.stage_model'
+)
+
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """
+    Parse `-X importtime` output.
+
+    Args:
+        stderr: Captured stderr of the interpreter
+
+    Returns:
+        List of (module, cumulative microseconds, nesting depth) in import order
+    """
+    entries = []
+    for line in stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((match.group(4), int(match.group(2)), len(match.group(3)) // 2))
+    return entries
+
+def _run_importtime(args: Sequence[str]) -> List[Tuple[str, int, int]]:
+    """Run a fresh interpreter with -X importtime and parse its imports."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', *args],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.dirname(MAIN_PATH))
+    )
+    return parse_importtime(result.stderr)
+
+def measure_startup(cli_args: Sequence[str] = ('--help',), runs: int = 5) -> Tuple[float, Dict[str, int]]:
+    """
+    Measure the import time main.py adds on top of interpreter start-up.
+
+    Args:
+        cli_args: Arguments passed to main.py
+        runs: Number of runs; the fastest is reported to reduce noise
+
+    Returns:
+        Tuple of (milliseconds, {module: cumulative microseconds} of main.py's
+        top-level imports from the fastest run)
+    """
+    baseline = {name for name, _, _ in _run_importtime(['-c', 'pass'])}
+    best_ms = None
+    best_modules: Dict[str, int] = {}
+    for _ in range(max(runs, 1)):
+        entries = _run_importtime([MAIN_PATH, *cli_args])
+        modules = {
+            name: cumulative for name, cumulative, depth in entries
+            if depth == 0 and name not in baseline
+        }
+        total_ms = sum(modules.values()) / 1000
+        if best_ms is None or total_ms < best_ms:
+            best_ms = total_ms
+            best_modules = modules
+    return best_ms or 0.0, best_modules
+
+def find_forbidden_imports(cli_args: Sequence[str] = ('--help',)) -> List[str]:
+    """Get the forbidden modules imported by main.py with the given arguments."""
+    imported = {name for name, _, _ in _run_importtime([MAIN_PATH, *cli_args])}
+    return sorted(
+        name for name in imported
+        if any(name == forbidden or name.startswith(forbidden + '.') for forbidden in FORBIDDEN_MODULES)
+    )
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Check that CLI start-up stays within its import budget.')
+    parser.add_argument('--budget-ms', type=float, default=100.0,
+                        help='Maximum import time main.py may add to interpreter start-up (default: 100)')
+    parser.add_argument('--runs', type=int, default=5,
+                        help='Number of measured runs; the fastest is used (default: 5)')
+    args = parser.parse_args()
+
+    failed = False
+    for cli_args in (['--help'], ['--workers', '0']):
+        forbidden = find_forbidden_imports(cli_args)
+        if forbidden:
+            print(f"FAIL: main.py {' '.join(cli_args)} imports {', '.join(forbidden)}")
+            failed = True
+
+    total_ms, modules = measure_startup(runs=args.runs)
+    print(f"main.py --help import time: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:10]:
+        print(f"  {cumulative / 1000:7.1f} ms  {name}")
+    if total_ms > args.budget_ms:
+        print("FAIL: start-up import time is over budget")
+        failed = True
+
+    if not failed:
+        print("OK")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
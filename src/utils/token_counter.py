@@ -1,13 +1,15 @@
 """
 Utility for tracking token usage and costs across all stages and models.
 """
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import Dict, List, Optional, Any
 import json
+import hashlib
+import threading
 from datetime import datetime
 import sys
 import os
-import tiktoken
 
 # Add the src directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -19,6 +21,137 @@ from config.token_costs import (
     should_save_usage_report,
     should_show_stage_inputs
 )
+from config.pipeline_config import PipelineConfig
+
+# Encoding used by GPT-4, and as an approximation for every other provider
+DEFAULT_ENCODING = 'cl100k_base'
+
+_encoders: Dict[str, Any] = {}
+_encoders_lock = threading.Lock()
+
+def get_encoder(encoding_name: str = DEFAULT_ENCODING):
+    """
+    Get a tiktoken encoder, loading it at most once per process.
+    
+    Args:
+        encoding_name: tiktoken encoding name
+        
+    Returns:
+        The shared tiktoken Encoding
+    """
+    with _encoders_lock:
+        if encoding_name not in _encoders:
+            # Imported on first use so that startup does not pay for the tokenizer
+            import tiktoken
+            _encoders[encoding_name] = tiktoken.get_encoding(encoding_name)
+        return _encoders[encoding_name]
+
+class TokenCounter:
+    """
+    Token counting with a bounded memo of recent results.
+    
+    Counts are memoized by a digest of the text, so strings that are counted
+    repeatedly (a stage's outputs are counted again as the next stage's
+    inputs and in its reports) are tokenized only once.
+    """
+    
+    def __init__(self, encoding_name: str = DEFAULT_ENCODING, max_entries: int = 4096):
+        """
+        Initialize the counter.
+        
+        Args:
+            encoding_name: tiktoken encoding name
+            max_entries: Maximum number of memoized counts
+        """
+        self.encoding_name = encoding_name
+        self.max_entries = max_entries
+        self._memo: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+    @staticmethod
+    def _digest(text: str) -> bytes:
+        """Get the memo key of a text."""
+        return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+        
+    def _lookup(self, key: bytes) -> Optional[int]:
+        """Get a memoized count and mark it as recently used."""
+        with self._lock:
+            count = self._memo.get(key)
+            if count is not None:
+                self._memo.move_to_end(key)
+            return count
+            
+    def _store(self, key: bytes, count: int):
+        """Memoize a count, dropping the least recently used entries over the cap."""
+        with self._lock:
+            self._memo[key] = count
+            self._memo.move_to_end(key)
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+                
+    def count(self, text: str) -> int:
+        """
+        Count the tokens in a text.
+        
+        Args:
+            text: The text to count tokens for
+            
+        Returns:
+            int: Number of tokens in the text
+        """
+        if not text:
+            return 0
+        key = self._digest(text)
+        count = self._lookup(key)
+        if count is None:
+            count = len(get_encoder(self.encoding_name).encode_ordinary(text))
+            self._store(key, count)
+        return count
+        
+    def count_batch(self, texts: List[str]) -> List[int]:
+        """
+        Count the tokens in many texts, tokenizing uncached ones in parallel.
+        
+        Args:
+            texts: The texts to count tokens for
+            
+        Returns:
+            List of token counts in the order of texts
+        """
+        counts: List[Optional[int]] = []
+        misses: Dict[bytes, List[int]] = {}
+        miss_texts: List[str] = []
+        for index, text in enumerate(texts):
+            if not text:
+                counts.append(0)
+                continue
+            key = self._digest(text)
+            count = self._lookup(key)
+            counts.append(count)
+            if count is None:
+                if key not in misses:
+                    misses[key] = []
+                    miss_texts.append(text)
+                misses[key].append(index)
+                
+        if miss_texts:
+            # tiktoken encodes a batch on its own thread pool, outside the GIL
+            encoded = get_encoder(self.encoding_name).encode_ordinary_batch(miss_texts)
+            for (key, indexes), tokens in zip(misses.items(), encoded):
+                self._store(key, len(tokens))
+                for index in indexes:
+                    counts[index] = len(tokens)
+        return counts
+
+_counters: Dict[str, TokenCounter] = {}
+_counters_lock = threading.Lock()
+
+def get_token_counter(encoding_name: str = DEFAULT_ENCODING) -> TokenCounter:
+    """Get the process-wide token counter for an encoding."""
+    with _counters_lock:
+        if encoding_name not in _counters:
+            _counters[encoding_name] = TokenCounter(encoding_name)
+        return _counters[encoding_name]
 
 def count_tokens(text: str) -> int:
     """
@@ -31,78 +164,191 @@ def count_tokens(text: str) -> int:
         int: Number of tokens in the text
     """
     try:
-        # Use GPT-4's tokenizer
-        enc = tiktoken.encoding_for_model("gpt-4")
-        return len(enc.encode(text))
+        return get_token_counter().count(text)
     except Exception as e:
         print(f"Warning: Error counting tokens: {str(e)}")
         # Fallback to rough character-based estimate
         return len(text) // 4
 
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    """
+    Count the tokens of many text strings using GPT-4's tokenizer.
+    
+    Args:
+        texts: The texts to count tokens for
+        
+    Returns:
+        List of token counts in the order of texts
+    """
+    try:
+        return get_token_counter().count_batch(texts)
+    except Exception as e:
+        print(f"Warning: Error counting tokens: {str(e)}")
+        # Fallback to rough character-based estimate
+        return [len(text) // 4 for text in texts]
+
 @dataclass
 class TokenUsage:
     input_tokens: int
     output_tokens: int
     cost: float
     char_count: int = 0
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
 
 class TokenTracker:
-    def __init__(self):
+    def __init__(self, config: Optional[PipelineConfig] = None):
+        """
+        Initialize the tracker.
+        
+        Args:
+            config: Optional pipeline configuration; tracking settings are read
+                from the environment if not given
+        """
         self.usage_by_stage: Dict[str, Dict[str, TokenUsage]] = {}
         self.stage_totals: Dict[str, TokenUsage] = {}
         self.grand_total = TokenUsage(0, 0, 0.0, 0)
-        self.tracking_enabled = is_token_tracking_enabled()
+        if config is not None:
+            self.tracking_enabled = config.token_tracking
+            self.realtime_display = config.realtime_display and config.token_tracking
+            self.save_report = config.save_report and config.token_tracking
+            self.show_stage_inputs = config.show_stage_inputs
+        else:
+            self.tracking_enabled = is_token_tracking_enabled()
+            self.realtime_display = should_display_realtime_usage()
+            self.save_report = should_save_usage_report()
+            self.show_stage_inputs = should_show_stage_inputs()
         self.stage_inputs: Dict[str, str] = {}  # Store stage inputs for optional display
         self.model_fallbacks: Dict[str, Dict[str, str]] = {}  # Track model fallbacks by stage
+        self.hedge_usage: Dict[str, Dict[str, Dict[str, Any]]] = {}  # Tokens of discarded hedge requests by stage
+        self.hedge_total = TokenUsage(0, 0, 0.0, 0)
+        self._lock = threading.RLock()  # Models in a stage report usage concurrently
 
-    def add_usage(self, stage: str, model: str, model_name: str, input_tokens: int, output_tokens: int, char_count: Optional[int] = None, stage_input: Optional[str] = None, fallback_info: Optional[Dict[str, str]] = None):
-        """Record token usage and character count for a specific stage and model."""
+    def add_usage(self, stage: str, model: str, model_name: str, input_tokens: int, output_tokens: int, char_count: Optional[int] = None, stage_input: Optional[str] = None, fallback_info: Optional[Dict[str, str]] = None, cached: bool = False, timing: Optional[Dict[str, float]] = None, cache_read_tokens: int = 0, cache_write_tokens: int = 0):
+        """
+        Record token usage and character count for a specific stage and model.
+        
+        Responses replayed from the response cache (cached=True) keep their
+        token counts but cost nothing. Streamed responses pass their timing
+        (seconds of 'ttft' time to first token, 'itl' inter-token latency).
+        Input tokens the provider read from or wrote to its prompt cache
+        (cache_read_tokens, cache_write_tokens) are part of input_tokens and
+        are billed at the model's cache rates.
+        """
         if not self.tracking_enabled:
             return
 
-        if stage not in self.usage_by_stage:
-            self.usage_by_stage[stage] = {}
-            self.stage_totals[stage] = TokenUsage(0, 0, 0.0, 0)
-
-        # Store stage input and fallback info if provided
-        if stage_input is not None:
-            self.stage_inputs[stage] = stage_input
-        if fallback_info is not None:
-            self.model_fallbacks[stage] = fallback_info
-
-        # Calculate cost using centralized token costs
-        cost = calculate_cost(model_name, input_tokens, output_tokens)
-
-        char_count_value = char_count if char_count is not None else 0
-        usage = TokenUsage(input_tokens, output_tokens, cost, char_count_value)
-        usage_dict = {
-            'input_tokens': input_tokens,
-            'output_tokens': output_tokens,
-            'cost': cost,
-            'char_count': char_count_value
-        }
-        self.usage_by_stage[stage][model] = usage_dict
+        with self._lock:
+            if stage not in self.usage_by_stage:
+                self.usage_by_stage[stage] = {}
+                self.stage_totals[stage] = TokenUsage(0, 0, 0.0, 0)
 
-        # Update stage totals
-        stage_total = self.stage_totals[stage]
-        stage_total.input_tokens += input_tokens
-        stage_total.output_tokens += output_tokens
-        stage_total.cost += cost
-        stage_total.char_count += char_count_value
+            # Store stage input and fallback info if provided
+            if stage_input is not None:
+                self.stage_inputs[stage] = stage_input
+            if fallback_info is not None:
+                self.model_fallbacks[stage] = fallback_info
+
+            # Calculate cost using centralized token costs
+            cost = 0.0 if cached else calculate_cost(model_name, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens)
+
+            char_count_value = char_count if char_count is not None else 0
+            usage = TokenUsage(input_tokens, output_tokens, cost, char_count_value, cache_read_tokens, cache_write_tokens)
+            usage_dict = {
+                'input_tokens': input_tokens,
+                'output_tokens': output_tokens,
+                'cost': cost,
+                'char_count': char_count_value
+            }
+            if cache_read_tokens or cache_write_tokens:
+                usage_dict['cache_read_tokens'] = cache_read_tokens
+                usage_dict['cache_write_tokens'] = cache_write_tokens
+            if timing is not None:
+                usage_dict['ttft'] = timing['ttft']
+                usage_dict['itl'] = timing['itl']
+            self.usage_by_stage[stage][model] = usage_dict
+
+            # Update stage totals
+            stage_total = self.stage_totals[stage]
+            stage_total.input_tokens += input_tokens
+            stage_total.output_tokens += output_tokens
+            stage_total.cost += cost
+            stage_total.char_count += char_count_value
+            stage_total.cache_read_tokens += cache_read_tokens
+            stage_total.cache_write_tokens += cache_write_tokens
 
-        # Update grand total
-        self.grand_total.input_tokens += input_tokens
-        self.grand_total.output_tokens += output_tokens
-        self.grand_total.cost += cost
-        self.grand_total.char_count += char_count_value
+            # Update grand total
+            self.grand_total.input_tokens += input_tokens
+            self.grand_total.output_tokens += output_tokens
+            self.grand_total.cost += cost
+            self.grand_total.char_count += char_count_value
+            self.grand_total.cache_read_tokens += cache_read_tokens
+            self.grand_total.cache_write_tokens += cache_write_tokens
 
-        # Display realtime usage if enabled
-        if should_display_realtime_usage():
-            self.print_stage_usage(stage)
+            # Display realtime usage if enabled
+            if self.realtime_display:
+                self.print_stage_usage(stage)
 
+    def add_hedge_cost(self, stage: str, model: str, model_name: str, input_tokens: int, output_tokens: int, won: bool = False):
+        """
+        Record the tokens spent on the discarded request of a hedged call.
+        
+        Hedge costs are kept apart from the stage and grand totals, which
+        only count the responses the pipeline used.
+        
+        Args:
+            stage: Stage name (e.g. 'Stage 1')
+            model: Key of the model the discarded request went to
+            model_name: Model name the cost is calculated for
+            input_tokens: Input tokens of the discarded request
+            output_tokens: Output tokens of the discarded request
+            won: Whether the hedge request finished first (so the original was discarded)
+        """
+        if not self.tracking_enabled:
+            return
+            
+        with self._lock:
+            cost = calculate_cost(model_name, input_tokens, output_tokens)
+            usage = self.hedge_usage.setdefault(stage, {}).setdefault(model, {
+                'hedges': 0,
+                'won': 0,
+                'input_tokens': 0,
+                'output_tokens': 0,
+                'cost': 0.0
+            })
+            usage['hedges'] += 1
+            usage['won'] += int(won)
+            usage['input_tokens'] += input_tokens
+            usage['output_tokens'] += output_tokens
+            usage['cost'] += cost
+            
+            self.hedge_total.input_tokens += input_tokens
+            self.hedge_total.output_tokens += output_tokens
+            self.hedge_total.cost += cost
+            
+    def get_hedge_summary(self) -> Optional[Dict[str, Any]]:
+        """
+        Get the totals of hedged calls.
+        
+        Returns:
+            Dict of hedges, won, input_tokens, output_tokens and cost, or None
+            if no call was hedged
+        """
+        if not self.tracking_enabled or not self.hedge_usage:
+            return None
+        with self._lock:
+            models = [usage for stage in self.hedge_usage.values() for usage in stage.values()]
+            return {
+                'hedges': sum(usage['hedges'] for usage in models),
+                'won': sum(usage['won'] for usage in models),
+                'input_tokens': self.hedge_total.input_tokens,
+                'output_tokens': self.hedge_total.output_tokens,
+                'cost': self.hedge_total.cost
+            }
+            
     def print_stage_usage(self, stage: str):
         """Print token usage for a specific stage."""
-        if not self.tracking_enabled or not should_display_realtime_usage():
+        if not self.tracking_enabled or not self.realtime_display:
             return
 
         if stage not in self.usage_by_stage:
@@ -112,7 +358,7 @@ class TokenTracker:
         
         # Handle stage input display
         print("\nStage Input:")
-        if should_show_stage_inputs() and stage in self.stage_inputs:
+        if self.show_stage_inputs and stage in self.stage_inputs:
             print(self.stage_inputs[stage])
         else:
             print("INPUTS HIDDEN FROM USER. TO VIEW, CHANGE STAGE INPUT SETTINGS IN .ENV FILE")
@@ -121,18 +367,29 @@ class TokenTracker:
         for model, usage in self.usage_by_stage[stage].items():
             print(f"- {model}:")
             print(f"  - Input tokens:  {usage['input_tokens']:,}")
+            if 'cache_read_tokens' in usage:
+                print(f"  - Prompt cache read/write: {usage['cache_read_tokens']:,} / {usage['cache_write_tokens']:,}")
             print(f"  - Output tokens: {usage['output_tokens']:,}")
             print(f"  - Cost: ${usage['cost']:.4f}")
             if 'char_count' in usage:
                 print(f"  - Chinese Characters: {usage['char_count']:,}")
+            if 'ttft' in usage:
+                print(f"  - Time to first token: {usage['ttft']:.2f}s")
+                print(f"  - Inter-token latency: {usage['itl'] * 1000:.1f}ms")
         
         stage_total = self.stage_totals[stage]
         print(f"\nStage Totals:")
         print(f"- Total input tokens:  {stage_total.input_tokens:,}")
+        if stage_total.cache_read_tokens or stage_total.cache_write_tokens:
+            print(f"- Prompt cache read/write: {stage_total.cache_read_tokens:,} / {stage_total.cache_write_tokens:,}")
         print(f"- Total output tokens: {stage_total.output_tokens:,}")
         print(f"- Total cost: ${stage_total.cost:.4f}")
         if stage_total.char_count > 0:
             print(f"- Total Chinese Characters: {stage_total.char_count:,}")
+        if stage in self.hedge_usage:
+            hedges = sum(usage['hedges'] for usage in self.hedge_usage[stage].values())
+            cost = sum(usage['cost'] for usage in self.hedge_usage[stage].values())
+            print(f"- Hedged requests: {hedges} (extra cost: ${cost:.4f})")
 
     def print_summary(self):
         """Print complete summary of token usage and costs."""
@@ -146,7 +403,7 @@ class TokenTracker:
             
             # Handle stage input display
             print("\nStage Input:")
-            if should_show_stage_inputs() and stage in self.stage_inputs:
+            if self.show_stage_inputs and stage in self.stage_inputs:
                 print(self.stage_inputs[stage])
             else:
                 print("INPUTS HIDDEN FROM USER. TO VIEW, CHANGE STAGE INPUT SETTINGS IN .ENV FILE")
@@ -154,6 +411,8 @@ class TokenTracker:
                 
             stage_total = self.stage_totals[stage]
             print(f"- Input tokens:  {stage_total.input_tokens:,}")
+            if stage_total.cache_read_tokens or stage_total.cache_write_tokens:
+                print(f"- Prompt cache read/write: {stage_total.cache_read_tokens:,} / {stage_total.cache_write_tokens:,}")
             print(f"- Output tokens: {stage_total.output_tokens:,}")
             print(f"- Cost: ${stage_total.cost:.4f}")
             if stage_total.char_count > 0:
@@ -161,10 +420,21 @@ class TokenTracker:
 
         print("\n=== Grand Totals ===")
         print(f"- Total input tokens:  {self.grand_total.input_tokens:,}")
+        if self.grand_total.cache_read_tokens or self.grand_total.cache_write_tokens:
+            print(f"- Prompt cache read/write: {self.grand_total.cache_read_tokens:,} / {self.grand_total.cache_write_tokens:,}")
         print(f"- Total output tokens: {self.grand_total.output_tokens:,}")
         print(f"- Total cost: ${self.grand_total.cost:.4f}")
         if self.grand_total.char_count > 0:
             print(f"- Total Chinese Characters: {self.grand_total.char_count:,}")
+            
+        hedging = self.get_hedge_summary()
+        if hedging:
+            print("\n=== Hedged Requests ===")
+            print(f"- Hedged calls: {hedging['hedges']} ({hedging['won']} won by the hedge)")
+            print(f"- Discarded input tokens:  {hedging['input_tokens']:,}")
+            print(f"- Discarded output tokens: {hedging['output_tokens']:,}")
+            print(f"- Hedge cost: ${hedging['cost']:.4f}")
+            print(f"- Total cost including hedges: ${self.grand_total.cost + hedging['cost']:.4f}")
 
     def get_stage_metrics(self, stage: str) -> Optional[Dict[str, Any]]:
         """Get total metrics for a specific stage."""
@@ -179,7 +449,7 @@ class TokenTracker:
             'char_count': stage_total.char_count
         }
         
-        if should_show_stage_inputs() and stage in self.stage_inputs:
+        if self.show_stage_inputs and stage in self.stage_inputs:
             metrics['stage_input'] = self.stage_inputs[stage]
             
         return metrics
@@ -224,7 +494,9 @@ class TokenTracker:
                 'input_tokens': self.grand_total.input_tokens,
                 'output_tokens': self.grand_total.output_tokens,
                 'cost': round(self.grand_total.cost, 4),
-                'char_count': self.grand_total.char_count
+                'char_count': self.grand_total.char_count,
+                'cache_read_tokens': self.grand_total.cache_read_tokens,
+                'cache_write_tokens': self.grand_total.cache_write_tokens
             }
         }
 
@@ -235,12 +507,14 @@ class TokenTracker:
                     'input_tokens': self.stage_totals[stage].input_tokens,
                     'output_tokens': self.stage_totals[stage].output_tokens,
                     'cost': round(self.stage_totals[stage].cost, 4),
-                    'char_count': self.stage_totals[stage].char_count
+                    'char_count': self.stage_totals[stage].char_count,
+                    'cache_read_tokens': self.stage_totals[stage].cache_read_tokens,
+                    'cache_write_tokens': self.stage_totals[stage].cache_write_tokens
                 }
             }
             
             # Add stage input if enabled
-            if should_show_stage_inputs() and stage in self.stage_inputs:
+            if self.show_stage_inputs and stage in self.stage_inputs:
                 stage_data['stage_input'] = self.stage_inputs[stage]
             
             for model, usage in models.items():
@@ -251,15 +525,35 @@ class TokenTracker:
                 }
                 if 'char_count' in usage:
                     model_data['char_count'] = usage['char_count']
+                if 'cache_read_tokens' in usage:
+                    model_data['cache_read_tokens'] = usage['cache_read_tokens']
+                    model_data['cache_write_tokens'] = usage['cache_write_tokens']
+                if 'ttft' in usage:
+                    model_data['ttft'] = round(usage['ttft'], 3)
+                    model_data['itl'] = round(usage['itl'], 4)
                 stage_data['models'][model] = model_data
             
             summary['stages'][stage] = stage_data
+            
+        hedging = self.get_hedge_summary()
+        if hedging:
+            summary['hedging'] = {
+                **hedging,
+                'cost': round(hedging['cost'], 4),
+                'stages': {
+                    stage: {
+                        model: {**usage, 'cost': round(usage['cost'], 4)}
+                        for model, usage in models.items()
+                    }
+                    for stage, models in self.hedge_usage.items()
+                }
+            }
 
         return summary
 
     def save_to_file(self, output_path: str):
         """Save token usage summary to a markdown file."""
-        if not self.tracking_enabled or not should_save_usage_report():
+        if not self.tracking_enabled or not self.save_report:
             return
             
         summary = self.get_summary_dict()
@@ -278,10 +572,28 @@ class TokenTracker:
                     f.write(f"  - Original: {info['original_provider']} {info['original_model']}\n")
                     f.write(f"  - Fallback: {info['fallback_provider']} {info['fallback_model']}\n")
                     f.write(f"  - Reason: {info['error']}\n\n")
+                    
+            # Write hedged request costs, which the totals below leave out
+            if 'hedging' in summary:
+                hedging = summary['hedging']
+                f.write("## Hedged Requests\n\n")
+                f.write("Slow calls were sent twice and the first response used. The tokens of the ")
+                f.write("discarded requests (estimated for cancelled ones) are not included in the totals below.\n\n")
+                f.write(f"- Hedged Calls: {hedging['hedges']}\n")
+                f.write(f"- Won by the Hedge: {hedging['won']}\n\n")
+                for stage, models in sorted(hedging['stages'].items()):
+                    for model, usage in models.items():
+                        f.write(f"- {model}: {usage['hedges']} hedged, ")
+                        f.write(f"{usage['input_tokens']:,} input / {usage['output_tokens']:,} output tokens, ${usage['cost']:.4f}\n")
+                f.write(f"\n- Hedge Cost: ${hedging['cost']:.4f}\n")
+                f.write(f"- Total Cost Including Hedges: ${summary['grand_total']['cost'] + hedging['cost']:.4f}\n\n")
             
             # Grand Totals
             f.write("## Grand Totals\n\n")
             f.write(f"- Total Input Tokens: {summary['grand_total']['input_tokens']:,}\n")
+            if summary['grand_total']['cache_read_tokens'] or summary['grand_total']['cache_write_tokens']:
+                f.write(f"- Prompt Cache Read Tokens: {summary['grand_total']['cache_read_tokens']:,}\n")
+                f.write(f"- Prompt Cache Write Tokens: {summary['grand_total']['cache_write_tokens']:,}\n")
             f.write(f"- Total Output Tokens: {summary['grand_total']['output_tokens']:,}\n")
             f.write(f"- Total Cost: ${summary['grand_total']['cost']:.4f}\n")
             if summary['grand_total']['char_count'] > 0:
@@ -295,7 +607,7 @@ class TokenTracker:
                 
                 # Handle stage input display
                 f.write("#### Stage Input\n")
-                if should_show_stage_inputs() and 'stage_input' in data:
+                if self.show_stage_inputs and 'stage_input' in data:
                     f.write(f"{data['stage_input']}\n\n")
                 else:
                     f.write("INPUTS HIDDEN FROM USER. TO VIEW, CHANGE STAGE INPUT SETTINGS IN .ENV FILE\n\n")
@@ -303,6 +615,8 @@ class TokenTracker:
                 # Stage totals
                 f.write("#### Stage Totals\n")
                 f.write(f"- Input Tokens: {data['total']['input_tokens']:,}\n")
+                if data['total']['cache_read_tokens'] or data['total']['cache_write_tokens']:
+                    f.write(f"- Prompt Cache Read/Write Tokens: {data['total']['cache_read_tokens']:,} / {data['total']['cache_write_tokens']:,}\n")
                 f.write(f"- Output Tokens: {data['total']['output_tokens']:,}\n")
                 f.write(f"- Cost: ${data['total']['cost']:.4f}\n")
                 if data['total']['char_count'] > 0:
@@ -314,10 +628,15 @@ class TokenTracker:
                 for model, usage in data['models'].items():
                     f.write(f"**{model}**\n")
                     f.write(f"- Input Tokens: {usage['input_tokens']:,}\n")
+                    if 'cache_read_tokens' in usage:
+                        f.write(f"- Prompt Cache Read/Write Tokens: {usage['cache_read_tokens']:,} / {usage['cache_write_tokens']:,}\n")
                     f.write(f"- Output Tokens: {usage['output_tokens']:,}\n")
                     f.write(f"- Cost: ${usage['cost']:.4f}\n")
                     if 'char_count' in usage:
                         f.write(f"- Chinese Characters: {usage['char_count']:,}\n")
+                    if 'ttft' in usage:
+                        f.write(f"- Time to First Token: {usage['ttft']:.2f}s\n")
+                        f.write(f"- Inter-token Latency: {usage['itl'] * 1000:.1f}ms\n")
                     f.write("\n")
 
     def get_detailed_cost_breakdown(self) -> dict:
@@ -354,3 +673,43 @@ class TokenTracker:
             breakdown['stages'][stage] = stage_breakdown
 
         return breakdown
+
+class UsageRecorder:
+    """
+    Token tracker stand-in that forwards usage and keeps a record of it.
+
+    A model task's records are checkpointed with its output, so a resumed run
+    can replay the usage of the tasks it does not repeat into its tracker.
+    """
+
+    def __init__(self, tracker: TokenTracker):
+        """
+        Initialize the recorder.
+
+        Args:
+            tracker: Tracker the usage is forwarded to
+        """
+        self.tracker = tracker
+        self.records: List[Dict[str, Any]] = []
+
+    def add_usage(self, **usage: Any):
+        """Record and forward a TokenTracker.add_usage call."""
+        self.records.append({'method': 'add_usage', 'args': usage})
+        self.tracker.add_usage(**usage)
+
+    def add_hedge_cost(self, **usage: Any):
+        """Record and forward a TokenTracker.add_hedge_cost call."""
+        self.records.append({'method': 'add_hedge_cost', 'args': usage})
+        self.tracker.add_hedge_cost(**usage)
+
+def replay_usage(tracker: TokenTracker, records: List[Dict[str, Any]]):
+    """
+    Add usage recorded by a UsageRecorder to a tracker.
+
+    Args:
+        tracker: Tracker to add the usage to
+        records: UsageRecorder.records of one or more tasks
+    """
+    for record in records:
+        if record['method'] in ('add_usage', 'add_hedge_cost'):
+            getattr(tracker, record['method'])(**record['args'])
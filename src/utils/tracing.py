@@ -0,0 +1,203 @@
+"""
+Latency spans for pipeline runs.
+
+A Tracer records timed spans (client set-up, provider requests, report
+writing, token counting) tagged with the stage, model, provider and image
+they belong to. A run's spans are exported as Chrome trace-event JSON, which
+chrome://tracing and https://ui.perfetto.dev display as a timeline with one
+row per model, and are summarised per stage for the run's summary report.
+"""
+import json
+import time
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+@dataclass
+class Span:
+    """A timed operation (or an instant event, if end is None)."""
+    name: str
+    start: float
+    end: Optional[float]
+    lane: str
+    tags: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def duration(self) -> float:
+        """Length of the span in seconds (0 for instant events)."""
+        return (self.end - self.start) if self.end is not None else 0.0
+
+def _default_lane(tags: Dict[str, Any]) -> str:
+    """Get the timeline row of a span: its model, its stage, or else its thread."""
+    if 'stage' in tags and 'model' in tags:
+        return f"Stage {tags['stage']} Model {tags['model']}"
+    if 'stage' in tags:
+        return f"Stage {tags['stage']}"
+    return threading.current_thread().name
+
+class Tracer:
+    """
+    Thread-safe recorder of latency spans.
+
+    Times are time.perf_counter() values, so spans recorded by models,
+    streams and the manager share one clock.
+    """
+
+    def __init__(self, **tags: Any):
+        """
+        Initialize the tracer.
+
+        Args:
+            **tags: Tags added to every span (e.g. image='page1.jpg')
+        """
+        self.tags = {k: v for k, v in tags.items() if v is not None}
+        self.origin = time.perf_counter()
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, end: Optional[float], lane: Optional[str] = None, **tags: Any) -> Span:
+        """
+        Record a span whose times were measured by the caller.
+
+        Args:
+            name: Span name (e.g. 'request')
+            start: Start time (time.perf_counter())
+            end: End time, or None for an instant event
+            lane: Timeline row; defaults to the span's model, stage or thread
+            **tags: Tags describing the span
+
+        Returns:
+            The recorded span
+        """
+        tags = {**self.tags, **{k: v for k, v in tags.items() if v is not None}}
+        span = Span(name, start, end, lane or _default_lane(tags), tags)
+        with self._lock:
+            self._spans.append(span)
+        return span
+
+    @contextmanager
+    def span(self, name: str, lane: Optional[str] = None, **tags: Any) -> Iterator[Dict[str, Any]]:
+        """
+        Time a block of code as a span.
+
+        Yields a dict of tags that the block can add to (e.g. token counts);
+        a span whose block raises is tagged with the error.
+
+        Args:
+            name: Span name
+            lane: Timeline row; defaults to the span's model, stage or thread
+            **tags: Tags describing the span
+        """
+        span_tags = dict(tags)
+        start = time.perf_counter()
+        try:
+            yield span_tags
+        except BaseException as e:
+            span_tags['error'] = type(e).__name__
+            raise
+        finally:
+            self.add_span(name, start, time.perf_counter(), lane, **span_tags)
+
+    def instant(self, name: str, at: Optional[float] = None, lane: Optional[str] = None, **tags: Any) -> Span:
+        """Record an instant event (e.g. a stream's first token) at a perf_counter time, default now."""
+        return self.add_span(name, time.perf_counter() if at is None else at, None, lane, **tags)
+
+    def spans(self, name: Optional[str] = None, **tags: Any) -> List[Span]:
+        """
+        Get the recorded spans, optionally filtered.
+
+        Args:
+            name: Only spans with this name
+            **tags: Only spans with these tag values
+
+        Returns:
+            Matching spans in start order
+        """
+        with self._lock:
+            spans = list(self._spans)
+        return sorted(
+            (
+                span for span in spans
+                if (name is None or span.name == name)
+                and all(span.tags.get(k) == v for k, v in tags.items())
+            ),
+            key=lambda span: span.start
+        )
+
+    def stage_elapsed(self, stage: int) -> float:
+        """Get the seconds since the first span of a stage started (0 if it has none)."""
+        spans = self.spans(stage=stage)
+        if not spans:
+            return 0.0
+        return time.perf_counter() - spans[0].start
+
+    def stage_latency(self) -> Dict[int, Dict[str, Any]]:
+        """
+        Summarise each stage's latency.
+
+        Returns:
+            Dict of stage number to a dict of:
+            - wall: Seconds from the stage's first span to its last
+            - calls: Number of provider requests
+            - slowest_call: Longest provider request in seconds
+            - mean_ttft: Mean time to first token of streamed requests, or None
+            - report: Seconds spent writing the stage report (incl. token counting)
+        """
+        by_stage: Dict[int, List[Span]] = {}
+        for span in self.spans():
+            if 'stage' in span.tags:
+                by_stage.setdefault(span.tags['stage'], []).append(span)
+
+        latency = {}
+        for stage, spans in sorted(by_stage.items()):
+            requests = [span for span in spans if span.name == 'request']
+            ttfts = [span.tags['ttft'] for span in requests if 'ttft' in span.tags]
+            latency[stage] = {
+                'wall': max(span.end or span.start for span in spans) - min(span.start for span in spans),
+                'calls': len(requests),
+                'slowest_call': max((span.duration for span in requests), default=0.0),
+                'mean_ttft': sum(ttfts) / len(ttfts) if ttfts else None,
+                'report': sum(span.duration for span in spans if span.name == 'report')
+            }
+        return latency
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """
+        Convert the spans to Chrome trace-event format.
+
+        Returns:
+            Dict with 'traceEvents' (complete 'X' events for spans, 'i' events
+            for instants, 'M' events naming each row)
+        """
+        lanes: Dict[str, int] = {}
+        events = []
+        for span in self.spans():
+            tid = lanes.setdefault(span.lane, len(lanes) + 1)
+            event = {
+                'name': span.name,
+                'cat': span.tags.get('provider', 'pipeline'),
+                'pid': 1,
+                'tid': tid,
+                'ts': round((span.start - self.origin) * 1e6, 1),
+                'args': span.tags
+            }
+            if span.end is None:
+                event.update(ph='i', s='t')
+            else:
+                event.update(ph='X', dur=round(span.duration * 1e6, 1))
+            events.append(event)
+
+        process_name = f"Pipeline {self.tags['image']}" if 'image' in self.tags else "Pipeline"
+        metadata = [{'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': process_name}}]
+        # Rows sort by name, so each stage's row sits above those of its models
+        for sort_index, lane in enumerate(sorted(lanes)):
+            tid = lanes[lane]
+            metadata.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': lane}})
+            metadata.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'sort_index': sort_index}})
+        return {'traceEvents': metadata + events, 'displayTimeUnit': 'ms'}
+
+    def export_chrome_trace(self, path: str):
+        """Write the spans to a Chrome trace-event JSON file."""
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_chrome_trace(), f, ensure_ascii=False, default=str)